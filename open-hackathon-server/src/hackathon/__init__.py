@@ -144,10 +144,11 @@ def init_components():
     """Init hackathon factory"""
     from hackathon.user import UserManager, UserProfileManager
     from hackathon.hack import HackathonManager, AdminManager, TeamManager, DockerHostManager, \
-        AzureCertManager, RegisterManager, HackathonTemplateManager, Cryptor
-    from hackathon.template import TemplateLibrary
+        AzureCertManager, RegisterManager, HackathonTemplateManager, Cryptor, DockerHostAutoscaler, ImageManager
+    from hackathon.template import TemplateLibrary, TemplateFileCache
     from hackathon.remote.guacamole import GuacamoleInfo
     from hackathon.cache.cache_mgr import CacheManagerExt
+    from hackathon.hazure import AzureAdapterRegistry
 
     # dependencies MUST be provided in advance
     factory.provide("util", Utility)
@@ -171,12 +172,16 @@ def init_components():
     factory.provide("hackathon_manager", HackathonManager)
     factory.provide("register_manager", RegisterManager)
     factory.provide("azure_cert_manager", AzureCertManager)
+    factory.provide("azure_adapter_registry", AzureAdapterRegistry)
     factory.provide("cryptor", Cryptor)
     factory.provide("docker_host_manager", DockerHostManager)
+    factory.provide("docker_host_autoscaler", DockerHostAutoscaler)
     factory.provide("hackathon_template_manager", HackathonTemplateManager)
     factory.provide("template_library", TemplateLibrary)
+    factory.provide("template_file_cache", TemplateFileCache)
     factory.provide("admin_manager", AdminManager)
     factory.provide("team_manager", TeamManager)
+    factory.provide("image_manager", ImageManager)
     factory.provide("guacamole", GuacamoleInfo)
 
     # experiment starter
@@ -192,6 +197,14 @@ def init_components():
     # docker
     factory.provide("hosted_docker_proxy", get_class("hackathon.docker.hosted_docker.HostedDockerFormation"))
     factory.provide("alauda_docker_proxy", get_class("hackathon.docker.alauda_docker.AlaudaDockerFormation"))
+    # a single instance since watcher threads and container states must be shared by all callers and schedule jobs
+    factory.provide("docker_event_monitor", get_class("hackathon.docker.docker_events.DockerEventMonitor")())
+
+    # azure
+    # a single instance since outstanding waits are polled by one loop
+    factory.provide("azure_async_op_poller", get_class("hackathon.hazure.async_op_poller.AzureAsyncOpPoller")())
+    # a single instance since endpoint requests of concurrent starts are batched together
+    factory.provide("azure_endpoint_batcher", get_class("hackathon.hazure.endpoint_batcher.AzureEndpointBatcher")())
 
     # storage
     init_hackathon_storage()
@@ -203,8 +216,10 @@ def init_db():
 
 
 def init_expr_components():
-    from expr import ExprManager, AzureVMExprStarter, AzureHostedDockerStarter, AlaudaDockerStarter
+    from expr import ExprManager, AzureVMExprStarter, AzureHostedDockerStarter, AlaudaDockerStarter, \
+        ExprAdmissionQueue
     factory.provide("expr_manager", ExprManager)
+    factory.provide("expr_admission_queue", ExprAdmissionQueue)
     factory.provide("alauda_docker", AlaudaDockerStarter)
     factory.provide("azure_docker", AzureHostedDockerStarter)
     factory.provide("azure_vm", AzureVMExprStarter)
@@ -256,16 +271,22 @@ def init_hackathon_storage():
 
     The type of storage is configured by ""storage.type"" in config.py which is 'local' by default
     """
-    from hackathon.storage import AzureStorage, LocalStorage
+    from hackathon.storage import AzureStorage, LocalStorage, DedupStorage
+
+    # files of the same content share one physical file if "storage.dedup.enabled" is True
+    storage_name = "storage_backend" if safe_get_config("storage.dedup.enabled", False) else "storage"
 
     storage_type = safe_get_config("storage.type", "azure")
     if storage_type == "azure":
         # init BlobServiceAdapter first since AzureStorage depends on it. And accountKey must be included in config file
         from hackathon.hazure import BlobServiceAdapter
         factory.provide("azure_blob_service", BlobServiceAdapter)
-        factory.provide("storage", AzureStorage)
+        factory.provide(storage_name, AzureStorage)
     else:
-        factory.provide("storage", LocalStorage)
+        factory.provide(storage_name, LocalStorage)
+
+    if storage_name != "storage":
+        factory.provide("storage", DedupStorage)
 
 
 def init_schedule_jobs():
@@ -298,9 +319,38 @@ def __init_schedule_jobs():
                           next_run_time=next_run_time,
                           minutes=10)
 
+        # fail experiments whose in-memory polls are lost, see HackathonScheduler
+        sche.add_interval(feature="expr_manager",
+                          method="reconcile_starting_exprs",
+                          id="reconcile_starting_exprs",
+                          next_run_time=next_run_time,
+                          minutes=5)
+
         # schedule job to pre-allocate environment
         hackathon_manager.schedule_pre_allocate_expr_job()
 
+        # load templates of online hackathons into local cache so that experiments can start when storage is down
+        sche.add_once(feature="template_library",
+                      method="prewarm_templates",
+                      seconds=5)
+
+        # decrypt pem files of online hackathons so that azure operations never wait for it
+        sche.add_once(feature="azure_cert_manager",
+                      method="warm_up_pem_cache",
+                      seconds=5)
+
+        # subscribe docker events of host servers and apply container status changes to experiments
+        if safe_get_config("docker.events.enabled", True):
+            sche.add_interval(feature="docker_event_monitor",
+                              method="ensure_watchers",
+                              id="docker_event_monitor_ensure_watchers",
+                              next_run_time=next_run_time,
+                              minutes=1)
+            sche.add_interval(feature="docker_event_monitor",
+                              method="apply_pending_updates",
+                              id="docker_event_monitor_apply_pending_updates",
+                              seconds=safe_get_config("docker.events.apply_interval_seconds", 5))
+
         # schedule job to pull docker images automatically
         #if not safe_get_config("docker.alauda.enabled", False):
         #     docker = RequiredFeature("hosted_docker_proxy")
@@ -308,6 +358,13 @@ def __init_schedule_jobs():
 
         # schedule job to pre-create a docker host server VM
         #host_server_manager.schedule_pre_allocate_host_server_job()
+
+        # schedule job to provision or decommission docker host server VMs ahead of demand
+        RequiredFeature("docker_host_autoscaler").schedule_autoscale_job()
+
+    # schedule job to admit queued experiment starts
+    RequiredFeature("expr_admission_queue").schedule_dispatch_job()
+
     # init the overtime-sessions detection to update users' online status
     sche.add_interval(feature="user_manager",
                       method="check_user_online_status",
@@ -24,17 +24,217 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 THE SOFTWARE.
 """
 
+import time
+import cPickle
+from threading import Lock, Event, Thread
+from collections import OrderedDict
 from beaker.cache import CacheManager
 from beaker.util import parse_cache_config_options
 
 from hackathon import Component
+from hackathon.constants import HEALTH_STATUS
+from invalidation_bus import CacheInvalidationBus
 
 
-__all__ = ["CacheManagerExt"]
+__all__ = ["CacheManagerExt", "LRUCache", "SingleFlight", "CacheStats"]
+
+# returned by LRUCache if key not found or expired. None is a valid value to be cached
+MISSING = object()
+
+
+class LRUCache(object):
+    """A dict bounded by size which drops the least recently used entry. Entries expire individually"""
+
+    def __init__(self, max_entries, on_evict=None):
+        """
+        :type on_evict: function
+        :param on_evict: called with the key when an entry is dropped for size
+        """
+        self.max_entries = max_entries
+        self.on_evict = on_evict
+        self.entries = OrderedDict()
+        self.lock = Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is None or entry[1] < time.time():
+                return MISSING
+            # move to the end as most recently used
+            self.entries[key] = entry
+            return entry[0]
+
+    def put(self, key, value, ttl):
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = (value, time.time() + ttl)
+            while len(self.entries) > self.max_entries:
+                evicted = self.entries.popitem(last=False)[0]
+                if self.on_evict:
+                    self.on_evict(evicted)
+
+    def remove(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def remove_prefix(self, prefix):
+        with self.lock:
+            for key in [k for k in self.entries if k.startswith(prefix)]:
+                del self.entries[key]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def keys(self):
+        with self.lock:
+            return self.entries.keys()
+
+
+class SingleFlight(object):
+    """Run a function only once at a time for the same key, concurrent callers wait for and share its result"""
+
+    class Flight(object):
+        def __init__(self):
+            self.done = Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self):
+        self.flights = {}
+        self.lock = Lock()
+
+    def do(self, key, func, timeout=None):
+        """Call 'func' or wait for the running call of the same key
+
+        :type timeout: int
+        :param timeout: seconds to wait for the running call. 'func' is called again if timed out
+
+        :return: the return value of 'func'. Exception raised by 'func' is raised to all callers
+        """
+        with self.lock:
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.flights[key] = SingleFlight.Flight()
+
+        if not leader:
+            if flight.done.wait(timeout):
+                if flight.error:
+                    raise flight.error
+                return flight.result
+            return func()
+
+        try:
+            flight.result = func()
+            return flight.result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self.lock:
+                self.flights.pop(key, None)
+            flight.done.set()
+
+    def do_async(self, key, func):
+        """Call 'func' in a background thread unless a call of the same key is running"""
+        with self.lock:
+            if key in self.flights:
+                return
+
+        def run():
+            try:
+                self.do(key, func)
+            except Exception:
+                pass
+
+        thread = Thread(target=run, name="cache-refresh")
+        thread.daemon = True
+        thread.start()
+
+
+class CacheStats(object):
+    """Counters of cache usage per namespace in the current process"""
+
+    COUNTERS = [
+        "l1_hits",  # found in L1
+        "l2_hits",  # found in L2 and not expired
+        "stale_hits",  # expired in L2 but served while reloading
+        "coalesced",  # waited for the load of another caller
+        "misses",  # createfunc called by the caller
+        "loads",  # createfunc calls including background reloads
+        "load_errors",  # createfunc raised
+        "l2_errors",  # L2 unavailable
+        "evictions",  # dropped from L1 for size
+        "invalidations"]
+
+    def __init__(self, prefixes):
+        self.lock = Lock()
+        self.since = time.time()
+        self.last_l2_error = 0
+        self.counters = {}
+        for prefix in prefixes:
+            self.counters[prefix] = dict.fromkeys(self.COUNTERS, 0)
+            self.counters[prefix].update(load_seconds=0.0, max_load_seconds=0.0)
+
+    def incr(self, prefix, counter):
+        with self.lock:
+            self.counters[prefix][counter] += 1
+            if counter == "l2_errors":
+                self.last_l2_error = time.time()
+
+    def record_load(self, prefix, seconds):
+        with self.lock:
+            counters = self.counters[prefix]
+            counters["loads"] += 1
+            counters["load_seconds"] += seconds
+            counters["max_load_seconds"] = max(counters["max_load_seconds"], seconds)
+
+    def snapshot(self):
+        """Copy of counters with hit ratio and average load time in milliseconds
+
+        :rtype: dict
+        :return: counters by namespace prefix
+        """
+        with self.lock:
+            counters = dict((prefix, dict(c)) for prefix, c in self.counters.iteritems())
+
+        for c in counters.values():
+            hits = c["l1_hits"] + c["l2_hits"] + c["stale_hits"] + c["coalesced"]
+            total = hits + c["misses"]
+            c["hit_ratio"] = round(float(hits) / total, 4) if total else None
+            c["avg_load_ms"] = round(c["load_seconds"] * 1000 / c["loads"], 2) if c["loads"] else None
+            c["max_load_ms"] = round(c.pop("max_load_seconds") * 1000, 2)
+            c.pop("load_seconds")
+        return counters
 
 
 class CacheManagerExt(Component):
-    """To cache resource"""
+    """To cache resource
+
+    Two levels: an in-process LRU cache(L1) over a beaker cache(L2) shared by all workers which is file by default and
+    can be memcached by 'cache.l2'. Keys are grouped into namespaces by prefix, see 'cache.namespaces' in config. Every
+    namespace has its own TTL of L2 and L1 and a shorter TTL for None results(negative caching). Values of a namespace
+    with 'copy' enabled are pickled in L1 so that every caller gets its own copy.
+
+    Misses of the same key in a process are loaded once while other callers wait(single flight). A namespace with
+    'stale_while_revalidate' seconds keeps serving the expired value for that long while a background thread reloads
+    it, so that expiry of a hot key never blocks requests nor causes a burst of loads.
+
+    L1 is shared by all instances in the process. 'invalidate', 'invalidate_namespace' and 'clear' are broadcast to all
+    the other processes through CacheInvalidationBus if 'cache.invalidation_bus.enabled', otherwise other processes see
+    the change after 'l1_ttl' at most.
+
+    Hits, misses, load time and evictions are counted per namespace in every process, see 'get_stats'.
+    """
+    l1 = None
+    l2 = None
+    bus = None
+    stats = None
+    namespaces = None
+    init_lock = Lock()
+    flights = SingleFlight()
+
     def get_cache(self, key, createfunc):
         """Get cached data of the returns of createfunc depending on the key.
         If key and createfunc exist in cache, returns the cached data,
@@ -54,8 +254,26 @@ class CacheManagerExt(Component):
             CacheManager.get_cache(key="abc", createfunc=func)
 
         """
-        results = self.tmpl_cache.get(key=key, createfunc=createfunc)
-        return results
+        if self.bus:
+            # start listening to invalidations in every worker process
+            self.bus.ensure_started()
+
+        namespace = self.__get_namespace(key)
+        value = self.l1.get(key)
+        if value is MISSING:
+            loaded = []
+
+            def load():
+                loaded.append(True)
+                return self.__load(namespace, key, createfunc)
+
+            value = self.flights.do(key, load, self.util.safe_get_config("cache.single_flight_timeout_seconds", 30))
+            if not loaded:
+                self.stats.incr(namespace["prefix"], "coalesced")
+        else:
+            self.stats.incr(namespace["prefix"], "l1_hits")
+
+        return cPickle.loads(value) if namespace["copy"] else value
 
     def invalidate(self, key):
         """remove the key-value pair in the cache
@@ -67,12 +285,26 @@ class CacheManagerExt(Component):
         :return: True if remove the key-value pair correctly, otherwise False
 
         """
-        try:
-            self.tmpl_cache.remove_value(key=key)
-            return True
-        except Exception as e:
-            self.log.error(e)
-            return False
+        removed = self.__remove_local(key, None)
+        if self.bus:
+            self.bus.publish(key=key)
+        return removed
+
+    def invalidate_namespace(self, prefix):
+        """remove all the keys start with prefix in the cache
+
+        L2 is removed by namespace, so keys in the namespace containing prefix are removed too
+
+        :type prefix: str|unicode
+        :param prefix: prefix of keys, e.g. "hackathon_stat_"
+
+        :rtype: bool
+        :return: True if remove the keys correctly, otherwise False
+        """
+        removed = self.__remove_local(None, prefix)
+        if self.bus:
+            self.bus.publish(prefix=prefix)
+        return removed
 
     def clear(self):
         """clear all the cache
@@ -80,27 +312,192 @@ class CacheManagerExt(Component):
         :rtype: bool
         :return: True if clear the cache correctly, otherwise False
         """
+        return self.invalidate_namespace("")
+
+    def get_stats(self):
+        """Statistics of the cache in the current process since it starts
+
+        :rtype: dict
+        :return: counters and TTLs of every namespace, e.g.
+            {
+                "since": "2016-01-01 00:00:00",
+                "l1_entries": 10,
+                "l1_max_entries": 1000,
+                "namespaces": {
+                    "hackathon_stat_": {"l1_hits": 100, "misses": 2, "hit_ratio": 0.98, "avg_load_ms": 12.5, ...}
+                }
+            }
+        """
+        counters = self.stats.snapshot()
+        keys = self.l1.keys()
+        namespaces = {}
+        for namespace in self.namespaces:
+            prefix = namespace["prefix"]
+            stat = counters[prefix]
+            stat.update(ttl=namespace["ttl"],
+                        l1_ttl=namespace["l1_ttl"],
+                        stale_while_revalidate=namespace["stale_while_revalidate"],
+                        l1_entries=len([k for k in keys if self.__get_namespace(k) is namespace]))
+            namespaces[prefix or "default"] = stat
+
+        return {
+            "since": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.stats.since)),
+            "l1_entries": len(keys),
+            "l1_max_entries": self.l1.max_entries,
+            "namespaces": namespaces
+        }
+
+    def report_health(self):
+        """Report cache statistics, WARNING if L2 failed in the last minute"""
+        health = self.get_stats()
+        if time.time() - self.stats.last_l2_error < 60:
+            health["status"] = HEALTH_STATUS.WARNING
+            health["description"] = "L2 cache unavailable"
+        else:
+            health["status"] = HEALTH_STATUS.OK
+        return health
+
+    def __init__(self):
+        """initialize the shared caches once
+        More configuration refer to http://beaker.readthedocs.org/en/latest/caching.html#about
+        """
+        if CacheManagerExt.l1 is not None:
+            return
+
+        with CacheManagerExt.init_lock:
+            if CacheManagerExt.l1 is not None:
+                return
+
+            # store the basic configuration
+            cache_opts = {
+                'cache.type': self.util.safe_get_config("cache.l2.type", "file"),
+                # can be "file", "ext:memcached" or other types supported by beaker
+                'cache.data_dir': self.util.safe_get_config("cache.l2.data_dir", "/tmp/cache/data"),
+                'cache.lock_dir': self.util.safe_get_config("cache.l2.lock_dir", "/tmp/cache/lock")
+            }
+            url = self.util.safe_get_config("cache.l2.url", "")
+            if url:
+                cache_opts['cache.url'] = url
+            # create CacheManager instance with cache_opts
+            CacheManagerExt.l2 = CacheManager(**parse_cache_config_options(cache_opts))
+            CacheManagerExt.namespaces = self.__load_namespaces()
+            CacheManagerExt.stats = CacheStats([n["prefix"] for n in self.namespaces])
+            CacheManagerExt.l1 = LRUCache(self.util.safe_get_config("cache.l1_max_entries", 1000),
+                                          lambda k: self.stats.incr(self.__get_namespace(k)["prefix"], "evictions"))
+            if self.util.safe_get_config("cache.invalidation_bus.enabled", False):
+                CacheManagerExt.bus = CacheInvalidationBus(self.__remove_local)
+
+    def __load_namespaces(self):
+        """Namespaces from config, the longest prefix first and the default namespace(prefix "") at last"""
+        default = {"ttl": 3600, "l1_ttl": 60, "negative_ttl": 30, "stale_while_revalidate": 0, "copy": False}
+        default.update(self.util.safe_get_config("cache.default", {}))
+        namespaces = [dict(default, prefix="")]
+        for prefix, options in self.util.safe_get_config("cache.namespaces", {}).iteritems():
+            namespace = dict(default, prefix=prefix)
+            namespace.update(options)
+            namespaces.append(namespace)
+        namespaces.sort(key=lambda n: len(n["prefix"]), reverse=True)
+        return namespaces
+
+    def __remove_local(self, key, prefix):
+        """Remove a key or keys with prefix from L1 of this process and L2. Also applies invalidations from the bus"""
         try:
-            self.tmpl_cache.clear()
+            if key is not None:
+                self.stats.incr(self.__get_namespace(key)["prefix"], "invalidations")
+                self.l1.remove(key)
+                self.__get_l2_cache(self.__get_namespace(key)).remove_value(key=key)
+            elif prefix is not None:
+                self.l1.remove_prefix(prefix)
+                # namespaces under prefix and the one containing prefix
+                for namespace in self.namespaces:
+                    if namespace["prefix"].startswith(prefix) or namespace is self.__get_namespace(prefix):
+                        self.stats.incr(namespace["prefix"], "invalidations")
+                        self.__get_l2_cache(namespace).clear()
             return True
         except Exception as e:
             self.log.error(e)
             return False
 
-    def __init__(self):
-        """initialize the class CacheManager
-        More configuration refer to http://beaker.readthedocs.org/en/latest/caching.html#about
+    def __get_namespace(self, key):
+        for namespace in self.namespaces:
+            if key.startswith(namespace["prefix"]):
+                return namespace
+
+    def __get_l2_cache(self, namespace):
+        # beaker keeps the Cache of the same name, so it's created only once
+        name = "cache_%s" % (namespace["prefix"].strip("_") or "default")
+        # stale values are kept in L2 for 'stale_while_revalidate' seconds after expiry
+        return self.l2.get_cache(name, expire=namespace["ttl"] + namespace["stale_while_revalidate"])
+
+    def __load(self, namespace, key, createfunc):
+        """Load value from L2 into L1
+
+        :return: the value as saved in L1, pickled if namespace 'copy' enabled
         """
-        # store the basic configuration
-        self.cache_opts = {
-            'cache.type': 'memory',
-            # can be "memory" or "file"
-            'cache.data_dir': '/tmp/cache/data',
-            'cache.lock_dir': '/tmp/cache/lock'
-        }
-        # create CacheManager instance with cache_opts
-        self.cache = CacheManager(**parse_cache_config_options(self.cache_opts))
-        # In addition to the defaults supplied to the CacheManager instance,
-        # any of the Cache options can be changed on a per-namespace basis,
-        # by setting a type, and expire option.
-        self.tmpl_cache = self.cache.get_cache('mytemplate', type='file', expire=3600)
+        value, ttl = self.__get_from_l2(namespace, key, createfunc)
+        if namespace["copy"]:
+            value = cPickle.dumps(value, cPickle.HIGHEST_PROTOCOL)
+        if ttl > 0:
+            self.l1.put(key, value, min(ttl, namespace["l1_ttl"]))
+        return value
+
+    def __refresh(self, namespace, key, createfunc):
+        """Reload an expired value into L2 and L1. Called in background"""
+        entry = self.__create_entry(namespace, createfunc)
+        try:
+            self.__get_l2_cache(namespace).put(key, entry)
+        except Exception:
+            self.stats.incr(namespace["prefix"], "l2_errors")
+            raise
+        self.log.debug("cache %s refreshed" % key)
+
+    def __create_entry(self, namespace, createfunc):
+        start = time.time()
+        try:
+            value = createfunc()
+        except Exception:
+            self.stats.incr(namespace["prefix"], "load_errors")
+            raise
+        self.stats.record_load(namespace["prefix"], time.time() - start)
+        ttl = namespace["ttl"] if value is not None else namespace["negative_ttl"]
+        return time.time() + ttl, value
+
+    def __get_from_l2(self, namespace, key, createfunc):
+        """Get value from L2 or create it. Values are saved in L2 with their expire time since None expires earlier
+
+        :rtype: tuple
+        :return: (value, seconds to live)
+        """
+
+        created = []
+
+        def create():
+            created.append(True)
+            return self.__create_entry(namespace, createfunc)
+
+        try:
+            l2_cache = self.__get_l2_cache(namespace)
+            expire_at, value = l2_cache.get(key=key, createfunc=create)
+            now = time.time()
+            if expire_at < now:
+                stale_until = expire_at + namespace["stale_while_revalidate"]
+                if value is not None and now < stale_until:
+                    # serve the stale value until reloaded. Not kept in L1 which would hide the reloaded value
+                    self.flights.do_async("refresh:" + key, lambda: self.__refresh(namespace, key, createfunc))
+                    self.stats.incr(namespace["prefix"], "stale_hits")
+                    return value, 0
+
+                l2_cache.remove_value(key=key)
+                expire_at, value = l2_cache.get(key=key, createfunc=create)
+            self.stats.incr(namespace["prefix"], "misses" if created else "l2_hits")
+            return value, max(0, expire_at - time.time())
+        except Exception as e:
+            if created:
+                raise
+
+            # L2 unavailable, e.g. memcached is down
+            self.stats.incr(namespace["prefix"], "l2_errors")
+            self.stats.incr(namespace["prefix"], "misses")
+            self.log.error("fail to read cache %s: %r" % (key, e))
+            expire_at, value = create()
+            return value, max(0, expire_at - time.time())
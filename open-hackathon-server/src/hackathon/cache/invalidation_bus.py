@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (c) Microsoft Open Technologies (Shanghai) Co. Ltd.  All rights reserved.
+
+The MIT License (MIT)
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import os
+import time
+import uuid
+import socket
+from threading import Thread, Lock
+from pymongo import CursorType
+
+from hackathon import Component
+from hackathon.hmongo.models import CacheInvalidation
+
+__all__ = ["CacheInvalidationBus"]
+
+
+class CacheInvalidationBus(Component):
+    """Broadcast cache invalidations to all processes on all nodes through a capped collection
+
+    Every process tails the collection in a daemon thread and applies invalidations published by others. The thread
+    starts on first use in a process rather than at import, so that every forked worker has its own.
+    """
+
+    def __init__(self, handler):
+        """
+        :type handler: function
+        :param handler: called as handler(key, prefix) for every invalidation from other processes
+        """
+        self.handler = handler
+        self.origin = None
+        self.pid = None
+        self.lock = Lock()
+
+    def ensure_started(self):
+        if self.pid == os.getpid():
+            return
+
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+            self.origin = "%s-%d-%s" % (socket.gethostname(), self.pid, uuid.uuid4().hex[0:8])
+            # skip invalidations published before. The position is taken before the caller populates any L1 entry
+            # so that no invalidation after that is missed
+            thread = Thread(target=self.__tail, args=(self.__get_latest_id(),), name="cache-invalidation-bus")
+            thread.daemon = True
+            thread.start()
+
+    def publish(self, key=None, prefix=None):
+        """Publish invalidation of a key or all keys with prefix to other processes
+
+        :type key: str|unicode
+        :param key: the key to be invalidated
+
+        :type prefix: str|unicode
+        :param prefix: keys starting with prefix are invalidated if key is None
+        """
+        self.ensure_started()
+        try:
+            CacheInvalidation(origin=self.origin, key=key, prefix=prefix, create_time=self.util.get_now()).save()
+        except Exception as e:
+            # other processes get the change after L1 expires
+            self.log.error("fail to publish cache invalidation of %s: %r" % (key or prefix, e))
+
+    def __get_latest_id(self):
+        try:
+            latest = list(CacheInvalidation._get_collection().find({}, {"_id": 1}).sort("$natural", -1).limit(1))
+            return latest[0]["_id"] if latest else None
+        except Exception as e:
+            # old invalidations are applied too, which only costs some L1 misses
+            self.log.error("cache invalidation bus: %r" % e)
+            return None
+
+    def __tail(self, last_id):
+        """Apply invalidations in natural(insertion) order of the capped collection
+
+        ObjectIds are generated from the clock of every node and are not monotonic across nodes, so a dead cursor
+        is not resumed by '_id > last_id'. Instead the collection is tailed again from the oldest document, skipping
+        up to the last seen one. If the last seen one has been overwritten in the capped collection, invalidations
+        might be lost, so everything is invalidated.
+
+        :param last_id: _id of the last seen document, None to apply all
+        """
+        while True:
+            try:
+                collection = CacheInvalidation._get_collection()
+                cursor = collection.find(cursor_type=CursorType.TAILABLE_AWAIT)
+                skipping = last_id is not None
+                newest = None
+                while cursor.alive:
+                    for doc in cursor:
+                        newest = doc["_id"]
+                        if skipping:
+                            skipping = doc["_id"] != last_id
+                            continue
+                        last_id = doc["_id"]
+                        if doc.get("origin") != self.origin:
+                            self.handler(doc.get("key"), doc.get("prefix"))
+
+                    if skipping and cursor.alive:
+                        # all the documents read but the last seen one is not there any more
+                        self.log.warn("cache invalidation bus lost its position, invalidate all")
+                        self.handler(None, "")
+                        skipping = False
+                        last_id = newest
+            except Exception as e:
+                self.log.error("cache invalidation bus: %r" % e)
+
+            # cursor on an empty capped collection dies at once
+            time.sleep(self.util.safe_get_config("cache.invalidation_bus.retry_seconds", 1))
@@ -51,6 +51,24 @@ Config = {
     },
     "azure": {
         "cert_base": "",
+        "pem_cache_dir": "",
+        "adapter_pool_size": 10,
+        "api_call_window_seconds": 3600,
+        "api_call_warning_threshold": 10000,
+        "async_poller": {
+            "enabled": True,
+            "tick_seconds": 1,
+            "initial_interval_seconds": 2,
+            "backoff_factor": 1.5,
+            "max_interval_seconds": 30,
+            "max_polls_per_subscription": 20,
+            "workers": 5
+        },
+        "endpoint_batch": {
+            "window_seconds": 1,
+            "previous_op_timeout_seconds": 60,
+            "wait_timeout_seconds": 180
+        }
     },
     "guacamole": {
         "host": "http://localhost:8080"
@@ -61,22 +79,156 @@ Config = {
         "job_store": "mongodb",
         "database": MONGODB_DB,
         "collection": "jobs",
+        "singleton_collection": "singleton_jobs",
         "host": MONGODB_HOST,
-        "port": MONGODB_PORT
+        "port": MONGODB_PORT,
+        "timer_wheel": {
+            "enabled": True,
+            "max_delay_seconds": 60,
+            "tick_seconds": 1,
+            "slots": 64,
+            "workers": 5,  # ignored if executors configured
+            "reconcile_starting_minutes": 30
+        },
+        "leader_election": {
+            "enabled": False,
+            "lease_seconds": 10,
+            "heartbeat_seconds": 2,
+            "poll_seconds": 10
+        },
+        # thread pools by name, jobs are routed to pool 'default' unless configured in routes
+        "executors": {
+            "default": {"workers": 10},
+            "provision": {"workers": 4},
+            "interactive": {"workers": 6}
+        },
+        # by 'feature.method' or 'feature'. Jobs of higher priority run first in the same pool
+        "routes": {
+            "azure_vm": {"executor": "provision"},
+            "hackathon_template_manager.pull_images_for_hackathon": {"executor": "provision"},
+            "hosted_docker_proxy.pull_image": {"executor": "provision"},
+            "azure_docker": {"executor": "interactive", "priority": 10},
+            "alauda_docker_proxy.query_service_status_async": {"executor": "interactive", "priority": 10},
+            "expr_admission_queue.start_admitted_expr": {"executor": "interactive", "priority": 5}
+        }
     },
     "storage": {
         "type": "local",
         "size_limit_kilo_bytes": 5 * 1024,
+        "dedup": {
+            "enabled": False
+        },
+        "local": {
+            "chunk_size": 64 * 1024,
+            "accel_redirect_location": ""
+        },
         "azure": {
             "account_name": "",
             "account_key": "",
             "image_container": "images",
             "template_container": "templates",
             "certificates_container": "certificates",
-            "blob_service_host_base": ".blob.core.chinacloudapi.cn"
+            "blob_service_host_base": ".blob.core.chinacloudapi.cn",
+            "upload_chunk_size": 4 * 1024 * 1024,
+            "upload_max_connections": 4,
+            "download_chunk_size": 4 * 1024 * 1024
+        }
+    },
+    "cache": {
+        "l1_max_entries": 1000,
+        "single_flight_timeout_seconds": 30,
+        "invalidation_bus": {
+            "enabled": True,
+            "retry_seconds": 1
+        },
+        "l2": {
+            "type": "file",
+            "data_dir": "/tmp/cache/data",
+            "lock_dir": "/tmp/cache/lock",
+            "url": ""
+        },
+        "default": {
+            "ttl": 3600,
+            "l1_ttl": 60,
+            "negative_ttl": 30
+        },
+        "namespaces": {
+            "__template__": {
+                "ttl": 3600,
+                "l1_ttl": 300,
+                "stale_while_revalidate": 300,
+                "copy": True
+            },
+            "hackathon_stat_": {
+                "ttl": 60,
+                "l1_ttl": 10,
+                "stale_while_revalidate": 60
+            },
+            "hackathon_config_": {
+                "ttl": 600,
+                "l1_ttl": 60
+            },
+            "admin_roles_": {
+                "ttl": 600,
+                "l1_ttl": 30
+            },
+            "hackathon_registry_": {
+                "ttl": 600,
+                "l1_ttl": 30,
+                "negative_ttl": 10,
+                "copy": True
+            }
+        }
+    },
+    "template": {
+        "cache": {
+            "dir": "",
+            "request_timeout_seconds": 10
+        }
+    },
+    "image": {
+        "derivative": {
+            "enabled": True,
+            "quality": 85,
+            "sizes": {
+                "thumbnail": [128, 128],
+                "card": [480, 270],
+                "banner": [1280, 400]
+            }
+        }
+    },
+    "dockerhostserver": {
+        "vm": {
+            "container_max_count": 50
+        },
+        "autoscale": {
+            "enabled": False,
+            "interval_minutes": 2,
+            "headroom_ratio": 0.2,
+            "headroom_slots": 5,
+            "participation_ratio": 0.8,
+            "lead_minutes": 60,
+            "max_hosts": 10,
+            "max_provisioning": 1,
+            "cooldown_minutes": 30,
+            "provision_timeout_minutes": 30
+        }
+    },
+    "expr": {
+        "admission": {
+            "enabled": True,
+            "max_starts": 20,
+            "max_starts_per_host": 5,
+            "max_starts_per_hackathon": 5,
+            "admit_timeout_minutes": 10,
+            "dispatch_interval_seconds": 5
         }
     },
     "docker": {
+        "events": {
+            "enabled": True,
+            "apply_interval_seconds": 5
+        },
         "alauda": {
             "token": "",
             "namespace": "",
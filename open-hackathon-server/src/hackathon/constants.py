@@ -161,6 +161,19 @@ class VEStatus:
     UNEXPECTED_ERROR = 5
 
 
+class ADMISSION_STATUS:
+    """Status of db model ExprAdmissionTicket
+
+    Attributes:
+        QUEUED: waiting in admission queue
+        ADMITTED: admitted and the experiment is being started
+        DONE: the experiment started, failed or timed out
+    """
+    QUEUED = 0
+    ADMITTED = 1
+    DONE = 2
+
+
 class VERemoteProvider:
     """Remote provider type in db model VirtualEnvironment that indicates how to connect to a remote VE"""
     Guacamole = 0
@@ -304,6 +317,21 @@ class FILE_TYPE:
     HACK_FILE = "hack_file"
 
 
+class IMAGE_VARIANT:
+    """Resized copies of uploaded images, the sizes are configured by 'image.derivative.sizes'"""
+    THUMBNAIL = "thumbnail"
+    CARD = "card"
+    BANNER = "banner"
+
+
+class IMAGE_TARGET:
+    """Image fields whose derivatives are generated after updated"""
+    USER_AVATAR = "user_avatar"
+    HACKATHON_BANNER = "hackathon_banner"
+    TEAM_LOGO = "team_logo"
+    TEAM_COVER = "team_cover"
+
+
 class TEAM_MEMBER_STATUS:
     """Status of member of team
 
@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+#
+# -----------------------------------------------------------------------------------
+# Copyright (c) Microsoft Open Technologies (Shanghai) Co. Ltd.  All rights reserved.
+#
+# The MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import sys
+
+sys.path.append("..")
+
+import json
+import requests
+from threading import Lock, Thread, Event
+
+from hackathon import Component
+from hackathon.hmongo.models import DockerHostServer, Experiment
+from hackathon.constants import VEStatus, EStatus, DockerHostServerStatus
+
+__all__ = ["DockerEventMonitor"]
+
+
+class HostEventWatcher(object):
+    """Subscriber of the '/events' stream of a single docker host
+
+    The watcher runs in a daemon thread and reconnects automatically. Events are resumed from the time of last received
+    event so that nothing is lost while reconnecting.
+    """
+
+    def __init__(self, monitor, host_id, url):
+        self.monitor = monitor
+        self.host_id = host_id
+        self.url = url
+        self.connected = False
+        self.since = None
+        self.stop_event = Event()
+        self.thread = Thread(target=self.run, name="docker-events-%s" % host_id)
+        self.thread.setDaemon(True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def is_alive(self):
+        return self.thread.is_alive()
+
+    def run(self):
+        while not self.stop_event.is_set():
+            try:
+                self.__consume()
+            except requests.exceptions.Timeout:
+                # docker stays silent when nothing happens on the host, just reconnect
+                pass
+            except Exception as e:
+                self.monitor.log.debug("events stream of docker host %s broken: %s" % (self.host_id, e))
+            finally:
+                self.connected = False
+            self.stop_event.wait(DockerEventMonitor.RECONNECT_INTERVAL_SECONDS)
+
+    def __consume(self):
+        params = {}
+        if self.since:
+            params["since"] = self.since
+        resp = requests.get(self.url, params=params, stream=True,
+                            timeout=(DockerEventMonitor.CONNECT_TIMEOUT_SECONDS,
+                                     DockerEventMonitor.READ_TIMEOUT_SECONDS))
+        try:
+            if resp.status_code != 200:
+                self.monitor.log.debug("docker host %s responds %d for events" % (self.host_id, resp.status_code))
+                return
+            self.connected = True
+            for line in resp.iter_lines(chunk_size=1):
+                if self.stop_event.is_set():
+                    return
+                if not line:
+                    continue
+                event = json.loads(line)
+                if event.get("time"):
+                    self.since = event["time"]
+                self.monitor.on_event(self.host_id, event)
+        finally:
+            resp.close()
+
+
+class DockerEventMonitor(Component):
+    """Keep container state current by subscribing docker remote api '/events' of every docker host server
+
+    Container start/die/destroy events are fed into an in-memory state table which can be consulted instead of querying
+    docker host through http. Status changes are collected and applied to Experiment.virtual_environments in batch by
+    schedule job 'apply_pending_updates'.
+    """
+    RUNNING_EVENTS = ["start", "restart", "unpause"]
+    STOPPED_EVENTS = ["die", "kill", "stop", "oom"]
+    REMOVED_EVENTS = ["destroy"]
+
+    CONNECT_TIMEOUT_SECONDS = 10
+    READ_TIMEOUT_SECONDS = 300
+    RECONNECT_INTERVAL_SECONDS = 5
+
+    def __init__(self):
+        self.__lock = Lock()
+        # container_id: {"host_id": str, "running": bool, "time": int}
+        self.__containers = {}
+        # container_id: bool, running status not yet applied to db
+        self.__pending = {}
+        # host_id: HostEventWatcher
+        self.__watchers = {}
+
+    def ensure_watchers(self):
+        """Make sure every docker host server is watched by exactly one watcher. Called by schedule job"""
+        hosts = DockerHostServer.objects(disabled=False, state=DockerHostServerStatus.DOCKER_READY)
+        host_ids = set()
+        for host in hosts:
+            host_id = str(host.id)
+            host_ids.add(host_id)
+            url = 'http://%s:%d/events' % (host.public_dns, host.public_docker_api_port)
+            watcher = self.__watchers.get(host_id)
+            if watcher and watcher.is_alive() and watcher.url == url:
+                continue
+            if watcher:
+                watcher.stop()
+            self.watch(host_id, url)
+
+        for host_id in self.__watchers.keys():
+            if host_id not in host_ids:
+                self.unwatch(host_id)
+
+    def watch(self, host_id, url):
+        """Start subscribing events of a docker host
+
+        :type host_id: str|unicode
+        :param host_id: id of DockerHostServer
+
+        :type url: str|unicode
+        :param url: the full url of '/events' api of the docker host
+        """
+        self.log.debug("start watching docker events of host %s: %s" % (host_id, url))
+        watcher = HostEventWatcher(self, host_id, url)
+        self.__watchers[host_id] = watcher
+        watcher.start()
+        return watcher
+
+    def unwatch(self, host_id):
+        """Stop subscribing events of a docker host and forget all its containers"""
+        watcher = self.__watchers.pop(host_id, None)
+        if watcher:
+            watcher.stop()
+        with self.__lock:
+            for container_id in [k for k, v in self.__containers.iteritems() if v["host_id"] == host_id]:
+                self.__containers.pop(container_id)
+
+    def is_watching(self, host_id):
+        """Whether the events stream of the docker host is connected now"""
+        watcher = self.__watchers.get(str(host_id))
+        return watcher is not None and watcher.connected
+
+    def on_event(self, host_id, event):
+        """Handle a single event from docker '/events' stream
+
+        Both the legacy format(status/id) and the newer format(Action/Actor) are accepted.
+
+        :type host_id: str|unicode
+        :param host_id: id of DockerHostServer where the event comes from
+
+        :type event: dict
+        :param event: the decoded event
+        """
+        status = event.get("status") or event.get("Action")
+        container_id = event.get("id") or event.get("Actor", {}).get("ID")
+        if not status or not container_id or event.get("Type", "container") != "container":
+            return
+
+        with self.__lock:
+            if status in self.RUNNING_EVENTS:
+                self.__set_state(host_id, container_id, True, event.get("time"))
+            elif status in self.STOPPED_EVENTS:
+                self.__set_state(host_id, container_id, False, event.get("time"))
+            elif status in self.REMOVED_EVENTS:
+                self.__containers.pop(container_id, None)
+                self.__pending[container_id] = False
+
+    def get_container_running_state(self, host_id, container_id):
+        """Get container running status from state table
+
+        :rtype: bool | None
+        :return: True if running, False if stopped or removed. None if unknown in which case caller should ask the
+            docker host directly
+        """
+        if not container_id or not self.is_watching(host_id):
+            return None
+        state = self.__containers.get(container_id)
+        if state is None:
+            return None
+        return state["running"]
+
+    def record_container_state(self, host_id, container_id, running):
+        """Seed the state table with the result of a direct query
+
+        Containers started before subscribing are unknown to the state table. The result of http query is recorded so
+        that following checks hit the table. Never overwrites a state that came from events.
+        """
+        if not container_id or not self.is_watching(host_id):
+            return
+        with self.__lock:
+            if container_id not in self.__containers:
+                self.__containers[container_id] = {"host_id": str(host_id), "running": running, "time": None}
+
+    def apply_pending_updates(self):
+        """Apply collected container status changes to experiments in batch. Called by schedule job"""
+        with self.__lock:
+            pending, self.__pending = self.__pending, {}
+        if not pending:
+            return
+
+        experiments = Experiment.objects(virtual_environments__docker_container__container_id__in=pending.keys())
+        for expr in experiments:
+            changed = False
+            for ve in expr.virtual_environments:
+                container = ve.docker_container
+                if not container or container.container_id not in pending:
+                    continue
+                running = pending[container.container_id]
+                if running and ve.status == VEStatus.STOPPED:
+                    ve.status = VEStatus.RUNNING
+                    changed = True
+                elif not running and ve.status == VEStatus.RUNNING:
+                    ve.status = VEStatus.STOPPED
+                    changed = True
+
+            if not changed:
+                continue
+            if all(ve.status == VEStatus.STOPPED for ve in expr.virtual_environments):
+                expr.status = EStatus.STOPPED
+            if all(ve.status == VEStatus.RUNNING for ve in expr.virtual_environments):
+                expr.status = EStatus.RUNNING
+            expr.update_time = self.util.get_now()
+            expr.save()
+            self.log.debug("status of experiment %s updated by docker events" % expr.id)
+
+    def __set_state(self, host_id, container_id, running, event_time):
+        state = self.__containers.get(container_id)
+        if state and state["time"] and event_time and event_time < state["time"]:
+            # out-of-order event after reconnecting
+            return
+        self.__containers[container_id] = {"host_id": str(host_id), "running": running, "time": event_time}
+        if state is None or state["running"] != running:
+            self.__pending[container_id] = running
@@ -51,6 +51,7 @@ class HostedDockerFormation(Component):
     """
     application_json = {'content-type': 'application/json'}
     docker_host_manager = RequiredFeature("docker_host_manager")
+    docker_event_monitor = RequiredFeature("docker_event_monitor")
 
     def __init__(self):
         self.lock = Lock()
@@ -162,10 +163,18 @@ class HostedDockerFormation(Component):
         """
         docker_host = docker_container.host_server
         if docker_host:
+            # state table fed by docker '/events' stream saves a http round trip
+            running = self.docker_event_monitor.get_container_running_state(docker_host.id,
+                                                                            docker_container.container_id)
+            if running is not None:
+                return running
+
             container_info = self.__get_container_info_by_container_id(docker_host, docker_container.container_id)
             if container_info is None:
                 return False
-            return container_info['State']['Running'] or container_info['State']['Restarting']
+            running = container_info['State']['Running'] or container_info['State']['Restarting']
+            self.docker_event_monitor.record_container_state(docker_host.id, docker_container.container_id, running)
+            return running
         else:
             return False
 
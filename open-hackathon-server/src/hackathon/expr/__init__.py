@@ -28,3 +28,4 @@ from expr_mgr import ExprManager
 from azure_hosted_docker_starter import AzureHostedDockerStarter
 from alauda_docker_expr_starter import AlaudaDockerStarter
 from azure_vm_expr_starter import AzureVMExprStarter
+from admission_queue import ExprAdmissionQueue
@@ -0,0 +1,295 @@
+# -*- coding: utf-8 -*-
+#
+# -----------------------------------------------------------------------------------
+# Copyright (c) Microsoft Open Technologies (Shanghai) Co. Ltd.  All rights reserved.
+#
+# The MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import sys
+
+sys.path.append("..")
+from datetime import timedelta
+from threading import Lock
+
+from hackathon import Component, RequiredFeature, Context
+from hackathon.hmongo.models import Experiment, ExprAdmissionTicket, DockerHostServer
+from hackathon.constants import EStatus, ADMISSION_STATUS, DockerHostServerStatus
+
+__all__ = ["ExprAdmissionQueue"]
+
+
+class ExprAdmissionQueue(Component):
+    """Admission queue for experiment starts
+
+    Instead of starting an experiment inside the http request, a STARTING experiment and a ticket are saved and the
+    request returns at once. Schedule job 'dispatch' admits tickets and starts experiments in schedule jobs so that
+    the number of experiments starting at the same time is bounded:
+        - at most 'max_starts_per_host' on every ready docker host, since every start hits a host with port scans
+          and docker calls. A ticket is admitted only if a ready host of its hackathon has a free slot and the host
+          is reserved on the ticket, the starter takes the reserved host as long as it's still available. A
+          hackathon without ready host(its hosts are being provisioned) gets 'max_starts_per_hackathon' instead
+        - at most 'max_starts' in total
+
+    Hackathons take turns when admitting(fair share) and tickets of the same hackathon are admitted in FIFO. A user
+    can have only one ticket of a template in queue. Since tickets are saved in db, any process can dispatch them and
+    the status endpoint can report queue position.
+
+    Settings under 'expr.admission' of config.py:
+        enabled: bool, default True
+        max_starts: int, default 20
+        max_starts_per_host: int, default 5
+        max_starts_per_hackathon: int, default 5
+        admit_timeout_minutes: int, an admitted experiment still starting after it is no longer counted, default 10
+        dispatch_interval_seconds: int, default 5
+    """
+    expr_manager = RequiredFeature("expr_manager")
+
+    # shared by all instances since a new instance is created for every schedule job
+    lock = Lock()
+
+    def is_enabled(self):
+        return self.__get_config("enabled", True)
+
+    def schedule_dispatch_job(self):
+        """Add an interval schedule job to admit tickets"""
+        if not self.is_enabled():
+            return
+        self.scheduler.add_interval(feature="expr_admission_queue",
+                                    method="dispatch",
+                                    id="expr_admission_dispatch",
+                                    seconds=self.__get_config("dispatch_interval_seconds", 5))
+
+    def enqueue(self, hackathon, template, user):
+        """Put a request to start experiment into queue
+
+        :type hackathon: Hackathon
+        :param hackathon: the hackathon of the experiment
+
+        :type template: Template
+        :param template: the template to start
+
+        :type user: User
+        :param user: the user who wants to start experiment
+
+        :rtype: Experiment
+        :return: the STARTING experiment. The one already in queue if the user has one
+        """
+        with self.lock:
+            ticket = ExprAdmissionTicket.objects(hackathon=hackathon,
+                                                 template=template,
+                                                 user=user,
+                                                 status__in=[ADMISSION_STATUS.QUEUED, ADMISSION_STATUS.ADMITTED]) \
+                .first()
+            if ticket and ticket.experiment and ticket.experiment.status == EStatus.STARTING:
+                return ticket.experiment
+
+            now = self.util.get_now()
+            expr = Experiment(status=EStatus.STARTING,
+                              template=template,
+                              user=user,
+                              virtual_environments=[],
+                              hackathon=hackathon,
+                              create_time=now,
+                              update_time=now)
+            expr.save()
+            ExprAdmissionTicket(experiment=expr,
+                                hackathon=hackathon,
+                                template=template,
+                                user=user,
+                                status=ADMISSION_STATUS.QUEUED,
+                                create_time=now).save()
+
+        self.log.debug("experiment %s of user %s queued for admission" % (expr.id, user.id))
+        try:
+            self.dispatch()
+        except Exception as e:
+            # will be dispatched by schedule job
+            self.log.error(e)
+        return expr
+
+    def get_queue_position(self, experiment):
+        """Get the position of a STARTING experiment in queue
+
+        :rtype: int | None
+        :return: 1-based position among tickets of the same hackathon, or None if not queued
+        """
+        ticket = ExprAdmissionTicket.objects(experiment=experiment, status=ADMISSION_STATUS.QUEUED).first()
+        if not ticket:
+            return None
+        ahead = ExprAdmissionTicket.objects(hackathon=ticket.hackathon,
+                                            status=ADMISSION_STATUS.QUEUED,
+                                            create_time__lt=ticket.create_time).count()
+        return ahead + 1
+
+    def dispatch(self):
+        """Admit queued tickets within concurrency bounds, hackathons take turns"""
+        self.__release_finished()
+
+        admitted = ExprAdmissionTicket.objects(status=ADMISSION_STATUS.ADMITTED).only("hackathon", "host_server")
+        budget = self.__get_config("max_starts", 20) - len(admitted)
+        if budget <= 0:
+            return
+
+        # in-flight starts of every host, or of the hackathon if admitted without host
+        in_flight = {}
+        for t in admitted:
+            key = str(t.host_server.id) if t.host_server else str(t.hackathon.id)
+            in_flight[key] = in_flight.get(key, 0) + 1
+
+        # free start slots of every hackathon that has queued tickets
+        slots = {}
+        hackathons = {}
+        for hackathon in ExprAdmissionTicket.objects(status=ADMISSION_STATUS.QUEUED).distinct("hackathon"):
+            host_slots = self.__get_free_slots(hackathon, in_flight)
+            if host_slots:
+                slots[str(hackathon.id)] = host_slots
+                hackathons[str(hackathon.id)] = hackathon
+
+        # round robin among hackathons, FIFO within a hackathon, the least busy host first
+        while budget > 0 and slots:
+            for key in sorted(slots.keys()):
+                if budget <= 0:
+                    break
+                host_slots = slots[key]
+                slot = max(host_slots, key=lambda s: s[1])
+                if not self.__admit_next(hackathons[key], slot[0]):
+                    slots.pop(key)
+                    continue
+                budget -= 1
+                slot[1] -= 1
+                if slot[1] <= 0:
+                    host_slots.remove(slot)
+                if not host_slots:
+                    slots.pop(key)
+
+    def cancel_hackathon(self, hackathon):
+        """Cancel tickets of a hackathon whose experiments are being torn down
+
+        Queued experiments never start and are marked FAILED. Admitted tickets whose experiments are no longer
+        starting are done.
+
+        :type hackathon: Hackathon
+        :param hackathon: the hackathon to tear down
+        """
+        for ticket in ExprAdmissionTicket.objects(hackathon=hackathon, status=ADMISSION_STATUS.QUEUED):
+            # might be admitted by another process in the meantime
+            if ExprAdmissionTicket.objects(id=ticket.id, status=ADMISSION_STATUS.QUEUED) \
+                    .update_one(set__status=ADMISSION_STATUS.DONE):
+                Experiment.objects(id=ticket.experiment.id, status=EStatus.STARTING) \
+                    .update_one(set__status=EStatus.FAILED, set__update_time=self.util.get_now())
+        self.__release_finished()
+
+    def start_admitted_expr(self, context):
+        """Start the experiment of an admitted ticket. Called by schedule job
+
+        :type context: Context
+        :param context: execution context contains 'ticket_id'
+        """
+        ticket = ExprAdmissionTicket.objects(id=context.ticket_id).first()
+        if not ticket or not ticket.experiment:
+            return
+
+        expr = ticket.experiment
+        if expr.status != EStatus.STARTING:
+            # cancelled or failed while waiting
+            self.log.debug("experiment %s is no longer starting, skip it" % expr.id)
+            ticket.status = ADMISSION_STATUS.DONE
+            ticket.save()
+            return
+
+        hackathon = ticket.hackathon
+        try:
+            if hackathon.event_end_time and hackathon.event_end_time < self.util.get_now():
+                raise Exception("hackathon %s already ended" % hackathon.name)
+
+            starter = self.expr_manager.get_starter(hackathon, ticket.template)
+            if not starter:
+                raise Exception("either template not supported or hackathon resource not configured")
+            context = Context(template=ticket.template,
+                              user=ticket.user,
+                              hackathon=hackathon,
+                              experiment=expr)
+            if ticket.host_server:
+                context.reserved_host_server_id = ticket.host_server.id
+            starter.start_expr(context)
+        except Exception as e:
+            self.log.error(e)
+            expr.status = EStatus.FAILED
+            expr.save()
+            ticket.status = ADMISSION_STATUS.DONE
+            ticket.save()
+
+    def __admit_next(self, hackathon, host_server):
+        """Admit the oldest queued ticket of a hackathon and reserve a host for it
+
+        The status is updated with a condition so that a ticket is admitted only once even if several processes are
+        dispatching.
+
+        :type host_server: DockerHostServer | None
+        :param host_server: the host to start the experiment on, None if the hackathon has no ready host
+        """
+        while True:
+            ticket = ExprAdmissionTicket.objects(hackathon=hackathon, status=ADMISSION_STATUS.QUEUED) \
+                .order_by("create_time").first()
+            if not ticket:
+                return False
+            if ExprAdmissionTicket.objects(id=ticket.id, status=ADMISSION_STATUS.QUEUED) \
+                    .update_one(set__status=ADMISSION_STATUS.ADMITTED,
+                                set__admit_time=self.util.get_now(),
+                                set__host_server=host_server):
+                self.log.debug("experiment %s admitted" % ticket.experiment.id)
+                self.scheduler.add_once("expr_admission_queue", "start_admitted_expr",
+                                        context=Context(ticket_id=ticket.id),
+                                        id="start_admitted_expr_%s" % ticket.id,
+                                        seconds=0)
+                return True
+
+    def __release_finished(self):
+        """Mark admitted tickets done once their experiments are no longer starting or timed out"""
+        timeout = timedelta(minutes=self.__get_config("admit_timeout_minutes", 10))
+        deadline = self.util.get_now() - timeout
+        for ticket in ExprAdmissionTicket.objects(status=ADMISSION_STATUS.ADMITTED):
+            expr = ticket.experiment
+            if expr and expr.status == EStatus.STARTING and ticket.admit_time and ticket.admit_time > deadline:
+                continue
+            ticket.status = ADMISSION_STATUS.DONE
+            ticket.save()
+
+    def __get_free_slots(self, hackathon, in_flight):
+        """Get free start slots of the ready docker hosts of a hackathon
+
+        :type in_flight: dict
+        :param in_flight: number of admitted tickets by host id, or by hackathon id for tickets without host
+
+        :rtype: list
+        :return: list of [host, free slots] whose free slots > 0. host is None if the hackathon has no ready host
+        """
+        hosts = DockerHostServer.objects(hackathon=hackathon,
+                                         disabled=False,
+                                         state=DockerHostServerStatus.DOCKER_READY)
+        per_host = self.__get_config("max_starts_per_host", 5)
+        slots = [[host, per_host - in_flight.get(str(host.id), 0)] for host in hosts]
+        if not slots:
+            slots = [[None, self.__get_config("max_starts_per_hackathon", 5) - in_flight.get(str(hackathon.id), 0)]]
+        return [s for s in slots if s[1] > 0]
+
+    def __get_config(self, key, default):
+        return self.util.safe_get_config("expr.admission." + key, default)
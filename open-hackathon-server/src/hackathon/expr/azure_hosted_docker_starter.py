@@ -27,15 +27,15 @@ import sys
 sys.path.append("..")
 from compiler.ast import flatten
 from threading import Lock
+from multiprocessing.pool import ThreadPool
 
 from docker_expr_starter import DockerExprStarter
 from hackathon import RequiredFeature, Context
-from hackathon.hmongo.models import Hackathon, Experiment, DockerContainer, PortBinding, DockerHostServer, AzureKey
-from hackathon.constants import DHS_QUERY_STATE, EStatus, AVMStatus, VERemoteProvider, VEStatus
+from hackathon.hmongo.models import Hackathon, Experiment, DockerContainer, PortBinding, DockerHostServer, AzureKey, \
+    ExprAdmissionTicket
+from hackathon.constants import DHS_QUERY_STATE, EStatus, AVMStatus, VERemoteProvider, VEStatus, ADMISSION_STATUS
 from hackathon.hazure import VirtualMachineAdapter
 from hackathon.template import DOCKER_UNIT
-from hackathon.hazure.utils import find_unassigned_endpoints, add_endpoint_to_network_config, \
-    delete_endpoint_from_network_config
 
 FEATURE = "azure_docker"
 IN_PROGRESS = 'InProgress'
@@ -43,6 +43,7 @@ SUCCEEDED = 'Succeeded'
 MAX_TRIAL = 20
 TRIAL_INTERVAL_SECONDS = 10
 DEPLOYMENT_SLOT = "Production"
+BULK_DELETE_BATCH_SIZE = 10
 
 __all__ = ["AzureHostedDockerStarter"]
 
@@ -50,6 +51,9 @@ __all__ = ["AzureHostedDockerStarter"]
 class AzureHostedDockerStarter(DockerExprStarter):
     docker = RequiredFeature("hosted_docker_proxy")
     docker_host_manager = RequiredFeature("docker_host_manager")
+    azure_adapter_registry = RequiredFeature("azure_adapter_registry")
+    azure_endpoint_batcher = RequiredFeature("azure_endpoint_batcher")
+    azure_async_op_poller = RequiredFeature("azure_async_op_poller")
     host_ports = []
     host_port_max_num = 30
 
@@ -57,9 +61,11 @@ class AzureHostedDockerStarter(DockerExprStarter):
         self.lock = Lock()
 
     def get_docker_host_server(self, context):
+        self._heartbeat(context)
         hackathon = Hackathon.objects(id=context.hackathon_id).no_dereference().first()
         try:
-            host_resp = self.docker_host_manager.get_available_docker_host(hackathon)
+            host_resp = self.docker_host_manager.get_available_docker_host(hackathon,
+                                                                           context.get("reserved_host_server_id"))
         except Exception as e:
             self.log.error(e)
             host_resp = Context(state=DHS_QUERY_STATE.ONGOING)
@@ -77,6 +83,7 @@ class AzureHostedDockerStarter(DockerExprStarter):
             self._on_virtual_environment_failed(context)
 
     def query_network_config_status(self, context):
+        self._heartbeat(context)
         vm_adapter = self.__get_azure_vm_adapter(context)
         try:
             context.trial = context.get("trial", 0) + 1
@@ -102,6 +109,7 @@ class AzureHostedDockerStarter(DockerExprStarter):
             self.scheduler.add_once(FEATURE, "query_network_config_status", context, seconds=TRIAL_INTERVAL_SECONDS)
 
     def query_vm_status(self, context):
+        self._heartbeat(context)
         vm_adapter = self.__get_azure_vm_adapter(context)
         try:
             context.trial = context.get("trial", 0) + 1
@@ -178,29 +186,19 @@ class AzureHostedDockerStarter(DockerExprStarter):
             public_ports_cfg = filter(lambda p: DOCKER_UNIT.PORTS_PUBLIC in p, port_cfg)
             host_ports = [u[DOCKER_UNIT.PORTS_HOST_PORT] for u in public_ports_cfg]
 
-            # get assigned ports of cloud service
-            assigned_endpoints = vm_adapter.get_assigned_endpoints(cloud_service_name)
-            if not assigned_endpoints:
-                self.log.debug('fail to assign endpoints: %s' % cloud_service_name)
-                self._on_virtual_environment_failed(context)
+            if not host_ports:
+                self.__update_virtual_environment_cfg(context)
                 return
 
-            endpoints_to_assign = find_unassigned_endpoints(host_ports, assigned_endpoints)
-            # duplication detection for public endpoint
-            deployment_name = vm_adapter.get_deployment_name(cloud_service_name, DEPLOYMENT_SLOT)
-            network_config = vm_adapter.get_virtual_machine_network_config(cloud_service_name,
-                                                                           deployment_name,
-                                                                           virtual_machine_name)
-            new_network_config = add_endpoint_to_network_config(network_config, endpoints_to_assign, host_ports)
+            # endpoints of concurrent starts on the same VM are assigned in one network config update
             try:
-                result = vm_adapter.update_virtual_machine_network_config(cloud_service_name,
-                                                                          deployment_name,
-                                                                          virtual_machine_name,
-                                                                          new_network_config)
-                context.request_id = result.request_id
+                endpoints_to_assign, context.request_id = self.azure_endpoint_batcher.assign(vm_adapter,
+                                                                                             cloud_service_name,
+                                                                                             virtual_machine_name,
+                                                                                             host_ports)
             except Exception as e:
                 self.log.error(e)
-                self.log.error('fail to assign endpoints: %s' % endpoints_to_assign)
+                self.log.error('fail to assign endpoints: %s' % cloud_service_name)
                 self._on_virtual_environment_failed(context)
                 return
 
@@ -268,6 +266,8 @@ class AzureHostedDockerStarter(DockerExprStarter):
         self.__start_docker_container(context, experiment, host_server)
 
     def __start_docker_container(self, context, experiment, host_server):
+        # pulling image might take long
+        self._heartbeat(context)
         container_name = context.container_name
         virtual_environment = experiment.virtual_environments.get(name=context.virtual_environment_name)
 
@@ -368,19 +368,9 @@ class AzureHostedDockerStarter(DockerExprStarter):
         vm_adapter = self.__get_azure_vm_adapter(context)
         virtual_machine_name = host_server.vm_name
         cloud_service_name = host_server.public_dns.split('.')[0]  # cloud_service_name.chinacloudapp.cn
-        deployment_name = vm_adapter.get_deployment_name(cloud_service_name, DEPLOYMENT_SLOT)
-
-        # current network config
-        network_config = vm_adapter.get_virtual_machine_network_config(cloud_service_name,
-                                                                       deployment_name,
-                                                                       virtual_machine_name)
         host_ports = [p.host_port for p in docker_container.port_bindings]
-        new_network_config = delete_endpoint_from_network_config(network_config, host_ports)
-        result = vm_adapter.update_virtual_machine_network_config(cloud_service_name,
-                                                                  deployment_name,
-                                                                  virtual_machine_name,
-                                                                  new_network_config)
-        context.request_id = result.request_id
+        context.request_id = self.azure_endpoint_batcher.release(vm_adapter, cloud_service_name, virtual_machine_name,
+                                                                 host_ports)
         context.cloud_service_name = cloud_service_name
         context.virtual_machine_name = virtual_machine_name
         context.host_server_id = host_server.id
@@ -390,6 +380,123 @@ class AzureHostedDockerStarter(DockerExprStarter):
         self.__clear_ports_cache()
         self.query_release_status(context)
 
+    def bulk_stop_virtual_environments(self, context, host_server, virtual_environments):
+        """Stop a batch of docker containers on the same host server
+
+        Unlike _stop_virtual_environment which handles containers one by one, public ports of all containers are
+        released in a single network config update of the VM, and containers are deleted in parallel batches while
+        azure is applying the new network config. It returns without waiting for the update, whose result is checked
+        by the async op poller(or schedule jobs if the poller is disabled) and only logged.
+
+        :type context: Context
+        :param context: execution context which contains 'hackathon_id' to load azure key of the hackathon, or
+            'azure_key_id' of the key to use, and 'experiment_ids' which maps container names to the ids of their
+            experiments so that every stopped virtual environment goes through _on_virtual_environment_stopped
+
+        :type host_server: DockerHostServer
+        :param host_server: the docker host server where all containers running on
+
+        :type virtual_environments: list
+        :param virtual_environments: list of VirtualEnvironment whose docker_container is on host_server
+
+        :rtype: list
+        :return: names of virtual environments whose container deleted
+        """
+        request_id = None
+        azure_key = None
+        if not self.util.is_local():
+            try:
+                azure_key = self.__load_azure_key_id(context)
+                vm_adapter = self.azure_adapter_registry.get_adapter_by_key(azure_key, VirtualMachineAdapter)
+                request_id = self.__release_public_ports(vm_adapter, host_server, virtual_environments)
+            except Exception as e:
+                self.log.error(e)
+                self.log.error("fail to release public ports on host server %s" % host_server.vm_name)
+
+        names = [ve.docker_container.name for ve in virtual_environments]
+        pool = ThreadPool(min(BULK_DELETE_BATCH_SIZE, len(names)) or 1)
+        try:
+            deleted = pool.map(lambda name: self.__delete_container(host_server, name), names)
+        finally:
+            pool.close()
+        stopped = [name for name, done in zip(names, deleted) if done]
+        for ve in virtual_environments:
+            if ve.docker_container.name not in stopped:
+                continue
+            try:
+                expr_id = context.experiment_ids[ve.docker_container.name]
+                self._on_virtual_environment_stopped(Context(experiment_id=expr_id, virtual_environment_name=ve.name))
+            except Exception as e:
+                self.log.error(e)
+
+        if request_id:
+            self.__watch_bulk_release(context, azure_key, host_server, request_id)
+        self.__clear_ports_cache()
+        self.log.debug("%d of %d containers deleted on host server %s" %
+                       (len(stopped), len(names), host_server.vm_name))
+        return stopped
+
+    def __release_public_ports(self, vm_adapter, host_server, virtual_environments):
+        cloud_service_name = host_server.public_dns.split('.')[0]  # cloud_service_name.chinacloudapp.cn
+        host_ports = [p.host_port for ve in virtual_environments for p in ve.docker_container.port_bindings]
+        return self.azure_endpoint_batcher.release(vm_adapter, cloud_service_name, host_server.vm_name, host_ports)
+
+    def __delete_container(self, host_server, container_name):
+        try:
+            req = self.docker.stop_container(host_server, container_name)
+            # 404 means the container was already removed
+            return req.status_code < 300 or req.status_code == 404
+        except Exception as e:
+            self.log.error(e)
+            return False
+
+    def __watch_bulk_release(self, context, azure_key, host_server, request_id):
+        """Check the network config update of bulk stop later instead of blocking the teardown worker
+
+        The endpoint batcher waits for the update itself before the next update of the same VM.
+        """
+        try:
+            ctx = Context(hackathon_id=context.hackathon_id,
+                          azure_key_id=azure_key.id,
+                          request_id=request_id,
+                          virtual_machine_name=host_server.vm_name,
+                          trial=0)
+            if self.azure_async_op_poller.is_enabled():
+                ctx.subscription_id = azure_key.subscription_id
+                ctx.pem_url = azure_key.get_local_pem_url()
+                ctx.management_host = azure_key.management_host
+                self.azure_async_op_poller.watch_operation(FEATURE, "on_bulk_release_done", ctx, request_id,
+                                                           max_interval=TRIAL_INTERVAL_SECONDS)
+            else:
+                self.scheduler.add_once(FEATURE, "query_bulk_release_status", ctx, seconds=TRIAL_INTERVAL_SECONDS)
+        except Exception as e:
+            self.log.error(e)
+
+    def query_bulk_release_status(self, context):
+        """Poll the network config update of bulk stop at most MAX_TRIAL times. Called by schedule job"""
+        context.trial = context.get("trial", 0) + 1
+        status = None
+        try:
+            status = self.__get_azure_vm_adapter(context).get_operation_status(context.request_id).status
+        except Exception as e:
+            self.log.error(e)
+
+        if status in [None, IN_PROGRESS] and context.trial < MAX_TRIAL:
+            self.scheduler.add_once(FEATURE, "query_bulk_release_status", context, seconds=TRIAL_INTERVAL_SECONDS)
+            return
+
+        context.async_op_status = status
+        self.on_bulk_release_done(context)
+
+    def on_bulk_release_done(self, context):
+        """Called once the network config update of bulk stop finished or polling gave up"""
+        if context.get("async_op_status") == SUCCEEDED:
+            self.log.debug("public ports released on host server %s" % context.virtual_machine_name)
+        else:
+            self.log.error("fail to release public ports on host server %s, azure operation %s: %s" %
+                           (context.virtual_machine_name, context.request_id,
+                            context.get("async_op_error") or context.get("async_op_status") or "timeout"))
+
     def query_release_status(self, context):
         vm_adapter = self.__get_azure_vm_adapter(context)
         try:
@@ -437,9 +544,9 @@ class AzureHostedDockerStarter(DockerExprStarter):
         if "azure_key_id" in context:
             azure_key = AzureKey.objects(id=context.azure_key_id).first()
 
-        if not azure_key:
+        if not azure_key and "experiment_id" in context:
             expr = Experiment.objects(id=context.experiment_id).only("azure_key").first()
-            azure_key = expr.azure_key
+            azure_key = expr.azure_key if expr else None
 
         if not azure_key:
             hackathon = Hackathon.objects(id=context.hackathon_id).first()
@@ -453,9 +560,7 @@ class AzureHostedDockerStarter(DockerExprStarter):
     def __get_azure_vm_adapter(self, context):
         # todo provide a single and unified way to get adapter for hackathon
         azure_key = self.__load_azure_key_id(context)
-        return VirtualMachineAdapter(azure_key.subscription_id,
-                                     azure_key.get_local_pem_url(),
-                                     host=azure_key.management_host)
+        return self.azure_adapter_registry.get_adapter_by_key(azure_key, VirtualMachineAdapter)
 
     def __get_available_host_port(self, docker_host, private_port):
         """
@@ -513,7 +618,9 @@ class AzureHostedDockerStarter(DockerExprStarter):
         if we release ports now, the new ports will be lost.
         :return:
         """
-        num = Experiment.objects(status=EStatus.STARTING).count()
+        # experiments waiting in admission queue are STARTING but apply no port yet
+        num = Experiment.objects(status=EStatus.STARTING).count() - \
+            ExprAdmissionTicket.objects(status=ADMISSION_STATUS.QUEUED).count()
         if num > 0:
             self.log.debug("there are %d experiment is starting, host ports will updated in next loop" % num)
             return
@@ -43,6 +43,8 @@ from hackathon.hazure.constants import (
 
 class AzureVMExprStarter(ExprStarter):
     azure_cert_manager = RequiredFeature("azure_cert_manager")
+    azure_adapter_registry = RequiredFeature("azure_adapter_registry")
+    azure_async_op_poller = RequiredFeature("azure_async_op_poller")
 
     def _internal_start_expr(self, context):
         try:
@@ -185,7 +187,10 @@ class AzureVMExprStarter(ExprStarter):
         return "%s-%s" % (raw_cloud_service_name, subscription_id[:8])
 
     def __get_adapter_from_sctx(self, sctx, adapter_class):
-        return adapter_class(sctx.subscription_id, sctx.pem_url, host=sctx.management_host)
+        return self.azure_adapter_registry.get_adapter(adapter_class,
+                                                       sctx.subscription_id,
+                                                       sctx.pem_url,
+                                                       sctx.management_host)
 
     def __schedule_setup(self, sctx):
         self.scheduler.add_once("azure_vm", "schedule_setup", context=sctx,
@@ -211,6 +216,7 @@ class AzureVMExprStarter(ExprStarter):
                                 context=ctx, seconds=0)
 
     def setup_cloud_service(self, sctx):
+        self._heartbeat(sctx)
         # get context from super context
         ctx = sctx.job_ctxs[sctx.current_job_index]
         adapter = self.__get_adapter_from_sctx(sctx, CloudServiceAdapter)
@@ -242,6 +248,7 @@ class AzureVMExprStarter(ExprStarter):
             self._on_virtual_environment_failed(sctx)
 
     def setup_storage(self, sctx):
+        self._heartbeat(sctx)
         # get context from super context
         ctx = sctx.job_ctxs[sctx.current_job_index]
         adapter = self.__get_adapter_from_sctx(sctx, StorageAccountAdapter)
@@ -276,6 +283,7 @@ class AzureVMExprStarter(ExprStarter):
             self._on_virtual_environment_failed(sctx)
 
     def setup_virtual_machine(self, sctx):
+        self._heartbeat(sctx)
         # get context from super context
         ctx = sctx.job_ctxs[sctx.current_job_index]
         adapter = self.__get_adapter_from_sctx(sctx, VirtualMachineAdapter)
@@ -369,23 +377,45 @@ class AzureVMExprStarter(ExprStarter):
 
     def __check_vm_operation_status(self, sctx, on_success, on_failed, on_continue):
         ctx = sctx.job_ctxs[sctx.current_job_index]
-        adapter = self.__get_adapter_from_sctx(sctx, VirtualMachineAdapter)
 
-        res = adapter.get_operation_status(ctx.request_id)
+        if sctx.get("async_op_status", None):
+            # already polled by the async op poller
+            status, error = sctx.async_op_status, sctx.async_op_error
+            sctx.async_op_status = sctx.async_op_error = None
+        else:
+            adapter = self.__get_adapter_from_sctx(sctx, VirtualMachineAdapter)
+            res = adapter.get_operation_status(ctx.request_id)
+            status, error = res.status, res.error
 
-        if res.status == ASYNC_OP_RESULT.SUCCEEDED:
+        if status == ASYNC_OP_RESULT.SUCCEEDED:
             on_success(sctx)
-        elif res.error:
+        elif error:
             on_failed(sctx)
         else:
             on_continue(sctx)
 
+    def __wait(self, sctx, method, interval, request_id=None):
+        """Call 'method' later to check the progress, by the async op poller or a schedule job
+
+        :type interval: int
+        :param interval: the interval of schedule job, or the max interval of the poller
+
+        :type request_id: str|unicode
+        :param request_id: the async operation to wait for. If given, the poller calls 'method' once it's done
+        """
+        self._heartbeat(sctx)
+        if not self.azure_async_op_poller.is_enabled():
+            self.scheduler.add_once("azure_vm", method, id="%s_%s" % (method, sctx.experiment_id),
+                                    context=sctx, seconds=interval)
+        elif request_id:
+            self.azure_async_op_poller.watch_operation("azure_vm", method, sctx, request_id, max_interval=interval)
+        else:
+            self.azure_async_op_poller.watch_state("azure_vm", method, sctx, max_interval=interval)
+
     def __wait_for_add_virtual_machine(self, sctx):
         self.log.debug("azure virtual environment: %d, waiting for add virtual machine" % sctx.current_job_index)
-        self.scheduler.add_once(
-            "azure_vm", "wait_for_add_virtual_machine",
-            id="wait_for_add_virtual_machine_" + str(sctx.experiment_id),
-            context=sctx, seconds=ASYNC_OP_QUERY_INTERVAL)
+        ctx = sctx.job_ctxs[sctx.current_job_index]
+        self.__wait(sctx, "wait_for_add_virtual_machine", ASYNC_OP_QUERY_INTERVAL, ctx.request_id)
 
     def wait_for_add_virtual_machine(self, sctx):
         self.__check_vm_operation_status(
@@ -407,10 +437,8 @@ class AzureVMExprStarter(ExprStarter):
 
     def __wait_for_create_virtual_machine_deployment(self, sctx):
         self.log.debug("azure virtual environment: %d, waiting for create vm_deployment" % sctx.current_job_index)
-        self.scheduler.add_once(
-            "azure_vm", "wait_for_create_virtual_machine_deployment",
-            id="wait_for_create_virtual_machine_deployment_" + str(sctx.experiment_id),
-            context=sctx, seconds=ASYNC_OP_QUERY_INTERVAL)
+        ctx = sctx.job_ctxs[sctx.current_job_index]
+        self.__wait(sctx, "wait_for_create_virtual_machine_deployment", ASYNC_OP_QUERY_INTERVAL, ctx.request_id)
 
     def wait_for_create_virtual_machine_deployment(self, sctx):
         self.__check_vm_operation_status(
@@ -461,10 +489,8 @@ class AzureVMExprStarter(ExprStarter):
 
     def __wait_for_config_virtual_machine(self, sctx):
         self.log.debug("azure virtual environment: %d, waiting for configure network" % sctx.current_job_index)
-        self.scheduler.add_once(
-            "azure_vm", "wait_for_config_virtual_machine",
-            id="wait_for_config_virtual_machine_" + str(sctx.experiment_id),
-            context=sctx, seconds=ASYNC_OP_QUERY_INTERVAL)
+        ctx = sctx.job_ctxs[sctx.current_job_index]
+        self.__wait(sctx, "wait_for_config_virtual_machine", ASYNC_OP_QUERY_INTERVAL, ctx.request_id)
 
     def wait_for_config_virtual_machine(self, sctx):
         self.__check_vm_operation_status(
@@ -477,9 +503,7 @@ class AzureVMExprStarter(ExprStarter):
 
     def __wait_for_deployment_ready(self, sctx):
         self.log.debug("azure virtual environment: %d, waiting for deployment ready" % sctx.current_job_index)
-        self.scheduler.add_once(
-            "azure_vm", "wait_for_deployment_ready", id="wait_for_deployment_ready_" + str(sctx.experiment_id),
-            context=sctx, seconds=ASYNC_OP_QUERY_INTERVAL)
+        self.__wait(sctx, "wait_for_deployment_ready", ASYNC_OP_QUERY_INTERVAL)
 
     def wait_for_deployment_ready(self, sctx):
         ctx = sctx.job_ctxs[sctx.current_job_index]
@@ -507,10 +531,7 @@ class AzureVMExprStarter(ExprStarter):
 
     def __wait_for_virtual_machine_ready(self, sctx):
         self.log.debug("azure virtual environment: %d, waiting for vm ready" % sctx.current_job_index)
-        self.scheduler.add_once(
-            "azure_vm", "wait_for_virtual_machine_ready",
-            id="wait_for_virtual_machine_ready_" + str(sctx.experiment_id),
-            context=sctx, seconds=ASYNC_OP_QUERY_INTERVAL_LONG)
+        self.__wait(sctx, "wait_for_virtual_machine_ready", ASYNC_OP_QUERY_INTERVAL_LONG)
 
     def wait_for_virtual_machine_ready(self, sctx):
         ctx = sctx.job_ctxs[sctx.current_job_index]
@@ -724,9 +745,8 @@ class AzureVMExprStarter(ExprStarter):
 
     def __wait_for_stop_virtual_machine(self, sctx):
         self.log.debug("azure virtual environment %d, waiting for stop virtual machine" % sctx.current_job_index)
-        self.scheduler.add_once(
-            "azure_vm", "wait_for_stop_virtual_machine",
-            id="wait_for_stop_virtual_machine_" + str(sctx.experiment_id), context=sctx, seconds=ASYNC_OP_QUERY_INTERVAL)
+        ctx = sctx.job_ctxs[sctx.current_job_index]
+        self.__wait(sctx, "wait_for_stop_virtual_machine", ASYNC_OP_QUERY_INTERVAL, ctx.request_id)
 
     def wait_for_stop_virtual_machine(self, sctx):
         self.__check_vm_operation_status(
@@ -80,7 +80,8 @@ class DockerExprStarter(ExprStarter):
         prefix = str(context.experiment_id)[0:9]
         suffix = "".join(random.sample(string.ascii_letters + string.digits, 8))
         new_name = '%s-%s-%s' % (prefix, origin_name, suffix.lower())
-        docker_template_unit.set_name(new_name)
+        # a unit of its own since the template unit is shared by all experiments
+        docker_template_unit = docker_template_unit.instantiate(new_name)
         self.log.debug("starting to start container: %s" % new_name)
 
         # db document for VirtualEnvironment
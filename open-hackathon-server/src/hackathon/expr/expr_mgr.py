@@ -28,18 +28,26 @@ import sys
 
 sys.path.append("..")
 from datetime import timedelta
+from multiprocessing.pool import ThreadPool
 
 from werkzeug.exceptions import PreconditionFailed, NotFound
-from mongoengine import Q
+from mongoengine import Q, OperationError
 
 from hackathon import Component, RequiredFeature, Context
 from hackathon.constants import EStatus, VERemoteProvider, VE_PROVIDER, VEStatus, ReservedUser, \
-    HACK_NOTICE_EVENT, HACK_NOTICE_CATEGORY, CLOUD_PROVIDER, HACKATHON_CONFIG
-from hackathon.hmongo.models import Experiment, User, Hackathon, UserHackathon
+    HACK_NOTICE_EVENT, HACK_NOTICE_CATEGORY, CLOUD_PROVIDER, HACKATHON_CONFIG, ADMISSION_STATUS
+from hackathon.hmongo.models import Experiment, User, Hackathon, UserHackathon, DockerHostServer, ExprAdmissionTicket, \
+    TeardownJob
 from hackathon.hackathon_response import not_found, ok
 
 __all__ = ["ExprManager"]
 
+TEARDOWN_PARALLEL_HOSTS = 5
+TEARDOWN_RETRY_SECONDS = 60
+TEARDOWN_MAX_TRIAL = 10
+# a running teardown job not updated for so long is taken as dead with its process
+TEARDOWN_STALE_MINUTES = 30
+
 
 class ExprManager(Component):
     user_manager = RequiredFeature("user_manager")
@@ -47,6 +55,7 @@ class ExprManager(Component):
     admin_manager = RequiredFeature("admin_manager")
     template_library = RequiredFeature("template_library")
     hosted_docker_proxy = RequiredFeature("hosted_docker_proxy")
+    admission_queue = RequiredFeature("expr_admission_queue")
 
     def start_expr(self, user, template_name, hackathon_name=None):
         """
@@ -169,6 +178,127 @@ class ExprManager(Component):
             except Exception as e:
                 self.log.error(e)
 
+    def reconcile_starting_exprs(self):
+        """Stop experiments which have been starting for too long and mark them failed
+
+        Short polls of a starting experiment are kept in memory by the scheduler(see HackathonScheduler) and lost if
+        the process crashed. Such an experiment would be starting forever and its user could never start another one.
+
+        Starters refresh 'update_time' of a starting experiment at every step(see ExprStarter._heartbeat), so an
+        experiment not updated for 'reconcile_starting_minutes' has no worker driving it any more.
+
+        Experiments waiting in the admission queue or admitted but not started yet are STARTING too, they are skipped.
+        Tickets admitted too long ago are released by the queue first, see ExprAdmissionQueue.
+        """
+        minutes = self.util.safe_get_config("scheduler.timer_wheel.reconcile_starting_minutes", 30)
+        deadline = self.util.get_now() - timedelta(minutes=minutes)
+        exprs = Experiment.objects(status=EStatus.STARTING, update_time__lt=deadline)
+        for expr in exprs:
+            if ExprAdmissionTicket.objects(experiment=expr,
+                                           status__in=[ADMISSION_STATUS.QUEUED, ADMISSION_STATUS.ADMITTED]).count():
+                continue
+
+            # mark it failed first with the same condition, in case a heartbeat came after the query
+            if not Experiment.objects(id=expr.id, status=EStatus.STARTING, update_time__lt=deadline) \
+                    .update_one(set__status=EStatus.FAILED, set__update_time=self.util.get_now()):
+                continue
+
+            self.log.warn("experiment %s has been starting for more than %d minutes, stop it" % (expr.id, minutes))
+            try:
+                starter = self.get_starter(expr.hackathon, expr.template)
+                if starter:
+                    starter.stop_expr(Context(experiment_id=expr.id, experiment=expr))
+            except Exception as e:
+                self.log.error(e)
+
+    def schedule_teardown_hackathon(self, hackathon, run_date=None):
+        """Schedule a job to stop all experiments of hackathon in bulk
+
+        :type hackathon: Hackathon
+        :param hackathon: the hackathon whose experiments to be stopped
+
+        :type run_date: datetime | None
+        :param run_date: when to stop the experiments. Stop as soon as possible if None
+        """
+        context = Context(hackathon_id=hackathon.id)
+        if run_date:
+            self.scheduler.add_once("expr_manager", "teardown_hackathon", context=context,
+                                    id="teardown_expr_at_end_%s" % hackathon.id, run_date=run_date)
+        else:
+            self.scheduler.add_once("expr_manager", "teardown_hackathon", context=context,
+                                    id="teardown_expr_%s" % hackathon.id, seconds=1, durable=True)
+
+    def teardown_hackathon_exprs(self, hackathon):
+        """Stop all experiments of hackathon in bulk asynchronously. For admin API
+
+        :rtype: dict
+        :return: progress of teardown
+        """
+        self.schedule_teardown_hackathon(hackathon)
+        return self.get_teardown_progress(hackathon)
+
+    def get_teardown_progress(self, hackathon):
+        """Get progress of bulk teardown
+
+        Both counts of experiments and the job are read from db since the teardown job might run in another process.
+
+        :rtype: dict
+        """
+        progress = {
+            "hackathon_name": hackathon.name,
+            "running": Experiment.objects(hackathon=hackathon, status=EStatus.RUNNING).count(),
+            "starting": Experiment.objects(hackathon=hackathon, status=EStatus.STARTING).count()
+        }
+        job = TeardownJob.objects(hackathon=hackathon).first()
+        if job:
+            progress["job"] = self.util.make_serializable({
+                "status": job.status,
+                "start_time": job.start_time,
+                "end_time": job.end_time,
+                "hosts": job.hosts,
+                "hosts_done": job.hosts_done,
+                "total": job.total,
+                "stopped": job.stopped,
+                "failed": job.failed
+            })
+        return progress
+
+    def teardown_hackathon(self, context):
+        """Stop all running experiments of a hackathon in bulk. Called by schedule job
+
+        Docker containers are grouped by host server and every host is handled by a worker thread in parallel. The
+        starter releases ports of all containers on the same VM in one network config update and deletes containers in
+        parallel batches. Other experiments are stopped one by one through stop_expr. Experiments queued for admission
+        are cancelled, and those already starting will be checked again later.
+
+        :type context: Context
+        :param context: execution context contains 'hackathon_id'
+        """
+        hackathon = Hackathon.objects(id=context.hackathon_id).first()
+        if not hackathon:
+            return
+
+        job = self.__start_teardown_job(hackathon)
+        if not job:
+            self.log.debug("teardown of hackathon %s is already running" % hackathon.name)
+            return
+
+        try:
+            self.__teardown_hackathon(hackathon, job)
+        except Exception as e:
+            self.log.error(e)
+        finally:
+            now = self.util.get_now()
+            TeardownJob.objects(id=job.id).update_one(set__status="finished", set__end_time=now, set__update_time=now)
+
+        context.trial = context.get("trial", 0) + 1
+        starting = Experiment.objects(hackathon=hackathon, status=EStatus.STARTING).count()
+        if starting > 0 and context.trial < TEARDOWN_MAX_TRIAL:
+            self.log.debug("%d experiments still starting, teardown hackathon %s again later" % (starting,
+                                                                                               hackathon.name))
+            self.scheduler.add_once("expr_manager", "teardown_hackathon", context=context,
+                                    id="teardown_expr_%s" % hackathon.id, seconds=TEARDOWN_RETRY_SECONDS)
+
     def pre_allocate_expr(self, context):
         # TODO: too complex, not check
         hackathon_id = context.hackathon_id
@@ -265,6 +395,11 @@ class ExprManager(Component):
         if not starter:
             raise PreconditionFailed("either template not supported or hackathon resource not configured")
 
+        # pre-allocated experiments(no user) are started directly, users wait in the admission queue
+        if user and self.admission_queue.is_enabled():
+            expr = self.admission_queue.enqueue(hackathon, template, user)
+            return self.__report_expr_status(expr)
+
         context = starter.start_expr(Context(
             template=template,
             user=user,
@@ -286,6 +421,11 @@ class ExprManager(Component):
             "create_time": str(expr.create_time),
             "last_heart_beat_time": str(expr.last_heart_beat_time)}
 
+        if expr.status == EStatus.STARTING:
+            queue_position = self.admission_queue.get_queue_position(expr)
+            if queue_position:
+                ret["queue_position"] = queue_position
+
         if expr.status != EStatus.RUNNING:
             return ret
 
@@ -431,6 +571,103 @@ class ExprManager(Component):
         experiment.update_time = self.util.get_now()
         experiment.save()
 
+    def __teardown_hackathon(self, hackathon, job):
+        # experiments queued for admission must not start any more
+        self.admission_queue.cancel_hackathon(hackathon)
+        exprs = list(Experiment.objects(hackathon=hackathon, status=EStatus.RUNNING))
+        self.log.debug("start tearing down %d experiments of hackathon %s" % (len(exprs), hackathon.name))
+
+        # host_server_id: [starter, host_server, [virtual_environment], context]
+        # container names are mapped to experiment ids in context so that the starter updates experiments
+        groups = {}
+        singles = []
+        for expr in exprs:
+            starter = self.get_starter(hackathon, expr.template)
+            ves = [ve for ve in expr.virtual_environments if ve.status == VEStatus.RUNNING]
+            if not hasattr(starter, "bulk_stop_virtual_environments") or \
+                    not all(ve.docker_container and ve.docker_container.host_server for ve in ves):
+                singles.append(expr)
+                continue
+
+            for ve in ves:
+                host_server = ve.docker_container.host_server
+                group = groups.setdefault(str(host_server.id),
+                                          [starter, host_server, [], Context(hackathon_id=hackathon.id,
+                                                                             experiment_ids={})])
+                group[2].append(ve)
+                group[3].experiment_ids[ve.docker_container.name] = expr.id
+                # the azure key is loaded from the hackathon if no experiment on the host has its own
+                if expr.azure_key and "azure_key_id" not in group[3]:
+                    group[3].azure_key_id = expr.azure_key.id
+
+        total = sum(len(group[2]) for group in groups.values()) + len(singles)
+        TeardownJob.objects(id=job.id).update_one(set__hosts=len(groups), set__total=total,
+                                                  set__update_time=self.util.get_now())
+
+        def stop_on_host(group):
+            starter, host_server, ves, context = group
+            try:
+                stopped = starter.bulk_stop_virtual_environments(context, host_server, ves)
+                self.__refresh_container_count(host_server)
+            except Exception as e:
+                self.log.error(e)
+                stopped = []
+            self.__update_teardown_job(job, hosts_done=1, stopped=len(stopped), failed=len(ves) - len(stopped))
+            return len(stopped)
+
+        stopped = 0
+        if groups:
+            pool = ThreadPool(min(TEARDOWN_PARALLEL_HOSTS, len(groups)))
+            try:
+                stopped = sum(pool.map(stop_on_host, groups.values()))
+            finally:
+                pool.close()
+
+        for expr in singles:
+            try:
+                self.stop_expr(expr.id)
+                self.__update_teardown_job(job, stopped=1)
+                stopped += 1
+            except Exception as e:
+                self.log.error(e)
+                self.__update_teardown_job(job, failed=1)
+
+        self.log.debug("teardown of hackathon %s finished: %d stopped, %d failed" % (hackathon.name,
+                                                                                      stopped,
+                                                                                      total - stopped))
+        # release admitted tickets of the stopped experiments
+        self.admission_queue.cancel_hackathon(hackathon)
+
+    def __start_teardown_job(self, hackathon):
+        """Start a new teardown job of hackathon unless one is running in any process
+
+        :rtype: TeardownJob | None
+        :return: the job started, or None if another one is running
+        """
+        now = self.util.get_now()
+        stale = now - timedelta(minutes=TEARDOWN_STALE_MINUTES)
+        try:
+            return TeardownJob.objects(Q(status__ne="running") | Q(update_time__lt=stale), hackathon=hackathon) \
+                .modify(upsert=True, new=True, set__status="running", set__start_time=now, set__update_time=now,
+                        set__end_time=None, set__hosts=0, set__hosts_done=0, set__total=0, set__stopped=0,
+                        set__failed=0)
+        except OperationError:
+            # running in another process, the upsert conflicts with the unique hackathon
+            return None
+
+    def __update_teardown_job(self, job, **counts):
+        """Add counts to the teardown job, refreshing its update time as heartbeat"""
+        updates = dict(("inc__%s" % key, value) for key, value in counts.items())
+        TeardownJob.objects(id=job.id).update_one(set__update_time=self.util.get_now(), **updates)
+
+    def __refresh_container_count(self, host_server):
+        """Recount containers so that the capacity of host server comes back at once"""
+        try:
+            containers = self.hosted_docker_proxy.list_containers(host_server)
+            DockerHostServer.objects(id=host_server.id).update_one(set__container_count=len(containers))
+        except Exception as e:
+            self.log.error(e)
+
     def __recycle_expr(self, expr):
         """recycle expr
 
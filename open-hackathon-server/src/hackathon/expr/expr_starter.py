@@ -43,18 +43,22 @@ class ExprStarter(Component):
         """To start a new Experiment asynchronously
 
         :type context: Context
-        :param context: the execution context.
+        :param context: the execution context. 'experiment' is optional, a new one will be created if not given.
+            'reserved_host_server_id' is optional, the docker host reserved by admission queue
 
         """
-        expr = Experiment(status=EStatus.INIT,
-                          template=context.template,
-                          user=context.user,
-                          virtual_environments=[],
-                          hackathon=context.hackathon)
-        expr.save()
+        expr = context.get("experiment", None)
+        if not expr:
+            expr = Experiment(status=EStatus.INIT,
+                              template=context.template,
+                              user=context.user,
+                              virtual_environments=[],
+                              hackathon=context.hackathon)
+            expr.save()
 
         template_content = self.template_library.load_template(context.template)
         expr.status = EStatus.STARTING
+        expr.update_time = self.util.get_now()
         expr.save()
 
         # context contains complex object, we need create another serializable one with only simple fields
@@ -64,6 +68,8 @@ class ExprStarter(Component):
                               experiment_id=expr.id)
         if context.get("user", None):
             new_context.user_id = context.user.id
+        if context.get("reserved_host_server_id", None):
+            new_context.reserved_host_server_id = context.reserved_host_server_id
         self._internal_start_expr(new_context)
         new_context.experiment = expr
         return new_context
@@ -95,6 +101,18 @@ class ExprStarter(Component):
     def _internal_rollback(self, context):
         raise NotImplementedError()
 
+    def _heartbeat(self, context):
+        """Refresh update time of a starting experiment at every step of starting
+
+        So that a slow but live start is not taken as lost by ExprManager.reconcile_starting_exprs.
+
+        :type context: Context
+        :param context: the execution context which contains 'experiment_id'
+        """
+        if "experiment_id" in context:
+            Experiment.objects(id=context.experiment_id, status=EStatus.STARTING) \
+                .update_one(set__update_time=self.util.get_now())
+
     def _on_virtual_environment_failed(self, context):
         self.rollback(context)
 
@@ -116,7 +134,7 @@ class ExprStarter(Component):
 
         if all(ve.status == VEStatus.STOPPED for ve in expr.virtual_environments):
             expr.status = EStatus.STOPPED
-            expr.save()
+        expr.save()
 
     def _on_virtual_environment_unexpected_error(self, context):
         self.log.warn("experiment unexpected error: " + context.experiment_id)
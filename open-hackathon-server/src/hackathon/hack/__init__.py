@@ -28,7 +28,9 @@ from hackathon_manager import HackathonManager
 from admin_manager import AdminManager
 from team_manager import TeamManager
 from host_server_manager import DockerHostManager
+from docker_host_autoscaler import DockerHostAutoscaler
 from azure_cert_manager import AzureCertManager
 from register_manager import RegisterManager
 from hackathon_template_manager import HackathonTemplateManager
 from cryptor import Cryptor
+from image_manager import ImageManager
@@ -42,6 +42,9 @@ class AdminManager(Component):
     """Component to access/control administrators and judges of hackathon
 
     Operations related to table AdminHackathonRel should be in this file
+
+    Roles of a user are cached(see 'get_user_roles') so that checking admin privilege costs no query. Anything that
+    changes admins or judges must call 'invalidate_user_roles'.
     """
     user_manager = RequiredFeature("user_manager")
     hackathon_manager = RequiredFeature("hackathon_manager")
@@ -60,7 +63,7 @@ class AdminManager(Component):
         if g.user.is_super:
             return True
 
-        return UserHackathon.objects(role=HACK_USER_TYPE.ADMIN, hackathon=g.hackathon, user=g.user).count() > 0
+        return self.get_user_roles(g.user.id)["roles"].get(str(g.hackathon.id)) == HACK_USER_TYPE.ADMIN
 
     def get_entitled_hackathons_list(self, user):
         """Get hackathon id list that specific user is entitled to manage
@@ -132,6 +135,7 @@ class AdminManager(Component):
                 user_hackathon.remark = args.get("remark")
                 user_hackathon.save()
 
+            self.invalidate_user_roles(user.id)
             return ok()
         except Exception as e:
             self.log.error(e)
@@ -154,6 +158,7 @@ class AdminManager(Component):
             return precondition_failed("hackathon creator can not be deleted")
 
         user_hackathon.delete()
+        self.invalidate_user_roles(user_hackathon.user.id)
         return ok()
 
     def update_admin(self, args):
@@ -179,6 +184,7 @@ class AdminManager(Component):
             if 'remark' in args:
                 user_hackathon.remark = args['remark']
             user_hackathon.save()
+            self.invalidate_user_roles(user_hackathon.user.id)
 
             return ok('update hackathon admin successfully')
         except Exception as e:
@@ -197,10 +203,39 @@ class AdminManager(Component):
         :rtype: bool
         :return True if specific user has admin privilidge on specific hackathon otherwise False
         """
-        if User.objects(id=user_id, is_super=True).count():
-            return True
+        roles = self.get_user_roles(user_id)
+        return roles["is_super"] or roles["roles"].get(str(hackathon_id)) == HACK_USER_TYPE.ADMIN
+
+    def get_user_roles(self, user_id):
+        """Get whether user is super admin and their admin or judge roles on hackathons
+
+        Loaded once and cached until 'invalidate_user_roles'. The returned dict is shared, don't modify it.
+
+        :type user_id: string or object_id
+        :param user_id: the id of user
+
+        :rtype: dict
+        :return e.g. {"is_super": False, "roles": {"<hackathon id>": HACK_USER_TYPE.ADMIN}}
+        """
+
+        def __internal_get_roles():
+            user = User.objects(id=user_id).only("is_super").first()
+            rels = UserHackathon.objects(user=user_id, role__in=[HACK_USER_TYPE.ADMIN, HACK_USER_TYPE.JUDGE]).only(
+                "hackathon", "role").no_dereference()
+            return {
+                "is_super": bool(user and user.is_super),
+                "roles": dict((str(rel.hackathon.id), rel.role) for rel in rels)
+            }
+
+        return self.cache.get_cache(key=self.__get_roles_cache_key(user_id), createfunc=__internal_get_roles)
+
+    def invalidate_user_roles(self, user_id):
+        """Drop the cached roles in all processes after admins or judges of user changed
+
+        :type user_id: string or object_id
+        :param user_id: the id of user
+        """
+        self.cache.invalidate(self.__get_roles_cache_key(user_id))
 
-        return UserHackathon.objects(
-            user=user_id,
-            hackathon=hackathon_id,
-            role=HACK_USER_TYPE.ADMIN).count() > 0
+    def __get_roles_cache_key(self, user_id):
+        return "admin_roles_%s" % user_id
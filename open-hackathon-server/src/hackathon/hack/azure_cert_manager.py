@@ -27,6 +27,10 @@ import sys
 sys.path.append('..')
 
 import os
+import fcntl
+import glob
+import hashlib
+from threading import Lock
 from os.path import dirname, realpath, abspath, isfile
 import commands
 
@@ -35,7 +39,7 @@ from hackathon.hmongo.models import Hackathon, AzureKey, Experiment
 
 from hackathon import RequiredFeature, Component, Context, internal_server_error
 from hackathon.hackathon_response import ok, bad_request
-from hackathon.constants import FILE_TYPE
+from hackathon.constants import FILE_TYPE, HACK_STATUS
 
 __all__ = ["AzureCertManager"]
 
@@ -48,9 +52,20 @@ class AzureCertManager(Component):
     The pem file is for azure python SDK. Everytime request from OHP to azure should include the pem cert.
 
     cer file will be saved in different places according to the implementation of storage. But pem file will be saved
+
+    Azure operations read the plaintext pem from a local cache: '<pem_cache_dir>/<azure key id>-<sha256 of pem>.pem'.
+    A missing pem is downloaded and decrypted only once per node(a file lock keeps other workers waiting), written with
+    mode 0600 and checked against AzureKey.pem_hash. Verified paths are kept in memory so that the hot path doesn't
+    touch storage at all. 'warm_up_pem_cache' fills the cache for all keys of online hackathons at startup, and
+    'delete_certificate' removes the cached copies.
     """
 
     storage = RequiredFeature("storage")
+    # (azure key id, pem hash): path of verified local pem, shared by all instances
+    pem_paths = {}
+    pem_paths_lock = Lock()
+    azure_adapter_registry = RequiredFeature("azure_adapter_registry")
+    hackathon_manager = RequiredFeature("hackathon_manager")
 
     def create_certificate(self, subscription_id, management_host, hackathon):
         """Create certificate for specific subscription and hackathon
@@ -100,12 +115,14 @@ class AzureCertManager(Component):
 
             hackathon.azure_keys.append(azure_key)
             hackathon.save()
+            self.hackathon_manager.invalidate_hackathon(hackathon.id)
         else:
             self.log.debug('azure key exists')
 
         if not (azure_key in hackathon.azure_keys):
             hackathon.azure_keys.append(azure_key)
             hackathon.save()
+            self.hackathon_manager.invalidate_hackathon(hackathon.id)
         else:
             self.log.debug('hackathon azure key exists')
 
@@ -133,8 +150,13 @@ class AzureCertManager(Component):
         pem_contex = self.storage.save(pem_contex)
         os.remove(encrypted_pem_url)
         azure_key.pem_url = pem_contex.url
+        azure_key.pem_hash = self.__get_file_hash(pem_url)
 
         azure_key.save()
+        self.__evict_pem_cache(azure_key.id)
+        self.__add_to_pem_cache(azure_key, pem_url)
+        # the certificate may be replaced, adapters built on the old one are useless
+        self.azure_adapter_registry.invalidate(subscription_id, management_host)
 
         return azure_key.dic()
 
@@ -199,6 +221,9 @@ class AzureCertManager(Component):
 
             hackathon.azure_keys.remove(azure_key)
             hackathon.save()
+            self.hackathon_manager.invalidate_hackathon(hackathon.id)
+            self.__evict_pem_cache(azure_key.id)
+            self.azure_adapter_registry.invalidate(azure_key.subscription_id, azure_key.management_host)
 
         return ok(True)
 
@@ -215,9 +240,7 @@ class AzureCertManager(Component):
         if azure_key is None:
             return internal_server_error("No available azure key on the server side.")
 
-        sms = CloudServiceAdapter(azure_key.subscription_id,
-                                  azure_key.get_local_pem_url(),
-                                  host=azure_key.management_host)
+        sms = self.azure_adapter_registry.get_adapter_by_key(azure_key, CloudServiceAdapter)
         if sms.ping():
             azure_key.verified = True
             azure_key.save()
@@ -226,9 +249,38 @@ class AzureCertManager(Component):
 
         return ok("success")
 
+    def get_cached_pem_url(self, azure_key):
+        """Get the path of local decrypted pem file of an AzureKey
+
+        :type azure_key: AzureKey
+        :param azure_key: the azure key whose pem file is needed
+
+        :rtype: str
+        :return: path of the local pem file
+        """
+        if azure_key.pem_hash:
+            path = self.pem_paths.get((str(azure_key.id), azure_key.pem_hash))
+            if path:
+                return path
+
+        with self.pem_paths_lock:
+            return self.__load_pem_cache(azure_key)
+
+    def warm_up_pem_cache(self):
+        """Decrypt pem files of all azure keys of online hackathons into local cache"""
+        for hackathon in Hackathon.objects(status=HACK_STATUS.ONLINE).only("azure_keys"):
+            for azure_key in hackathon.azure_keys:
+                try:
+                    self.get_cached_pem_url(azure_key)
+                except Exception as e:
+                    self.log.error("fail to warm up pem of azure key %s: %r" % (azure_key.id, e))
+
     def __init__(self):
         self.CERT_BASE = self.util.get_config('azure.cert_base')
         self.__ensure_certificates_dir()
+        self.PEM_CACHE_DIR = self.util.safe_get_config("azure.pem_cache_dir", "") or self.CERT_BASE + "/cache"
+        if not os.path.exists(self.PEM_CACHE_DIR):
+            os.makedirs(self.PEM_CACHE_DIR, 0700)
 
     def __ensure_certificates_dir(self):
         """Ensure that the directory to store azure certificate exists"""
@@ -244,19 +296,98 @@ class AzureCertManager(Component):
         cryptor.encrypt(pem_url, encrypted_pem_url)
         return encrypted_pem_url
 
-    def get_local_pem_url(self, pem_url):
-        local_pem_url = self.CERT_BASE + "/" + pem_url.split("/")[-1]
-        if not isfile(local_pem_url):
-            self.log.debug("Recover local %s.pem file from azure storage %s" % (local_pem_url, pem_url))
-            cryptor = RequiredFeature("cryptor")
-            cryptor.recover_local_file(pem_url, local_pem_url)
-        return local_pem_url
-
+    def __load_pem_cache(self, azure_key):
+        """Find a local pem in cache or recover it. Must be called with 'pem_paths_lock' held"""
+        key_id = str(azure_key.id)
+        if azure_key.pem_hash:
+            path = self.__get_pem_cache_path(key_id, azure_key.pem_hash)
+            if self.pem_paths.get((key_id, azure_key.pem_hash)) or self.__verify_pem(path, azure_key.pem_hash):
+                self.pem_paths[(key_id, azure_key.pem_hash)] = path
+                return path
+
+        # one worker downloads and decrypts, the others wait and reuse the result
+        lock_file = open("%s/%s.lock" % (self.PEM_CACHE_DIR, key_id), "w")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            if azure_key.pem_hash:
+                path = self.__get_pem_cache_path(key_id, azure_key.pem_hash)
+                if self.__verify_pem(path, azure_key.pem_hash):
+                    self.pem_paths[(key_id, azure_key.pem_hash)] = path
+                    return path
+
+            return self.__recover_pem(azure_key)
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+            lock_file.close()
+
+    def __recover_pem(self, azure_key):
+        key_id = str(azure_key.id)
+        tmp_path = "%s/%s.tmp" % (self.PEM_CACHE_DIR, key_id)
+        self.log.debug("Recover pem file of azure key %s from storage %s" % (key_id, azure_key.pem_url))
+        cryptor = RequiredFeature("cryptor")
+        old_umask = os.umask(077)
+        try:
+            cryptor.recover_local_file(azure_key.pem_url, tmp_path)
+        finally:
+            os.umask(old_umask)
+
+        if not isfile(tmp_path) or os.path.getsize(tmp_path) == 0:
+            raise Exception("fail to recover pem file of azure key %s" % key_id)
+
+        pem_hash = self.__get_file_hash(tmp_path)
+        if azure_key.pem_hash and azure_key.pem_hash != pem_hash:
+            os.remove(tmp_path)
+            raise Exception("pem file of azure key %s doesn't match its hash" % key_id)
+        if not azure_key.pem_hash:
+            # keys created before pem hash was recorded
+            azure_key.pem_hash = pem_hash
+            azure_key.save()
 
-# recover a pem file from azure
+        path = self.__get_pem_cache_path(key_id, pem_hash)
+        os.rename(tmp_path, path)
+        self.pem_paths[(key_id, pem_hash)] = path
+        return path
+
+    def __add_to_pem_cache(self, azure_key, pem_url):
+        path = self.__get_pem_cache_path(str(azure_key.id), azure_key.pem_hash)
+        tmp_path = path + ".tmp"
+        with open(pem_url, "rb") as src:
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0600)
+            with os.fdopen(fd, "wb") as dst:
+                dst.write(src.read())
+        os.rename(tmp_path, path)
+        with self.pem_paths_lock:
+            self.pem_paths[(str(azure_key.id), azure_key.pem_hash)] = path
+
+    def __evict_pem_cache(self, azure_key_id):
+        key_id = str(azure_key_id)
+        with self.pem_paths_lock:
+            for cache_key in [k for k in self.pem_paths.keys() if k[0] == key_id]:
+                self.pem_paths.pop(cache_key)
+            for path in glob.glob("%s/%s-*.pem" % (self.PEM_CACHE_DIR, key_id)):
+                try:
+                    os.remove(path)
+                except OSError as e:
+                    self.log.error(e)
+
+    def __verify_pem(self, path, pem_hash):
+        return isfile(path) and self.__get_file_hash(path) == pem_hash
+
+    def __get_pem_cache_path(self, key_id, pem_hash):
+        return "%s/%s-%s.pem" % (self.PEM_CACHE_DIR, key_id, pem_hash)
+
+    def __get_file_hash(self, path):
+        sha = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(8192), ""):
+                sha.update(chunk)
+        return sha.hexdigest()
+
+
+# get the local pem file from cache, recover it from storage if not cached
 def get_local_pem_url(azureKey):
     azure_cert_manager = RequiredFeature("azure_cert_manager")
-    return azure_cert_manager.get_local_pem_url(azureKey.pem_url)
+    return azure_cert_manager.get_cached_pem_url(azureKey)
 
 
 AzureKey.get_local_pem_url = get_local_pem_url
@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+#
+# -----------------------------------------------------------------------------------
+# Copyright (c) Microsoft Open Technologies (Shanghai) Co. Ltd.  All rights reserved.
+#
+# The MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import sys
+
+sys.path.append("..")
+import math
+from datetime import timedelta
+from threading import Lock
+
+from hackathon import Component, RequiredFeature
+from hackathon.hmongo.models import Hackathon, DockerHostServer, Experiment, UserHackathon, DockerHostScaleDecision
+from hackathon.constants import DockerHostServerStatus, EStatus, HACK_STATUS, HACK_USER_TYPE, HACKATHON_CONFIG, \
+    CLOUD_PROVIDER
+
+__all__ = ["DockerHostAutoscaler"]
+
+
+class DockerHostAutoscaler(Component):
+    """Provision or decommission docker host VMs ahead of demand
+
+    The demand of every hackathon hosted on azure is forecast from the containers in use, the experiments queued in
+    STARTING, the registered competitors and the event time. Capacity(container slots of ready and booting VMs) is
+    kept above the forecast plus a configurable headroom. Every provision/decommission decision is saved as
+    DockerHostScaleDecision.
+
+    VMs are created and deleted through 'provisioner' which is the docker host manager by default. Anything with
+    methods 'provision_docker_host_vm(hackathon)' and 'decommission_docker_host_vm(host_server)' can take its place,
+    a stub in tests for example.
+
+    Settings under 'dockerhostserver.autoscale' of config.py:
+        enabled: bool, default False
+        interval_minutes: int, how often to evaluate, default 2
+        headroom_ratio: float, extra capacity in ratio of forecast, default 0.2
+        headroom_slots: int, extra container slots, default 5
+        participation_ratio: float, expected ratio of registered competitors starting experiments, default 0.8
+        lead_minutes: int, how early before event start to provision for registered competitors, default 60
+        max_hosts: int, maximum docker host VMs per hackathon, default 10
+        max_provisioning: int, maximum VMs booting at the same time per hackathon, default 1
+        cooldown_minutes: int, minimal minutes after last provision before decommission, default 30
+        provision_timeout_minutes: int, booting VMs older than it are deleted, default 30
+    """
+    provisioner = RequiredFeature("docker_host_manager")
+    # shared by all instances since a new instance is created for every schedule job
+    lock = Lock()
+
+    def is_enabled(self):
+        return self.util.safe_get_config("dockerhostserver.autoscale.enabled", False)
+
+    def schedule_autoscale_job(self):
+        """Add an interval schedule job to evaluate all hackathons"""
+        if not self.is_enabled():
+            return
+        self.scheduler.add_interval(feature="docker_host_autoscaler",
+                                    method="autoscale",
+                                    id="docker_host_autoscale",
+                                    next_run_time=self.util.get_now() + timedelta(seconds=30),
+                                    minutes=self.__get_config("interval_minutes", 2))
+
+    def autoscale(self):
+        """Evaluate every hackathon hosted on azure. Called by schedule job"""
+        for hackathon in Hackathon.objects():
+            if hackathon.config.get(HACKATHON_CONFIG.CLOUD_PROVIDER) != CLOUD_PROVIDER.AZURE:
+                continue
+            try:
+                self.evaluate(hackathon)
+            except Exception as e:
+                self.log.error(e)
+
+    def request_capacity(self, hackathon):
+        """Called when no docker host available for a new experiment
+
+        :rtype: bool
+        :return: True if new docker host VM is booting so that caller can retry later
+        """
+        if not self.is_enabled():
+            return False
+        try:
+            self.evaluate(hackathon)
+        except Exception as e:
+            self.log.error(e)
+        return DockerHostServer.objects(hackathon=hackathon,
+                                        disabled=False,
+                                        state__in=[DockerHostServerStatus.STARTING,
+                                                   DockerHostServerStatus.DOCKER_INIT]).count() > 0
+
+    def evaluate(self, hackathon):
+        """Compare capacity with forecast demand of a hackathon and provision or decommission VMs if needed
+
+        :type hackathon: Hackathon
+        :param hackathon: the hackathon to evaluate
+
+        :rtype: str
+        :return: the action taken: 'provision', 'decommission' or 'hold'
+        """
+        # evaluations of the same hackathon from schedule job and request_capacity must not overlap
+        with self.lock:
+            self.__expire_booting_hosts(hackathon)
+            metrics = self.collect_metrics(hackathon)
+            target = self.forecast(hackathon, metrics)
+            metrics["target_capacity"] = target
+
+            deficit = target - metrics["capacity"]
+            if deficit > 0:
+                return self.__scale_out(hackathon, metrics, deficit)
+            elif deficit < 0:
+                return self.__scale_in(hackathon, metrics, -deficit)
+
+            self.log.debug("docker hosts of hackathon %s hold: %r" % (hackathon.name, metrics))
+            return "hold"
+
+    def collect_metrics(self, hackathon):
+        """Collect signals of supply and demand
+
+        :rtype: dict
+        """
+        hosts = DockerHostServer.objects(hackathon=hackathon, disabled=False)
+        ready = [h for h in hosts if h.state == DockerHostServerStatus.DOCKER_READY]
+        booting = [h for h in hosts if h.state in [DockerHostServerStatus.STARTING, DockerHostServerStatus.DOCKER_INIT]]
+        containers_per_expr = max([t.virtual_environment_count for t in hackathon.templates] or [1])
+
+        return {
+            "hosts": len(hosts),
+            "ready_hosts": len(ready),
+            "booting_hosts": len(booting),
+            "capacity": sum(h.container_max_count for h in ready + booting),
+            "used": sum(h.container_count for h in ready),
+            "starting": Experiment.objects(hackathon=hackathon, status=EStatus.STARTING).count(),
+            "registered": UserHackathon.objects(hackathon=hackathon, role=HACK_USER_TYPE.COMPETITOR).count(),
+            "containers_per_expr": containers_per_expr
+        }
+
+    def forecast(self, hackathon, metrics):
+        """Forecast container slots needed for a hackathon, headroom included
+
+        No capacity is needed once the event ended or the hackathon is not online. Before the lead time of event start,
+        only the containers in use or starting are counted. From then on, registered competitors are expected to start
+        experiments in 'participation_ratio'.
+
+        :rtype: int
+        """
+        now = self.util.get_now()
+        if hackathon.status != HACK_STATUS.ONLINE or (hackathon.event_end_time and hackathon.event_end_time < now):
+            return 0
+
+        cpe = metrics["containers_per_expr"]
+        demand = metrics["used"] + metrics["starting"] * cpe
+        lead = timedelta(minutes=self.__get_config("lead_minutes", 60))
+        if not hackathon.event_start_time or hackathon.event_start_time - lead <= now:
+            expected = int(math.ceil(metrics["registered"] * self.__get_config("participation_ratio", 0.8))) * cpe
+            demand = max(demand, expected)
+
+        if demand == 0:
+            return 0
+        return int(math.ceil(demand * (1 + self.__get_config("headroom_ratio", 0.2)))) + \
+            self.__get_config("headroom_slots", 5)
+
+    def get_decision_log(self, hackathon, limit=50):
+        """Get latest autoscale decisions of a hackathon
+
+        :rtype: list
+        """
+        decisions = DockerHostScaleDecision.objects(hackathon=hackathon).order_by("-create_time")[:limit]
+        return [d.dic() for d in decisions]
+
+    def __scale_out(self, hackathon, metrics, deficit):
+        slots_per_vm = self.util.safe_get_config("dockerhostserver.vm.container_max_count", 50)
+        wanted = int(math.ceil(float(deficit) / slots_per_vm))
+        allowed = min(self.__get_config("max_provisioning", 1) - metrics["booting_hosts"],
+                      self.__get_config("max_hosts", 10) - metrics["hosts"])
+        count = min(wanted, allowed)
+        if count <= 0:
+            self.log.debug("hackathon %s needs %d more VMs but limit reached: %r" % (hackathon.name, wanted, metrics))
+            return "hold"
+
+        provisioned = 0
+        for i in range(count):
+            if self.provisioner.provision_docker_host_vm(hackathon):
+                provisioned += 1
+        if provisioned:
+            self.__record(hackathon, "provision", provisioned, metrics,
+                          reason="%d container slots short of target" % deficit)
+            return "provision"
+
+        self.__record(hackathon, "failed", count, metrics, reason="fail to provision docker host VM")
+        return "hold"
+
+    def __scale_in(self, hackathon, metrics, surplus):
+        last_provision = DockerHostScaleDecision.objects(hackathon=hackathon, action="provision") \
+            .order_by("-create_time").first()
+        cooldown = timedelta(minutes=self.__get_config("cooldown_minutes", 30))
+        if last_provision and last_provision.create_time + cooldown > self.util.get_now():
+            return "hold"
+
+        # only idle VMs started by autoscaler, one at a time
+        idle = DockerHostServer.objects(hackathon=hackathon,
+                                        disabled=False,
+                                        is_auto=True,
+                                        container_count=0,
+                                        state=DockerHostServerStatus.DOCKER_READY)
+        for host_server in idle:
+            if host_server.container_max_count > surplus:
+                continue
+            # disable it first so that no container will be placed on it
+            host_server.disabled = True
+            host_server.save()
+            if self.provisioner.decommission_docker_host_vm(host_server):
+                self.__record(hackathon, "decommission", 1, metrics, host_server_name=host_server.vm_name,
+                              reason="%d container slots above target" % surplus)
+                return "decommission"
+
+            host_server.disabled = False
+            host_server.save()
+            self.__record(hackathon, "failed", 1, metrics, host_server_name=host_server.vm_name,
+                          reason="fail to decommission docker host VM")
+            break
+
+        return "hold"
+
+    def __expire_booting_hosts(self, hackathon):
+        """Delete VMs that stay in booting too long so that they are neither counted as capacity nor billed any more
+
+        An expired VM is disabled and marked UNAVAILABLE first, then deleted on azure. If azure refuses the deletion,
+        it's retried in next evaluation.
+        """
+        timeout = timedelta(minutes=self.__get_config("provision_timeout_minutes", 30))
+        expired = DockerHostServer.objects(hackathon=hackathon,
+                                           is_auto=True,
+                                           state__in=[DockerHostServerStatus.STARTING,
+                                                      DockerHostServerStatus.DOCKER_INIT],
+                                           create_time__lt=self.util.get_now() - timeout)
+        for host_server in expired:
+            host_server.state = DockerHostServerStatus.UNAVAILABLE
+            host_server.disabled = True
+            host_server.save()
+            self.__record(hackathon, "timeout", 1, {}, host_server_name=host_server.vm_name,
+                          reason="docker host VM not ready in time")
+
+        # expired just now as well as those failed to delete before
+        to_delete = DockerHostServer.objects(hackathon=hackathon,
+                                             is_auto=True,
+                                             disabled=True,
+                                             state=DockerHostServerStatus.UNAVAILABLE)
+        for host_server in to_delete:
+            if self.provisioner.decommission_docker_host_vm(host_server):
+                self.__record(hackathon, "decommission", 1, {}, host_server_name=host_server.vm_name,
+                              reason="delete docker host VM not ready in time")
+            else:
+                self.__record(hackathon, "failed", 1, {}, host_server_name=host_server.vm_name,
+                              reason="fail to delete docker host VM not ready in time")
+
+    def __record(self, hackathon, action, count, metrics, reason=None, host_server_name=None):
+        self.log.debug("docker host autoscale of hackathon %s: %s %d, %s" % (hackathon.name, action, count, reason))
+        DockerHostScaleDecision(hackathon=hackathon,
+                                action=action,
+                                count=count,
+                                host_server_name=host_server_name,
+                                reason=reason,
+                                metrics=metrics,
+                                create_time=self.util.get_now()).save()
+
+    def __get_config(self, key, default):
+        return self.util.safe_get_config("dockerhostserver.autoscale." + key, default)
@@ -41,7 +41,7 @@ from hackathon.hmongo.models import Hackathon, UserHackathon, DockerHostServer,
 from hackathon.hackathon_response import internal_server_error, ok, not_found, general_error, HTTP_CODE, bad_request
 from hackathon.constants import HACKATHON_CONFIG, HACK_USER_TYPE, HACK_STATUS, HACK_USER_STATUS, HTTP_HEADER, \
     FILE_TYPE, HACK_TYPE, HACKATHON_STAT, DockerHostServerStatus, HACK_NOTICE_CATEGORY, HACK_NOTICE_EVENT, \
-    ORGANIZATION_TYPE, CLOUD_PROVIDER
+    ORGANIZATION_TYPE, CLOUD_PROVIDER, IMAGE_VARIANT
 from hackathon import RequiredFeature, Component, Context
 
 docker_host_manager = RequiredFeature("docker_host_manager")
@@ -60,6 +60,8 @@ class HackathonManager(Component):
     admin_manager = RequiredFeature("admin_manager")
     user_manager = RequiredFeature("user_manager")
     register_manager = RequiredFeature("register_manager")
+    expr_manager = RequiredFeature("expr_manager")
+    image_manager = RequiredFeature("image_manager")
 
     # basic xss prevention
     cleaner = Cleaner(safe_attrs=lxml.html.defs.safe_attrs | set(['style']))  # preserve style
@@ -92,16 +94,40 @@ class HackathonManager(Component):
         if not name:
             return None
 
-        return Hackathon.objects(name=name).first()
+        def __internal_get_id():
+            hackathon = Hackathon.objects(name=name).only("id").first()
+            return str(hackathon.id) if hackathon else None
+
+        hackathon_id = self.cache.get_cache(key="hackathon_registry_name_%s" % name, createfunc=__internal_get_id)
+        return self.get_hackathon_by_id(hackathon_id) if hackathon_id else None
 
     def get_hackathon_by_id(self, hackathon_id):
         """Query hackathon by id
+
+        Served from cache. The document is cached as raw data and a new Hackathon instance is built for every call,
+        so it can be modified and saved as if it's loaded from mongodb. Call 'invalidate_hackathon' after updating it.
+
         :type hackathon_id: str or ObjectId are both ok
         :param hackathon_id: _id of hackathon
 
         :return hackathon instance or None
         """
-        return Hackathon.objects(id=hackathon_id).first()
+
+        def __internal_get_hackathon():
+            hackathon = Hackathon.objects(id=hackathon_id).first()
+            return hackathon.to_mongo().to_dict() if hackathon else None
+
+        data = self.cache.get_cache(key=self.__get_registry_cache_key(hackathon_id),
+                                    createfunc=__internal_get_hackathon)
+        return Hackathon._from_son(data) if data else None
+
+    def invalidate_hackathon(self, hackathon_id):
+        """Drop the cached hackathon in all processes after it's changed
+
+        :type hackathon_id: str or ObjectId are both ok
+        :param hackathon_id: _id of hackathon
+        """
+        self.cache.invalidate(self.__get_registry_cache_key(hackathon_id))
 
     def get_hackathon_detail(self, hackathon):
         user = None
@@ -210,6 +236,7 @@ class HackathonManager(Component):
         hackathon.save()
 
         self.cache.invalidate(self.__get_config_cache_key(hackathon))
+        self.invalidate_hackathon(hackathon.id)
         return ok()
 
     def delete_basic_property(self, hackathon, keys):
@@ -220,6 +247,7 @@ class HackathonManager(Component):
 
         hackathon.save()
         self.cache.invalidate(self.__get_config_cache_key(hackathon))
+        self.invalidate_hackathon(hackathon.id)
         return ok()
 
     def get_recycle_minutes(self, hackathon):
@@ -231,7 +259,7 @@ class HackathonManager(Component):
         if HTTP_HEADER.HACKATHON_NAME in request.headers:
             try:
                 hackathon_name = request.headers[HTTP_HEADER.HACKATHON_NAME]
-                hackathon = Hackathon.objects(name=hackathon_name).first()
+                hackathon = self.get_hackathon_by_name(hackathon_name)
                 if hackathon:
                     g.hackathon = hackathon
                     return True
@@ -261,6 +289,8 @@ class HackathonManager(Component):
 
         self.log.debug("add a new hackathon:" + context.name)
         new_hack = self.__create_hackathon(g.user, context)
+        # the name might be cached as not found
+        self.cache.invalidate("hackathon_registry_name_%s" % new_hack.name)
 
         self.create_hackathon_notice(new_hack.id, HACK_NOTICE_EVENT.HACK_CREATE,
                                      HACK_NOTICE_CATEGORY.HACKATHON)  # hackathon create
@@ -297,6 +327,13 @@ class HackathonManager(Component):
 
             hackathon.modify(**update_items)
             hackathon.save()
+            self.invalidate_hackathon(hackathon.id)
+
+            if 'banners' in update_items:
+                self.image_manager.refresh_banner_derivatives(hackathon)
+
+            if 'event_end_time' in update_items:
+                self.schedule_teardown_expr_job(hackathon)
 
             return ok()
         except Exception as e:
@@ -407,6 +444,7 @@ class HackathonManager(Component):
         hackathon.organizers.append(organizer)
         hackathon.update_time = self.util.get_now()
         hackathon.save()
+        self.invalidate_hackathon(hackathon.id)
         return hackathon.dic()
 
     def update_hackathon_organizer(self, hackathon, body):
@@ -422,6 +460,7 @@ class HackathonManager(Component):
 
         hackathon.update_time = self.util.get_now()
         hackathon.save()
+        self.invalidate_hackathon(hackathon.id)
         return hackathon.dic()
 
     def delete_hackathon_organizer(self, hackathon, organizer_id):
@@ -430,6 +469,7 @@ class HackathonManager(Component):
 
         hackathon.update_time = self.util.get_now()
         hackathon.save()
+        self.invalidate_hackathon(hackathon.id)
         return ok()
 
     def create_hackathon_award(self, hackathon, body):
@@ -447,6 +487,7 @@ class HackathonManager(Component):
 
         hackathon.update_time = self.util.get_now()
         hackathon.save()
+        self.invalidate_hackathon(hackathon.id)
         return ok()
 
     def update_hackathon_award(self, hackathon, body):
@@ -469,6 +510,7 @@ class HackathonManager(Component):
 
         hackathon.update_time = self.util.get_now()
         hackathon.save()
+        self.invalidate_hackathon(hackathon.id)
         return ok()
 
     def delete_hackathon_award(self, hackathon, award_id):
@@ -476,6 +518,7 @@ class HackathonManager(Component):
         hackathon.update(pull__awards=award)
         hackathon.update_time = self.util.get_now()
         hackathon.save()
+        self.invalidate_hackathon(hackathon.id)
 
         # delete granted award in teams
         award_uuid = uuid.UUID(award_id)
@@ -729,6 +772,14 @@ class HackathonManager(Component):
                                     next_run_time=next_run_time,
                                     minutes=20)
 
+    def schedule_teardown_expr_job(self, hackathon):
+        """Add a schedule job to stop all experiments of an online hackathon in bulk once its event ends"""
+        if hackathon.status != HACK_STATUS.ONLINE or not hackathon.event_end_time:
+            return
+        if hackathon.event_end_time < self.util.get_now():
+            return
+        self.expr_manager.schedule_teardown_hackathon(hackathon, run_date=hackathon.event_end_time)
+
     def __is_pre_allocate_enabled(self, hackathon):
         if hackathon.event_end_time < self.util.get_now():
             return False
@@ -748,6 +799,10 @@ class HackathonManager(Component):
         """
         hackathon_list = Hackathon.objects()
         for hack in hackathon_list:
+            # hackathons online before teardown job introduced
+            if not self.scheduler.has_job("teardown_expr_at_end_%s" % hack.id):
+                self.schedule_teardown_expr_job(hack)
+
             job_id = "pre_allocate_expr_" + str(hack.id)
             is_job_exists = self.scheduler.has_job(job_id)
             if self.__is_pre_allocate_enabled(hack):
@@ -789,8 +844,10 @@ class HackathonManager(Component):
         if req.get('error') is None:
             hackathon.status = HACK_STATUS.ONLINE
             hackathon.save()
+            self.invalidate_hackathon(hackathon.id)
             self.create_hackathon_notice(hackathon.id, HACK_NOTICE_EVENT.HACK_ONLINE,
                                          HACK_NOTICE_CATEGORY.HACKATHON)  # hackathon online
+            self.schedule_teardown_expr_job(hackathon)
 
         return req
 
@@ -799,8 +856,11 @@ class HackathonManager(Component):
         if hackathon.status == HACK_STATUS.ONLINE or hackathon.status == HACK_STATUS.DRAFT:
             hackathon.status = HACK_STATUS.OFFLINE
             hackathon.save()
+            self.invalidate_hackathon(hackathon.id)
             self.create_hackathon_notice(hackathon.id, HACK_NOTICE_EVENT.HACK_OFFLINE,
                                          HACK_NOTICE_CATEGORY.HACKATHON)  # hackathon offline
+            # give the resources back at once instead of waiting for recycle
+            self.expr_manager.schedule_teardown_hackathon(hackathon)
 
         elif hackathon.status == HACK_STATUS.INIT:
             req = general_error(code=HTTP_CODE.CREATE_NOT_FINISHED)
@@ -847,6 +907,9 @@ class HackathonManager(Component):
     def __fill_hackathon_detail(self, hackathon, user, hackathon_stat, user_hackathon, team):
         """Return hackathon info as well as its details including configs, stat, organizers, like if user logon"""
         detail = hackathon.dic()
+        # small banners for list page
+        detail["banners"] = self.image_manager.get_banner_urls(hackathon, IMAGE_VARIANT.CARD)
+        detail.pop("banner_derivatives", None)
 
         detail["stat"] = {
             "register": 0,
@@ -859,7 +922,7 @@ class HackathonManager(Component):
                 detail["stat"]["like"] = stat.count
 
         if user:
-            detail['user'] = self.user_manager.user_display_info(user)
+            detail['user'] = self.user_manager.user_display_info(user, IMAGE_VARIANT.THUMBNAIL)
             detail['user']['admin'] = user.is_super
             if user_hackathon:
                 for uh in user_hackathon:
@@ -916,6 +979,7 @@ class HackathonManager(Component):
         if new_hack.description:  # case None type
             new_hack.description = self.cleaner.clean_html(new_hack.description)
         new_hack.save()
+        self.image_manager.refresh_banner_derivatives(new_hack)
 
         # add the current login user as admin and creator
         try:
@@ -925,6 +989,7 @@ class HackathonManager(Component):
                                   status=HACK_USER_STATUS.AUTO_PASSED,
                                   remark='creator')
             admin.save()
+            self.admin_manager.invalidate_user_roles(creator.id)
         except Exception as ex:
             # TODO: send out a email to remind administrator to deal with this problems
             self.log.error(ex)
@@ -1010,6 +1075,9 @@ class HackathonManager(Component):
     def __get_config_cache_key(self, hackathon):
         return "hackathon_config_%s" % hackathon.id
 
+    def __get_registry_cache_key(self, hackathon_id):
+        return "hackathon_registry_id_%s" % hackathon_id
+
     def __create_default_data_for_local(self, hackathon):
         """
         create test data for new hackathon. It's for local development only
@@ -45,7 +45,7 @@ class HackathonTemplateManager(Component):
     team_manager = RequiredFeature("team_manager")
     hackathon_manager = RequiredFeature("hackathon_manager")
     template_library = RequiredFeature("template_library")
-    hosted_docker = RequiredFeature("hosted_docker")
+    hosted_docker = RequiredFeature("hosted_docker_proxy")
 
     def add_template_to_hackathon(self, template_id):
         try:
@@ -57,6 +57,7 @@ class HackathonTemplateManager(Component):
             if not (template in g.hackathon.templates):
                 g.hackathon.templates.append(template)
                 g.hackathon.save()
+                self.hackathon_manager.invalidate_hackathon(g.hackathon.id)
 
             return self.get_templates_with_detail_by_hackathon(g.hackathon)
 
@@ -72,6 +73,7 @@ class HackathonTemplateManager(Component):
         if template in g.hackathon.templates:
             g.hackathon.templates.remove(template)
             g.hackathon.save()
+            self.hackathon_manager.invalidate_hackathon(g.hackathon.id)
 
         # self.db.delete_object(htr)
         return self.get_templates_with_detail_by_hackathon(g.hackathon)
@@ -118,7 +120,7 @@ class HackathonTemplateManager(Component):
                 context = Context(image=image,
                                   tag=tag,
                                   docker_host=docker_host.id)
-                self.scheduler.add_once(feature="hosted_docker",
+                self.scheduler.add_once(feature="hosted_docker_proxy",
                                         method="pull_image",
                                         context=context,
                                         seconds=3)
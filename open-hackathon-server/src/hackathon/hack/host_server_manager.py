@@ -35,7 +35,7 @@ sys.path.append("..")
 
 from azure.storage.blob import BlobService
 from azure.servicemanagement import (ConfigurationSet, ConfigurationSetInputEndpoint, OSVirtualHardDisk,
-                                     LinuxConfigurationSet, ServiceManagementService)
+                                     LinuxConfigurationSet)
 
 from hackathon import Component, RequiredFeature, Context
 from hackathon.hmongo.models import DockerHostServer, Hackathon, AzureKey
@@ -52,6 +52,8 @@ class DockerHostManager(Component):
     """Component to manage docker host server"""
     docker = RequiredFeature("hosted_docker_proxy")
     expr_manager = RequiredFeature("expr_manager")
+    docker_host_autoscaler = RequiredFeature("docker_host_autoscaler")
+    azure_adapter_registry = RequiredFeature("azure_adapter_registry")
 
     def get_docker_hosts_list(self, hackathon):
         """
@@ -65,9 +67,16 @@ class DockerHostManager(Component):
         host_servers = DockerHostServer.objects(hackathon=hackathon)
         return [host_server.dic() for host_server in host_servers]
 
-    def get_available_docker_host(self, hackathon):
+    def get_available_docker_host(self, hackathon, reserved_host_id=None):
+        """Get an available docker host of hackathon
+
+        :type reserved_host_id: ObjectId | None
+        :param reserved_host_id: id of the host reserved by admission queue, taken first if still available
+        """
         vms = DockerHostServer.objects.filter(__raw__={'$where': 'this.container_count+1 < this.container_max_count'}) \
             .filter(hackathon=hackathon, state=DockerHostServerStatus.DOCKER_READY, disabled=False).all()
+        if reserved_host_id:
+            vms = sorted(vms, key=lambda h: str(h.id) != str(reserved_host_id))
 
         if self.util.is_local():
             if len(vms) > 0:
@@ -102,9 +111,7 @@ class DockerHostManager(Component):
     def is_host_server_locked(self, docker_host):
         # todo which azure key to use?
         azure_key = docker_host.hackathon.azure_keys[0]
-        cloudservice = CloudServiceAdapter(azure_key.subscription_id,
-                                           azure_key.get_local_pem_url(),
-                                           host=azure_key.management_host)
+        cloudservice = self.azure_adapter_registry.get_adapter_by_key(azure_key, CloudServiceAdapter)
         service_name = docker_host.public_dns.split(".")[0]
         return cloudservice.is_cloud_service_locked(service_name)
 
@@ -133,9 +140,27 @@ class DockerHostManager(Component):
                 self.log.error('Schedule pre-allocate host server for hackathon:%s failed.' % hackathon.name)
 
     def start_new_docker_host_vm(self, hackathon):
+        """
+        ask for more docker host VM when no host server available for hackathon
+
+        VMs are provisioned ahead of demand by docker_host_autoscaler which makes sure no more VMs than needed are
+        starting at the same time.
+
+        :param hackathon: hackathon
+        :type hackathon: Hackathon
+
+        :return: True if a new VM is starting for the hackathon, otherwise False
+        :rtype: bool
+        """
+        return self.docker_host_autoscaler.request_capacity(hackathon)
+
+    def provision_docker_host_vm(self, hackathon):
         """
         create docker host VM for hackathon whose id is hackathon_id
 
+        A DockerHostServer in state STARTING is saved once Azure accepts the request, and updated by check_vm_status
+        when the VM is ready.
+
         :param hackathon: hackathon
         :type hackathon: Hackathon
 
@@ -144,13 +169,10 @@ class DockerHostManager(Component):
          Otherwise, False
         :rtype: bool
         """
-        # todo debug this logic and make sure DON'T start two or more VM at the same time
-        return False
-
         hackathon_id = hackathon.id
         sms = self.__get_sms_object(hackathon_id)
         if sms is None:
-            self.log.error('No Azure account found for Hackathon:%d' % hackathon_id)
+            self.log.error('No Azure account found for Hackathon:%s' % hackathon_id)
             return False
         # get storage and container
         res, storage_account_name, container_name = self.__get_available_storage_account_and_container(hackathon_id)
@@ -210,13 +232,56 @@ class DockerHostManager(Component):
             except Exception as e:
                 self.log.error(e)
                 return False
+        # placeholder of the booting VM so that its capacity is counted
+        host_server = DockerHostServer(vm_name=host_name,
+                                       public_dns="%s.chinacloudapp.cn" % service_name,
+                                       container_count=0,
+                                       container_max_count=self.util.safe_get_config(
+                                           'dockerhostserver.vm.container_max_count', 50),
+                                       is_auto=True,
+                                       state=DockerHostServerStatus.STARTING,
+                                       disabled=False,
+                                       hackathon=hackathon,
+                                       create_time=self.util.get_now())
+        host_server.save()
+
         # storage parameters in context
         context = Context(hackathon_id=hackathon_id, request_id=result.request_id,
                           service_name=service_name, role_name=host_name,
                           deployment_name=service_name, deployment_slot=deployment_slot,
-                          host_name=host_name)
+                          host_name=host_name, host_server_id=host_server.id)
         # start schedule
-        self.sche.add_once('docker_host_manager', 'check_vm_status', context=context, minutes=5)
+        self.scheduler.add_once('docker_host_manager', 'check_vm_status', context=context, minutes=5)
+        return True
+
+    def decommission_docker_host_vm(self, host_server):
+        """
+        delete a docker host VM created by provision_docker_host_vm as well as its record in DB
+
+        :param host_server: the docker host server to delete, make sure no container running on it
+        :type host_server: DockerHostServer
+
+        :return: True if Azure accepts the deleting request
+        :rtype: bool
+        """
+        sms = self.__get_sms_object(host_server.hackathon.id)
+        if sms is None:
+            return False
+
+        service_name = host_server.public_dns.split(".")[0]
+        try:
+            deployment = sms.get_deployment_by_slot(service_name, ServiceDeploymentSlot.PRODUCTION)
+            if len(deployment.role_list.roles) > 1:
+                sms.delete_role(service_name, deployment.name, host_server.vm_name, complete=True)
+            else:
+                # the last VM of a deployment can only be deleted with the deployment
+                sms.delete_deployment(service_name, deployment.name, delete_vhd=True)
+            self.log.debug('To delete VM:%s in service:%s.' % (host_server.vm_name, service_name))
+        except Exception as e:
+            self.log.error(e)
+            return False
+
+        host_server.delete()
         return True
 
     def add_host_server(self, hackathon, args):
@@ -363,7 +428,7 @@ class DockerHostManager(Component):
         assert context.get('host_name')
         sms = self.__get_sms_object(context.hackathon_id)
         if sms is None:
-            self.log.error('Something wrong with Azure account of Hackathon:%d' % context.hackathon_id)
+            self.log.error('Something wrong with Azure account of Hackathon:%s' % context.hackathon_id)
             return
         # check Azure vm creation operation status
         result = sms.get_operation_status(context.request_id)
@@ -406,25 +471,32 @@ class DockerHostManager(Component):
         except Exception as e:
             self.log.error(e)
             return
-        # add this VM to db
+        # update the VM saved when provisioning
         self.log.debug(public_dns)
-        db_object = self.db.add_object_kwargs(DockerHostServer, vm_name=context.host_name, public_dns=public_dns,
-                                              public_ip=public_ip, public_docker_api_port=public_docker_api_port,
-                                              private_ip=private_ip, private_docker_api_port=private_docker_api_port,
-                                              container_count=0, is_auto=True, state=state,
-                                              disable=False,
-                                              container_max_count=self.util.safe_get_config(
-                                                  'dockerhostserver.vm.container_max_count', 50),
-                                              hackathon_id=context.hackathon_id)
-        self.db.commit()
+        host_server = DockerHostServer.objects(id=context.get("host_server_id")).first()
+        if host_server is None:
+            host_server = DockerHostServer(vm_name=context.host_name,
+                                           container_count=0,
+                                           is_auto=True,
+                                           disabled=False,
+                                           container_max_count=self.util.safe_get_config(
+                                               'dockerhostserver.vm.container_max_count', 50),
+                                           hackathon=Hackathon.objects(id=context.hackathon_id).first())
+        host_server.public_dns = public_dns
+        host_server.public_ip = public_ip
+        host_server.public_docker_api_port = public_docker_api_port
+        host_server.private_ip = private_ip
+        host_server.private_docker_api_port = private_docker_api_port
+        host_server.state = state
+        host_server.save()
         # check docker _ping port
         try:
             ping_url = 'http://%s:%d/_ping' % (public_ip, public_docker_api_port)
             req = requests.get(ping_url)
             self.log.debug(req.content)
             if req.status_code == 200 and req.content == DockerPingResult.OK:
-                self.db.update_object(db_object, state=DockerHostServerStatus.DOCKER_READY)
-                self.db.commit()
+                host_server.state = DockerHostServerStatus.DOCKER_READY
+                host_server.save()
         except Exception as e:
             self.log.error(e)
 
@@ -457,20 +529,17 @@ class DockerHostManager(Component):
         :param hackathon_id: the id of hackathon
         :type hackathon_id: integer
 
-        :return: ServiceManagementService object
-        :rtype: class 'azure.servicemanagement.servicemanagementservice.ServiceManagementService'
+        :return: cached adapter which delegates to ServiceManagementService
+        :rtype: CloudServiceAdapter
         """
         hackathon_azure_keys = Hackathon.objects(id=hackathon_id).first().azure_keys
 
         if len(hackathon_azure_keys) == 0:
-            self.log.error('Found no azure key with Hackathon:%d' % hackathon_id)
+            self.log.error('Found no azure key with Hackathon:%s' % hackathon_id)
             return None
 
         hackathon_azure_key = hackathon_azure_keys[0]
-        sms = ServiceManagementService(hackathon_azure_key.subscription_id,
-                                       hackathon_azure_key.get_local_pem_url(),
-                                       host=hackathon_azure_key.management_host)
-        return sms
+        return self.azure_adapter_registry.get_adapter_by_key(hackathon_azure_key, CloudServiceAdapter)
 
     def __get_available_storage_account_and_container(self, hackathon_id):
         """
@@ -486,7 +555,7 @@ class DockerHostManager(Component):
         container_name = self.util.safe_get_config('dockerhostserver.azure.container', 'dockerhostprivatecontainer')
         sms = self.__get_sms_object(hackathon_id)
         if sms is None:
-            self.log.error('Something wrong with Azure account of Hackathon:%d' % hackathon_id)
+            self.log.error('Something wrong with Azure account of Hackathon:%s' % hackathon_id)
             return False, None, None
         storage_accounts = sms.list_storage_accounts()
         # check storage account one by one, return True once find a qualified one
@@ -534,7 +603,7 @@ class DockerHostManager(Component):
         service_location = self.util.safe_get_config('dockerhostserver.azure.cloud_service.location', 'China East')
         sms = self.__get_sms_object(hackathon_id)
         if sms is None:
-            self.log.error('Something wrong with Azure account of Hackathon:%d' % hackathon_id)
+            self.log.error('Something wrong with Azure account of Hackathon:%s' % hackathon_id)
             return False, None
         try:
             sms.get_hosted_service_properties(service_name, True)
@@ -592,8 +661,8 @@ class DockerHostManager(Component):
         """
         sms = self.__get_sms_object(hackathon_id)
         if sms is None:
-            self.log.error('Something wrong with Azure account of Hackathon:%d' % hackathon_id)
-            raise Exception('Something wrong with Azure account of Hackathon:%d' % hackathon_id)
+            self.log.error('Something wrong with Azure account of Hackathon:%s' % hackathon_id)
+            raise Exception('Something wrong with Azure account of Hackathon:%s' % hackathon_id)
         endpoints = []
         properties = sms.get_hosted_service_properties(service_name, True)
         for deployment in properties.deployments.deployments:
@@ -665,8 +734,8 @@ class DockerHostManager(Component):
         """
         sms = self.__get_sms_object(hackathon_id)
         if sms is None:
-            self.log.error('Something wrong with Azure account of Hackathon:%d' % hackathon_id)
-            raise Exception('Something wrong with Azure account of Hackathon:%d' % hackathon_id)
+            self.log.error('Something wrong with Azure account of Hackathon:%s' % hackathon_id)
+            raise Exception('Something wrong with Azure account of Hackathon:%s' % hackathon_id)
         try:
             sms.get_deployment_by_slot(service_name, deployment_slot)
             return True
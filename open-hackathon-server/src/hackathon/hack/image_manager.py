@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) Microsoft Open Technologies (Shanghai) Co. Ltd.  All rights reserved.
+
+The MIT License (MIT)
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+import sys
+
+sys.path.append('..')
+
+import hashlib
+from cStringIO import StringIO
+from os.path import basename, splitext
+from PIL import Image, ImageOps
+from werkzeug.datastructures import FileStorage
+
+from hackathon.hmongo.models import User, Hackathon, Team, ImageDerivative
+from hackathon import RequiredFeature, Component, Context
+from hackathon.constants import FILE_TYPE, IMAGE_VARIANT, IMAGE_TARGET
+
+__all__ = ["ImageManager"]
+
+# target -> (model, query of the original url, field of derivative, variants)
+TARGETS = {
+    IMAGE_TARGET.USER_AVATAR: (User, "profile__avatar_url", "profile__avatar_derivative", [IMAGE_VARIANT.THUMBNAIL]),
+    IMAGE_TARGET.HACKATHON_BANNER: (Hackathon, "banners", "banner_derivatives",
+                                    [IMAGE_VARIANT.CARD, IMAGE_VARIANT.BANNER]),
+    IMAGE_TARGET.TEAM_LOGO: (Team, "logo", "logo_derivative", [IMAGE_VARIANT.THUMBNAIL]),
+    IMAGE_TARGET.TEAM_COVER: (Team, "cover", "cover_derivative", [IMAGE_VARIANT.CARD])
+}
+
+DEFAULT_SIZES = {
+    IMAGE_VARIANT.THUMBNAIL: [128, 128],
+    IMAGE_VARIANT.CARD: [480, 270],
+    IMAGE_VARIANT.BANNER: [1280, 400]
+}
+
+
+class ImageManager(Component):
+    """Generate resized copies(derivatives) of avatars, hackathon banners and team logos/covers
+
+    Derivatives are generated by a schedule job after the image url of a document is updated, saved through storage
+    and recorded on the document as ImageDerivative which keeps the original url. List apis then return the url of a
+    small variant instead of the original one. A derivative is recorded only if the document still refers to the
+    original url, and is never returned for another url, so the original is used until the derivative is ready.
+    """
+    storage = RequiredFeature("storage")
+    scheduler = RequiredFeature("scheduler")
+    hackathon_manager = RequiredFeature("hackathon_manager")
+
+    def schedule_derivatives(self, target, doc_id, url):
+        """Generate derivatives of an image in background
+
+        :type target: str|unicode
+        :param target: which image field, see IMAGE_TARGET in constants.py
+
+        :type doc_id: str|unicode|ObjectId
+        :param doc_id: id of the User, Hackathon or Team
+
+        :type url: str|unicode
+        :param url: url of the original image
+        """
+        if not url or not self.util.safe_get_config("image.derivative.enabled", True):
+            return
+
+        job_id = "image_derivative_%s_%s_%s" % (target, doc_id, hashlib.md5(url).hexdigest())
+        context = Context(target=target, doc_id=str(doc_id), url=url)
+        self.scheduler.add_once("image_manager", "generate_derivatives", context=context, id=job_id, seconds=1)
+
+    def refresh_banner_derivatives(self, hackathon):
+        """Drop derivatives of removed banners and generate derivatives for new banners
+
+        :type hackathon: Hackathon
+        """
+        banners = hackathon.banners or []
+        kept = [d for d in hackathon.banner_derivatives if d.url in banners]
+        removed = [d for d in hackathon.banner_derivatives if d.url not in banners]
+        if removed:
+            hackathon.update(set__banner_derivatives=kept)
+            self.hackathon_manager.invalidate_hackathon(hackathon.id)
+            for derivative in removed:
+                self.__delete_variants(derivative)
+
+        ready = [d.url for d in kept]
+        for url in banners:
+            if url not in ready:
+                self.schedule_derivatives(IMAGE_TARGET.HACKATHON_BANNER, hackathon.id, url)
+
+    def generate_derivatives(self, context):
+        """Resize the original image and record derivatives on the document. Called by schedule job
+
+        :type context: Context
+        :param context: must contain target, doc_id and url
+        """
+        model, url_field, derivative_field, variants = TARGETS[context.target]
+        try:
+            image = Image.open(StringIO("".join(self.storage.open_stream(context.url))))
+            image.load()
+        except Exception as e:
+            # for example, an avatar from oauth provider that is not saved in our storage
+            self.log.debug("cannot generate derivatives of %s: %s" % (context.url, e))
+            return
+
+        derivative = ImageDerivative(url=context.url, variants={})
+        for variant in variants:
+            derivative.variants[variant] = self.__save_variant(image, context.url, variant)
+
+        query = {"id": context.doc_id, url_field: context.url}
+        if model is Hackathon:
+            query["banner_derivatives__url__ne"] = context.url
+            recorded = model.objects(**query).update_one(push__banner_derivatives=derivative)
+            if recorded:
+                self.hackathon_manager.invalidate_hackathon(context.doc_id)
+        else:
+            previous = model.objects(**query).modify(**{"set__" + derivative_field: derivative})
+            recorded = previous is not None
+            if previous:
+                self.__delete_variants(self.__get_derivative(previous, derivative_field))
+
+        if not recorded:
+            # the image is changed or already has derivatives
+            self.__delete_variants(derivative)
+        else:
+            self.log.debug("derivatives of %s generated: %r" % (context.url, derivative.variants))
+
+    def get_variant_url(self, derivative, url, variant):
+        """Return the url of a variant if the derivative of 'url' is ready, otherwise 'url' itself
+
+        :type derivative: ImageDerivative
+        :param derivative: derivative recorded on the document. Can be None
+
+        :type url: str|unicode
+        :param url: the current url of the original image
+
+        :type variant: str|unicode
+        :param variant: see IMAGE_VARIANT in constants.py
+        """
+        if derivative and url and derivative.url == url:
+            return derivative.variants.get(variant, url)
+        return url
+
+    def get_banner_urls(self, hackathon, variant):
+        """Return urls of a variant for all banners of hackathon"""
+        derivatives = dict((d.url, d) for d in hackathon.banner_derivatives)
+        return [self.get_variant_url(derivatives.get(url), url, variant) for url in hackathon.banners or []]
+
+    def __save_variant(self, image, url, variant):
+        width, height = self.util.safe_get_config("image.derivative.sizes.%s" % variant, DEFAULT_SIZES[variant])
+        # never enlarge a small image
+        ratio = min(1.0, float(image.size[0]) / width, float(image.size[1]) / height)
+        resized = ImageOps.fit(image, (max(1, int(width * ratio)), max(1, int(height * ratio))), Image.LANCZOS)
+
+        if resized.mode in ("RGBA", "LA") or (resized.mode == "P" and "transparency" in resized.info):
+            image_format, suffix = "PNG", ".png"
+        else:
+            image_format, suffix = "JPEG", ".jpg"
+            resized = resized.convert("RGB")
+
+        # encode in memory, Pillow writes to a file of the stream's 'name' instead if the stream has one
+        content = StringIO()
+        try:
+            resized.save(content, image_format, quality=self.util.safe_get_config("image.derivative.quality", 85),
+                         optimize=True)
+            content.seek(0)
+            name = splitext(basename(url))[0]
+            file_name = "%s_%s%s" % (name, variant, suffix)
+            context = self.storage.save(Context(file_name=file_name,
+                                                file_type=FILE_TYPE.HACK_IMAGE,
+                                                content=FileStorage(stream=content, filename=file_name)))
+            return context.url
+        finally:
+            content.close()
+
+    def __get_derivative(self, doc, derivative_field):
+        for field in derivative_field.split("__"):
+            doc = getattr(doc, field, None) if doc else None
+        return doc
+
+    def __delete_variants(self, derivative):
+        if not derivative:
+            return
+
+        for url in derivative.variants.values():
+            try:
+                self.storage.delete(url)
+            except Exception as e:
+                self.log.error(e)
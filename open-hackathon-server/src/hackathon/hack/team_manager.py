@@ -36,7 +36,8 @@ from mongoengine import Q, ValidationError
 from hackathon import Component, RequiredFeature
 from hackathon.hmongo.models import Team, TeamMember, TeamScore, TeamWork, Hackathon, UserHackathon, to_dic
 from hackathon.hackathon_response import not_found, bad_request, precondition_failed, ok, forbidden
-from hackathon.constants import TEAM_MEMBER_STATUS, TEAM_SHOW_TYPE, HACK_USER_TYPE, HACKATHON_CONFIG
+from hackathon.constants import TEAM_MEMBER_STATUS, TEAM_SHOW_TYPE, HACK_USER_TYPE, HACKATHON_CONFIG, \
+    IMAGE_VARIANT, IMAGE_TARGET
 
 __all__ = ["TeamManager"]
 hack_manager = RequiredFeature("hackathon_manager")
@@ -48,6 +49,7 @@ class TeamManager(Component):
     admin_manager = RequiredFeature("admin_manager")
     register_manager = RequiredFeature("register_manager")
     hackathon_template_manager = RequiredFeature("hackathon_template_manager")
+    image_manager = RequiredFeature("image_manager")
 
     def get_team_by_id(self, team_id):
         team = self.__get_team_by_id(team_id)
@@ -150,7 +152,7 @@ class TeamManager(Component):
                 'nickname': team.leader.nickname,
                 'avatar_url': team.leader.avatar_url
             }
-            teamDic['cover'] = teamDic.get('cover', '')
+            self.__use_image_variants(team, teamDic)
             teamDic['project_name'] = teamDic.get('project_name', '')
             teamDic['dev_plan'] = teamDic.get('dev_plan', '')
             teamDic['works'] = teamDic.get('works', '')
@@ -160,7 +162,7 @@ class TeamManager(Component):
 
             def sub(t):
                 m = to_dic(t)
-                m["user"] = self.user_manager.user_display_info(t.user)
+                m["user"] = self.user_manager.user_display_info(t.user, IMAGE_VARIANT.THUMBNAIL)
                 return m
 
             teamDic["members"] = [sub(t) for t in team.members]
@@ -221,6 +223,11 @@ class TeamManager(Component):
         team.update_time = self.util.get_now()
         team.save()
 
+        if kwargs.get("logo"):
+            self.image_manager.schedule_derivatives(IMAGE_TARGET.TEAM_LOGO, team.id, team.logo)
+        if kwargs.get("cover"):
+            self.image_manager.schedule_derivatives(IMAGE_TARGET.TEAM_COVER, team.id, team.cover)
+
         if "dev_plan" in kwargs and kwargs["dev_plan"] and not kwargs["dev_plan"] == "" \
                 and team.hackathon.config.get(HACKATHON_CONFIG.DEV_PLAN_REQUIRED, False):
             self.__email_notify_dev_plan_submitted(team)
@@ -557,7 +564,7 @@ class TeamManager(Component):
                 'nickname': team.leader.nickname,
                 'avatar_url': team.leader.avatar_url
             }
-            teamDic['cover'] = teamDic.get('cover', '')
+            self.__use_image_variants(team, teamDic)
             teamDic['project_name'] = teamDic.get('project_name', '')
             teamDic['dev_plan'] = teamDic.get('dev_plan', '')
             [teamDic.pop(key, None) for key in ['assets', 'awards', 'azure_keys', 'scores', 'templates', 'members']]
@@ -797,7 +804,7 @@ class TeamManager(Component):
             'nickname': team.leader.nickname,
             'avatar_url': team.leader.avatar_url
         }
-        team_dic['cover'] = team_dic.get('cover', '')
+        self.__use_image_variants(team, team_dic)
         team_dic['project_name'] = team_dic.get('project_name', '')
         team_dic['dev_plan'] = team_dic.get('dev_plan', '')
         [team_dic.pop(key, None) for key in ['assets', 'awards', 'azure_keys', 'scores', 'templates', 'members']]
@@ -805,6 +812,16 @@ class TeamManager(Component):
         team_dic["hackathon"] = hack_manager.get_hackathon_detail(team.hackathon)
         return team_dic
 
+    def __use_image_variants(self, team, team_dic):
+        """Return small logo and cover in team list"""
+        if team.logo:
+            team_dic['logo'] = self.image_manager.get_variant_url(team.logo_derivative, team.logo,
+                                                                  IMAGE_VARIANT.THUMBNAIL)
+        team_dic['cover'] = self.image_manager.get_variant_url(team.cover_derivative, team.cover,
+                                                               IMAGE_VARIANT.CARD) or ''
+        team_dic.pop('logo_derivative', None)
+        team_dic.pop('cover_derivative', None)
+
     def __email_notify_dev_plan_submitted(self, team):
         # send emails to all admins of this hackathon when one team dev plan is submitted.
         admins = UserHackathon.objects(hackathon=team.hackathon, role=HACK_USER_TYPE.ADMIN).distinct("user")
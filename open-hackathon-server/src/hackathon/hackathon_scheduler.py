@@ -23,20 +23,33 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 THE SOFTWARE.
 """
 import os
+import sys
+import time
+import math
+import atexit
+import socket
 from pytz import utc
-from datetime import timedelta
+from datetime import datetime, timedelta
 import inspect
-
-from apscheduler.jobstores.base import JobLookupError
+from uuid import uuid4
+from itertools import count
+from Queue import PriorityQueue
+from threading import Thread, Condition, Lock
+from multiprocessing.pool import ThreadPool
+
+from apscheduler.executors.base import BaseExecutor, run_job
+from apscheduler.jobstores.base import BaseJobStore, JobLookupError, ConflictingIdError
+from apscheduler.jobstores.memory import MemoryJobStore
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.util import undefined
 from apscheduler.events import EVENT_JOB_EXECUTED, EVENT_JOB_ERROR, EVENT_JOB_ADDED
 
-from hackathon.hackathon_factory import RequiredFeature
+from hackathon.hackathon_factory import factory
 from hackathon.util import safe_get_config, get_config, get_now
 from hackathon.log import log
 
-__all__ = ["HackathonScheduler"]
+__all__ = ["HackathonScheduler", "DispatchTable", "TimerWheel", "LeaderElection", "LeaderJobStore", "ExecutorPool",
+           "ExecutorRouter", "RoutingExecutor"]
 
 
 def scheduler_listener(event):
@@ -56,6 +69,217 @@ def scheduler_listener(event):
         log.debug("The schedule job %s executed and return value is '%s'" % (event.job_id, event.retval))
 
 
+class LeaderElection(object):
+    """Elect one process of all nodes as the leader through a lease document in mongodb
+
+    Every process tries to take the lease if it's expired, and the leader renews it every 'heartbeat_seconds'. The
+    lease expires after 'lease_seconds' if the leader died, then another process takes it over within seconds. The
+    lease's token is increased every time it's taken over. The leader checks its token is still the current one before
+    running a singleton job(fencing), so that a leader paused for long never runs a job after another one is elected.
+
+    'on_elected' is called without arguments once this process becomes the leader.
+    """
+
+    def __init__(self, name="scheduler", lease_seconds=10, heartbeat_seconds=2, on_elected=None):
+        self.name = name
+        self.lease_seconds = lease_seconds
+        self.heartbeat_seconds = heartbeat_seconds
+        self.on_elected = on_elected
+        self.holder = "%s-%d-%s" % (socket.gethostname(), os.getpid(), uuid4().hex[0:8])
+        # fencing token of the lease if this process is the leader
+        self.token = None
+        self.lease_until = 0
+        self.thread = None
+
+    def start(self):
+        self.thread = Thread(target=self.__loop, name="leader-election")
+        self.thread.setDaemon(True)
+        self.thread.start()
+        atexit.register(self.release)
+
+    def is_leader(self, verify=False):
+        """Whether this process is the leader
+
+        :type verify: bool
+        :param verify: check the fencing token in mongodb rather than the local lease only
+        """
+        if self.token is None or time.time() >= self.lease_until:
+            return False
+        if not verify:
+            return True
+
+        from hackathon.hmongo.models import SchedulerLease
+        return SchedulerLease.objects(name=self.name, holder=self.holder, token=self.token,
+                                      expire_time__gt=get_now()).count() > 0
+
+    def release(self):
+        """Give up the lease so that another process takes over at once"""
+        if self.token is None:
+            return
+
+        from hackathon.hmongo.models import SchedulerLease
+        self.token = None
+        try:
+            SchedulerLease.objects(name=self.name, holder=self.holder).update_one(set__expire_time=get_now())
+        except Exception as e:
+            log.error(e)
+
+    def heartbeat(self):
+        """Renew the lease if leader, otherwise take it over if expired"""
+        from mongoengine import OperationError
+        from hackathon.hmongo.models import SchedulerLease
+
+        started = time.time()
+        now = get_now()
+        expire_time = now + timedelta(seconds=self.lease_seconds)
+        if self.token is not None:
+            lease = SchedulerLease.objects(name=self.name, holder=self.holder, token=self.token).modify(
+                set__expire_time=expire_time, new=True)
+            if lease:
+                self.lease_until = started + self.lease_seconds - self.heartbeat_seconds
+                return
+            log.warn("scheduler leadership of %s lost" % self.holder)
+            self.token = None
+
+        try:
+            lease = SchedulerLease.objects(name=self.name, expire_time__lt=now).modify(
+                upsert=True, new=True, set__holder=self.holder, inc__token=1, set__expire_time=expire_time)
+        except OperationError:
+            # held by another process, the upsert conflicts with the unique name
+            return
+
+        if lease:
+            self.token = lease.token
+            self.lease_until = started + self.lease_seconds - self.heartbeat_seconds
+            log.info("%s is elected as scheduler leader with token %d" % (self.holder, self.token))
+            if self.on_elected:
+                self.on_elected()
+
+    def __loop(self):
+        while True:
+            try:
+                self.heartbeat()
+            except Exception as e:
+                # keep the leadership till the local lease expires
+                log.error(e)
+            time.sleep(self.heartbeat_seconds)
+
+
+leader_election = None
+
+
+class LeaderJobStore(BaseJobStore):
+    """A job store shared by all processes whose jobs are picked up by the elected leader only
+
+    Any process can add, look up and remove jobs, which are saved in 'store'. But due jobs are returned only if this
+    process is the leader, so the other processes never take a run. Since the leader isn't woken when another process
+    adds a job, the next run time is capped at 'poll_seconds' later.
+    """
+
+    def __init__(self, store, election, poll_seconds=10):
+        super(LeaderJobStore, self).__init__()
+        self.store = store
+        self.election = election
+        self.poll_seconds = poll_seconds
+
+    def start(self, scheduler, alias):
+        super(LeaderJobStore, self).start(scheduler, alias)
+        self.store.start(scheduler, alias)
+
+    def shutdown(self):
+        self.store.shutdown()
+
+    def lookup_job(self, job_id):
+        return self.store.lookup_job(job_id)
+
+    def get_due_jobs(self, now):
+        if not self.election.is_leader():
+            return []
+        return self.store.get_due_jobs(now)
+
+    def get_next_run_time(self):
+        if not self.election.is_leader():
+            return None
+        poll_time = datetime.now(utc) + timedelta(seconds=self.poll_seconds)
+        next_run_time = self.store.get_next_run_time()
+        return min(next_run_time, poll_time) if next_run_time else poll_time
+
+    def get_all_jobs(self):
+        return self.store.get_all_jobs()
+
+    def add_job(self, job):
+        self.store.add_job(job)
+
+    def update_job(self, job):
+        self.store.update_job(job)
+
+    def remove_job(self, job_id):
+        self.store.remove_job(job_id)
+
+    def remove_all_jobs(self):
+        self.store.remove_all_jobs()
+
+
+def singleton_executor(feature, method, context):
+    """task for interval jobs which should run on only one process of all nodes
+
+    Jobs of LeaderJobStore are picked up by the leader only. The fencing token is checked again right before running
+    in case the leadership was lost in between, see LeaderElection.
+    """
+    if leader_election and not leader_election.is_leader(verify=True):
+        return
+    scheduler_executor(feature, method, context)
+
+
+class DispatchTable(object):
+    """Bound methods of schedule targets 'feature.method', resolved once for all jobs
+
+    Resolving a feature through hackathon_factory creates a new instance and inspecting the method isn't cheap either.
+    They are done once per target when the first job of it is added rather than every time a job is executed.
+    """
+
+    def __init__(self):
+        # (feature, method): (bound method, whether it expects context). Not locked, resolving twice is harmless
+        self.targets = {}
+
+    def resolve(self, feature, method):
+        """Get the bound method of target and whether it expects the execution context
+
+        :type feature: str|unicode
+        :param feature: the instance key for hackathon_factory.
+
+        :type method: str|unicode
+        :param method: the name of method related to instance
+
+        :rtype: tuple
+        :return: (bound method, True if it expects context)
+
+        :raise: ValueError if feature doesn't exist in factory or it has no such method
+        """
+        target = self.targets.get((feature, method))
+        if target is None:
+            target = self.__compile(feature, method)
+            self.targets[(feature, method)] = target
+        return target
+
+    def __compile(self, feature, method):
+        try:
+            inst = factory[feature]
+        except KeyError:
+            raise ValueError("unknown schedule target '%s.%s': feature not found" % (feature, method))
+
+        mtd = getattr(inst, method, None)
+        if not callable(mtd):
+            raise ValueError("unknown schedule target '%s.%s': method not found" % (feature, method))
+
+        # if target method doesn't expect any parameter except 'self', the args_len is 1
+        args_len = len(inspect.getargspec(mtd).args)
+        return mtd, args_len >= 2
+
+
+dispatch_table = DispatchTable()
+
+
 def scheduler_executor(feature, method, context):
     """task for all apscheduler jobs
 
@@ -77,22 +301,303 @@ def scheduler_executor(feature, method, context):
     :type context: Context, see definition in hackathon/__init__.py
     :param context: the expected execution context of target method
     """
-    log.debug("prepare to execute '%s.%s' with context: %s" % (feature, method, context))
-    inst = RequiredFeature(feature)
-    mtd = getattr(inst, method)
-    args_len = len(inspect.getargspec(mtd).args)
-
-    if args_len < 2:
-        # if target method doesn't expect any parameter except 'self', the args_len is 1
-        mtd()
-    else:
-        # call with execution context
+    mtd, with_context = dispatch_table.resolve(feature, method)
+    if with_context:
         mtd(context)
+    else:
+        mtd()
+
+
+class ExecutorPool(object):
+    """A named pool of worker threads taking jobs from a priority queue
+
+    Jobs of higher priority run first and jobs of the same priority run in the order submitted. The lag of a job is
+    the time it waits in the queue before a worker picks it up. Workers are started on the first submit.
+    """
+
+    def __init__(self, name, workers=5):
+        self.name = name
+        self.workers = workers
+        self.queue = PriorityQueue()
+        self.sequence = count()
+        self.threads = []
+        self.lock = Lock()
+        self.counters = dict(submitted=0, started=0, failed=0, busy=0, lag_seconds=0.0, max_lag_seconds=0.0)
+
+    def submit(self, priority, fn, *args):
+        """Run fn(*args) in a worker
+
+        :type priority: int
+        :param priority: jobs of higher priority run first
+        """
+        self.__ensure_workers()
+        with self.lock:
+            self.counters["submitted"] += 1
+        self.queue.put((-priority, next(self.sequence), time.time(), fn, args))
+
+    def get_stats(self):
+        """Size, queue depth and lag of the pool
+
+        :rtype: dict
+        :return: counters with queue depth, the wait of the oldest queued job, average and max lag in milliseconds
+        """
+        with self.queue.mutex:
+            submit_times = [item[2] for item in self.queue.queue]
+        with self.lock:
+            stats = dict(self.counters)
+
+        stats["workers"] = self.workers
+        stats["depth"] = len(submit_times)
+        stats["oldest_wait_ms"] = round((time.time() - min(submit_times)) * 1000, 2) if submit_times else 0
+        stats["avg_lag_ms"] = round(stats.pop("lag_seconds") * 1000 / stats["started"], 2) if stats["started"] else None
+        stats["max_lag_ms"] = round(stats.pop("max_lag_seconds") * 1000, 2)
+        return stats
+
+    def __ensure_workers(self):
+        if self.threads:
+            return
+        with self.lock:
+            if self.threads:
+                return
+            for i in range(self.workers):
+                thread = Thread(target=self.__work, name="executor-%s-%d" % (self.name, i))
+                thread.setDaemon(True)
+                thread.start()
+                self.threads.append(thread)
+
+    def __work(self):
+        while True:
+            priority, sequence, submit_time, fn, args = self.queue.get()
+            lag = time.time() - submit_time
+            with self.lock:
+                self.counters["started"] += 1
+                self.counters["busy"] += 1
+                self.counters["lag_seconds"] += lag
+                self.counters["max_lag_seconds"] = max(self.counters["max_lag_seconds"], lag)
+
+            try:
+                fn(*args)
+            except Exception as e:
+                log.error(e)
+                with self.lock:
+                    self.counters["failed"] += 1
+            finally:
+                with self.lock:
+                    self.counters["busy"] -= 1
+
+
+class ExecutorRouter(object):
+    """Route jobs to ExecutorPools by their target so that slow jobs never starve others
+
+    Pools are configured by name in 'scheduler.executors'. A job 'feature.method' goes to the pool and priority of
+    route 'feature.method' in 'scheduler.routes', or route 'feature' if not found, or pool 'default' with priority 0.
+    """
+
+    def __init__(self, executors, routes):
+        self.pools = dict((name, ExecutorPool(name, options.get("workers", 5))) for name, options in executors.items())
+        if "default" not in self.pools:
+            self.pools["default"] = ExecutorPool("default", 10)
+
+        for target, route in routes.items():
+            if route.get("executor", "default") not in self.pools:
+                raise ValueError("unknown executor '%s' of route '%s'" % (route["executor"], target))
+        self.routes = routes
+
+    def route(self, feature, method):
+        """Get the pool and priority of target
+
+        :rtype: tuple
+        :return: (ExecutorPool, priority)
+        """
+        route = self.routes.get("%s.%s" % (feature, method)) or self.routes.get(feature) or {}
+        return self.pools[route.get("executor", "default")], route.get("priority", 0)
+
+    def submit(self, feature, method, fn, *args):
+        """Run fn(*args) in the pool of target 'feature.method'"""
+        pool, priority = self.route(feature, method)
+        pool.submit(priority, fn, *args)
+
+    def get_stats(self):
+        return dict((name, pool.get_stats()) for name, pool in self.pools.items())
+
+
+class RoutingExecutor(BaseExecutor):
+    """APScheduler executor which runs jobs in the pool routed by ExecutorRouter
+
+    All jobs have args [feature, method, context] of 'scheduler_executor', routing on running rather than on adding
+    keeps jobs in the job store valid while the routes change.
+    """
+
+    def __init__(self, router):
+        super(RoutingExecutor, self).__init__()
+        self.router = router
+
+    def _do_submit_job(self, job, run_times):
+        feature, method = job.args[0:2] if len(job.args) >= 2 else (None, None)
+        self.router.submit(feature, method, self.__run_job, job, run_times)
+
+    def __run_job(self, job, run_times):
+        try:
+            events = run_job(job, job._jobstore_alias, run_times, self._logger.name)
+        except Exception:
+            self._run_job_error(job.id, *sys.exc_info()[1:])
+        else:
+            self._run_job_success(job.id, events)
+
+
+class TimerWheel(object):
+    """A hashed timer wheel to run short-lived jobs in memory
+
+    Time is divided into ticks and a job due in n ticks is put into slot (cursor + n) % slots, with the number of full
+    rounds to wait if n is longer than the wheel. A thread moves the cursor every tick and executes the jobs of that
+    slot by 'scheduler_executor', in the pools of 'router' if given or its own thread pool. Adding or removing a job is
+    O(1) and nothing is written anywhere, but the jobs are lost if the process exits without 'take_pending'.
+    """
+
+    def __init__(self, tick_seconds=1, slots=64, workers=5, router=None):
+        self.tick_seconds = tick_seconds
+        self.slots = [dict() for _ in range(slots)]
+        # job id: (slot index, job)
+        self.jobs = {}
+        self.cursor = 0
+        self.condition = Condition()
+        self.workers = workers
+        self.router = router
+        self.thread = None
+        self.pool = None
+
+    def add(self, job_id, delay_seconds, feature, method, context, replace_existing=True):
+        """Execute 'feature.method(context)' after delay_seconds, at the granularity of ticks
+
+        The context is kept as it is rather than serialized, don't change it after added.
+
+        :raise: ConflictingIdError if job of the same id exists and replace_existing is False
+        """
+        ticks = max(1, int(math.ceil(float(delay_seconds) / self.tick_seconds)))
+        job = {
+            "id": job_id,
+            "feature": feature,
+            "method": method,
+            "context": context,
+            "due": time.time() + delay_seconds,
+            "rounds": (ticks - 1) // len(self.slots)
+        }
+
+        with self.condition:
+            if job_id in self.jobs:
+                if not replace_existing:
+                    raise ConflictingIdError(job_id)
+                self.__remove(job_id)
+
+            index = (self.cursor + ticks) % len(self.slots)
+            self.slots[index][job_id] = job
+            self.jobs[job_id] = (index, job)
+            self.__ensure_loop()
+            self.condition.notify()
+
+    def remove(self, job_id):
+        """Remove a pending job
+
+        :rtype: bool
+        :return: True if the job was pending
+        """
+        with self.condition:
+            return self.__remove(job_id) is not None
+
+    def has(self, job_id):
+        return job_id in self.jobs
+
+    def take_pending(self):
+        """Remove all pending jobs so that they can be saved somewhere else
+
+        :rtype: list
+        :return: pending jobs in dict of id, feature, method, context and due(epoch seconds)
+        """
+        with self.condition:
+            pending = [job for index, job in self.jobs.values()]
+            for slot in self.slots:
+                slot.clear()
+            self.jobs.clear()
+            return pending
+
+    def __remove(self, job_id):
+        entry = self.jobs.pop(job_id, None)
+        if entry:
+            self.slots[entry[0]].pop(job_id, None)
+        return entry
+
+    def __ensure_loop(self):
+        if self.thread and self.thread.is_alive():
+            return
+        if not self.router:
+            self.pool = ThreadPool(self.workers)
+        self.thread = Thread(target=self.__loop, name="timer-wheel")
+        self.thread.setDaemon(True)
+        self.thread.start()
+
+    def __loop(self):
+        next_tick = time.time() + self.tick_seconds
+        while True:
+            try:
+                with self.condition:
+                    while not self.jobs:
+                        # idle, nothing to move
+                        self.condition.wait()
+                        next_tick = time.time() + self.tick_seconds
+
+                time.sleep(max(0, next_tick - time.time()))
+
+                # catch up if the thread fell behind
+                due = []
+                with self.condition:
+                    while next_tick <= time.time():
+                        next_tick += self.tick_seconds
+                        due.extend(self.__advance())
+
+                for job in due:
+                    if self.router:
+                        self.router.submit(job["feature"], job["method"], self.__execute, job)
+                    else:
+                        self.pool.apply_async(self.__execute, (job,))
+            except Exception as e:
+                log.error(e)
+
+    def __advance(self):
+        self.cursor = (self.cursor + 1) % len(self.slots)
+        slot = self.slots[self.cursor]
+        due = []
+        for job_id, job in slot.items():
+            if job["rounds"] > 0:
+                job["rounds"] -= 1
+            else:
+                due.append(job)
+                del slot[job_id]
+                del self.jobs[job_id]
+        return due
+
+    def __execute(self, job):
+        try:
+            scheduler_executor(job["feature"], job["method"], job["context"])
+        except Exception as e:
+            log.warn("The timer job %s crashed because of %r" % (job["id"], e))
 
 
 class HackathonScheduler(object):
-    """An helper class for apscheduler"""
+    """An helper class for apscheduler
+
+    Jobs added by 'add_once' which are due within 'scheduler.timer_wheel.max_delay_seconds', mostly short polls, are
+    kept in an in-process TimerWheel instead of the job store unless 'durable' is True. The job store is written only
+    for long-horizon jobs. Pending timer jobs are moved into the job store when the process exits normally, and
+    in-flight experiments whose polls are lost by a crash are reconciled by 'expr_manager.reconcile_starting_exprs'.
+
+    With 'scheduler.leader_election.enabled', interval jobs are singleton by default: they are saved in a LeaderJobStore
+    shared by all processes and only the elected leader executes them, see LeaderElection. One-off jobs run anywhere.
+
+    With 'scheduler.executors', jobs of both APScheduler and the TimerWheel run in the pools of an ExecutorRouter, so
+    that long-running provisioning is kept away from the short checks that users are waiting for.
+    """
     jobstore = "ohp"
+    singleton_jobstore = "singleton"
 
     def get_scheduler(self):
         """Return the apscheduler instance in case you have to call it directly
@@ -103,7 +608,18 @@ class HackathonScheduler(object):
         """
         return self.__apscheduler
 
-    def add_once(self, feature, method, context=None, id=None, replace_existing=True, run_date=None, **delta):
+    def get_stats(self):
+        """Queue depth and lag of executor pools and the number of pending timer jobs
+
+        :rtype: dict
+        """
+        return {
+            "executors": self.__executor_router.get_stats() if self.__executor_router else {},
+            "timer_jobs": len(self.__timer_wheel.jobs) if self.__timer_wheel else 0
+        }
+
+    def add_once(self, feature, method, context=None, id=None, replace_existing=True, run_date=None, durable=None,
+                 **delta):
         """Add a job to APScheduler and executed only once
 
         Job will be executed at 'run_date' or after certain timedelta.
@@ -134,12 +650,28 @@ class HackathonScheduler(object):
         :type run_date: datetime | None
         :param run_date: job run date. If None, job run date will be datetime.now()+timedelta(delta)
 
+        :type durable: bool | None
+        :param durable: True to save the job into job store, False to keep it in memory. If None, jobs due within
+            'scheduler.timer_wheel.max_delay_seconds' are kept in memory
+
         :type delta: kwargs for timedelta
         :param delta: kwargs for timedelta. For example: minutes=5. Will be ignored if run_date is not None
+
+        :raise: ValueError if 'feature.method' cannot be resolved
         """
+        dispatch_table.resolve(feature, method)
         if not run_date:
             run_date = get_now() + timedelta(**delta)
 
+        if self.__timer_wheel and not durable:
+            delay = (run_date - get_now()).total_seconds()
+            if durable is False or delay <= safe_get_config("scheduler.timer_wheel.max_delay_seconds", 60):
+                if id and self.__apscheduler.get_job(id, jobstore=self.jobstore):
+                    # replace the one moved into job store at last exit
+                    self.__apscheduler.remove_job(id, self.jobstore)
+                self.__timer_wheel.add(id or uuid4().hex, delay, feature, method, context, replace_existing)
+                return
+
         if self.__apscheduler:
             self.__apscheduler.add_job(scheduler_executor,
                                        trigger='date',
@@ -151,7 +683,7 @@ class HackathonScheduler(object):
                                        args=[feature, method, context])
 
     def add_interval(self, feature, method, context=None, id=None, replace_existing=True, next_run_time=undefined,
-                     **interval):
+                     singleton=True, **interval):
         """Add an interval job to APScheduler and executed.
 
         Job will be executed firstly at 'next_run_time'. And then executed in interval.
@@ -181,17 +713,30 @@ class HackathonScheduler(object):
         :type next_run_time: datetime | undefined
         :param next_run_time: the first time the job will be executed. leave undefined to don't execute until interval time reached
 
+        :type singleton: bool
+        :param singleton: execute on the leader only if leader election enabled, otherwise on every process
+
         :type interval: kwargs for "interval" trigger
         :param interval: kwargs for "interval" trigger. For example: minutes=5.
+
+        :raise: ValueError if 'feature.method' cannot be resolved
         """
+        dispatch_table.resolve(feature, method)
         if self.__apscheduler:
-            self.__apscheduler.add_job(scheduler_executor,
+            singleton = singleton and leader_election is not None
+            if singleton and id:
+                # in case it was added before leader election enabled
+                try:
+                    self.__apscheduler.remove_job(id, self.jobstore)
+                except JobLookupError:
+                    pass
+            self.__apscheduler.add_job(singleton_executor if singleton else scheduler_executor,
                                        trigger='interval',
                                        id=id,
                                        max_instances=1,
                                        replace_existing=replace_existing,
                                        next_run_time=next_run_time,
-                                       jobstore=self.jobstore,
+                                       jobstore=self.singleton_jobstore if singleton else self.jobstore,
                                        args=[feature, method, context],
                                        **interval)
 
@@ -201,9 +746,12 @@ class HackathonScheduler(object):
         :type job_id: str | unicode
         :param job_id: the id of job
         """
+        if self.__timer_wheel and self.__timer_wheel.remove(job_id):
+            return
+
         if self.__apscheduler:
             try:
-                self.__apscheduler.remove_job(job_id, self.jobstore)
+                self.__apscheduler.remove_job(job_id, self.__get_jobstore(job_id))
             except JobLookupError:
                 log.debug("remove job failed because job %s not found" % job_id)
             except Exception as e:
@@ -211,11 +759,19 @@ class HackathonScheduler(object):
 
     def has_job(self, job_id):
         """Check the existence of specific job """
+        if self.__timer_wheel and self.__timer_wheel.has(job_id):
+            return True
+
         if self.__apscheduler:
-            job = self.__apscheduler.get_job(job_id, jobstore=self.jobstore)
+            job = self.__apscheduler.get_job(job_id, jobstore=self.__get_jobstore(job_id))
             return job is not None
         return False
 
+    def __get_jobstore(self, job_id):
+        if leader_election and self.__apscheduler.get_job(job_id, jobstore=self.singleton_jobstore):
+            return self.singleton_jobstore
+        return self.jobstore
+
     def __init__(self, app):
         """Initialize APScheduler
 
@@ -224,11 +780,19 @@ class HackathonScheduler(object):
         """
         self.app = app
         self.__apscheduler = None
+        self.__timer_wheel = None
+        self.__executor_router = None
 
         # NOT instantiate while in flask DEBUG mode or in the main thread
         # It's to avoid APScheduler being instantiated twice
         if not app.debug or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
-            self.__apscheduler = BackgroundScheduler(timezone=utc)
+            executors = safe_get_config("scheduler.executors", None)
+            if executors:
+                self.__executor_router = ExecutorRouter(executors, safe_get_config("scheduler.routes", {}))
+                self.__apscheduler = BackgroundScheduler(timezone=utc,
+                                                         executors={"default": RoutingExecutor(self.__executor_router)})
+            else:
+                self.__apscheduler = BackgroundScheduler(timezone=utc)
 
             # add MySQL job store
             job_store_type = safe_get_config("scheduler.job_store", "memory")
@@ -246,7 +810,59 @@ class HackathonScheduler(object):
                                                 host=safe_get_config("scheduler.host", "localhost"),
                                                 port=safe_get_config("scheduler.port", 27017))
 
+            if safe_get_config("scheduler.leader_election.enabled", False):
+                global leader_election
+                leader_election = LeaderElection(
+                    lease_seconds=safe_get_config("scheduler.leader_election.lease_seconds", 10),
+                    heartbeat_seconds=safe_get_config("scheduler.leader_election.heartbeat_seconds", 2),
+                    on_elected=self.__apscheduler.wakeup)
+                store = LeaderJobStore(self.__create_singleton_store(job_store_type),
+                                       leader_election,
+                                       poll_seconds=safe_get_config("scheduler.leader_election.poll_seconds", 10))
+                self.__apscheduler.add_jobstore(store, alias=self.singleton_jobstore)
+
             # add event listener
             self.__apscheduler.add_listener(scheduler_listener, EVENT_JOB_EXECUTED | EVENT_JOB_ERROR | EVENT_JOB_ADDED)
             log.info("APScheduler loaded")
             self.__apscheduler.start()
+            if leader_election:
+                leader_election.start()
+
+            if safe_get_config("scheduler.timer_wheel.enabled", True):
+                self.__timer_wheel = TimerWheel(tick_seconds=safe_get_config("scheduler.timer_wheel.tick_seconds", 1),
+                                                slots=safe_get_config("scheduler.timer_wheel.slots", 64),
+                                                workers=safe_get_config("scheduler.timer_wheel.workers", 5),
+                                                router=self.__executor_router)
+                atexit.register(self.__save_timer_jobs)
+
+    def __create_singleton_store(self, job_store_type):
+        """Create the job store behind LeaderJobStore, of the same type as the main job store but another table"""
+        if job_store_type == "mysql":
+            from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+            return SQLAlchemyJobStore(url=get_config("scheduler.job_store_url"),
+                                      tablename=safe_get_config("scheduler.singleton_collection", "singleton_jobs"))
+        elif job_store_type == "mongodb":
+            from apscheduler.jobstores.mongodb import MongoDBJobStore
+            return MongoDBJobStore(database=safe_get_config("scheduler.database", "apscheduler"),
+                                   collection=safe_get_config("scheduler.singleton_collection", "singleton_jobs"),
+                                   host=safe_get_config("scheduler.host", "localhost"),
+                                   port=safe_get_config("scheduler.port", 27017))
+        return MemoryJobStore()
+
+    def __save_timer_jobs(self):
+        """Move pending jobs of timer wheel into job store so that they're executed after restart"""
+        pending = self.__timer_wheel.take_pending()
+        if pending:
+            log.info("save %d pending timer jobs into job store" % len(pending))
+        for job in pending:
+            try:
+                self.__apscheduler.add_job(scheduler_executor,
+                                           trigger='date',
+                                           run_date=get_now() + timedelta(seconds=max(0, job["due"] - time.time())),
+                                           id=job["id"],
+                                           max_instances=1,
+                                           replace_existing=True,
+                                           jobstore=self.jobstore,
+                                           args=[job["feature"], job["method"], job["context"]])
+            except Exception as e:
+                log.error(e)
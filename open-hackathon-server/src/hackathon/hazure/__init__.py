@@ -33,3 +33,6 @@ from file_service_adapter import FileServiceAdapter
 from queue_service_adapter import QueueServiceAdapter
 from storage_account_adapter import StorageAccountAdapter
 from table_service_adapter import TableServiceAdapter
+from adapter_registry import AzureAdapterRegistry
+from async_op_poller import AzureAsyncOpPoller
+from endpoint_batcher import AzureEndpointBatcher
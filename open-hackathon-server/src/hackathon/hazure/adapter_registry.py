@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) Microsoft Open Technologies (Shanghai) Co. Ltd.  All rights reserved.
+
+The MIT License (MIT)
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+__all__ = ["AzureAdapterRegistry"]
+
+import time
+from collections import deque
+from threading import Lock
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from hackathon import Component
+from cloud_service_adapter import CloudServiceAdapter
+
+
+class AzureAdapterRegistry(Component):
+    """Cache of service management adapters per subscription
+
+    Constructing an adapter resolves the local pem file and creates a new ServiceManagementService which opens a new
+    https connection for every request. The registry keeps one requests session(with a connection pool) per
+    (subscription_id, management_host) and caches adapters on top of it. Cached adapters are dropped by
+    'invalidate' when the certificate is deleted or replaced, or rebuilt when the pem file of the key changes.
+
+    Every http request sent to the management api is counted per subscription so that throttling can be anticipated.
+
+    Settings under 'azure' of config.py:
+        adapter_pool_size: int, max connections kept per subscription, default 10
+        api_call_window_seconds: int, the window of recent api calls, default 3600
+        api_call_warning_threshold: int, log a warning once calls in window exceed it, default 10000
+    """
+
+    # shared by all instances since a new instance is created for every RequiredFeature resolution
+    lock = Lock()
+    # (subscription_id, management_host): {"pem_url": , "source_url": , "session": , "adapters": {class: adapter}}
+    entries = {}
+    # subscription_id: {"total": , "errors": , "throttled": , "recent": deque of timestamps}
+    api_calls = {}
+
+    def get_adapter_by_key(self, azure_key, adapter_class=CloudServiceAdapter):
+        """Get adapter of an AzureKey
+
+        The local pem file is resolved only if there is no cached adapter for the key
+
+        :type azure_key: AzureKey
+        :param azure_key: the azure key whose subscription to work with
+
+        :type adapter_class: class
+        :param adapter_class: CloudServiceAdapter, VirtualMachineAdapter or StorageAccountAdapter
+
+        :rtype: ServiceAdapter
+        """
+        cache_key = (azure_key.subscription_id, azure_key.management_host)
+        with self.lock:
+            entry = self.entries.get(cache_key)
+            if entry and entry["source_url"] == azure_key.pem_url:
+                return self.__get_or_create(entry, adapter_class, cache_key)
+
+        pem_url = azure_key.get_local_pem_url()
+        return self.get_adapter(adapter_class,
+                                azure_key.subscription_id,
+                                pem_url,
+                                azure_key.management_host,
+                                source_url=azure_key.pem_url)
+
+    def get_adapter(self, adapter_class, subscription_id, pem_url, management_host, source_url=None):
+        """Get adapter by subscription and the local pem file
+
+        :type pem_url: str|unicode
+        :param pem_url: path of the local pem file
+
+        :type source_url: str|unicode
+        :param source_url: the pem_url of AzureKey which the local pem file recovered from
+
+        :rtype: ServiceAdapter
+        """
+        cache_key = (subscription_id, management_host)
+        with self.lock:
+            entry = self.entries.get(cache_key)
+            if entry is None or entry["pem_url"] != pem_url or self.__is_replaced(entry, source_url):
+                if entry is not None:
+                    self.log.debug("certificate of subscription %s changed, rebuild adapters" % subscription_id)
+                    entry["session"].close()
+                entry = {
+                    "pem_url": pem_url,
+                    "source_url": source_url,
+                    "session": self.__create_session(subscription_id, pem_url),
+                    "adapters": {}
+                }
+                self.entries[cache_key] = entry
+            elif source_url:
+                entry["source_url"] = source_url
+
+            return self.__get_or_create(entry, adapter_class, cache_key)
+
+    def invalidate(self, subscription_id, management_host=None):
+        """Drop cached adapters of a subscription, e.g. the certificate is deleted or replaced
+
+        :type management_host: str|unicode
+        :param management_host: drop adapters of all management hosts if None
+        """
+        with self.lock:
+            for cache_key in self.entries.keys():
+                if cache_key[0] != subscription_id:
+                    continue
+                if management_host and cache_key[1] != management_host:
+                    continue
+                self.log.debug("invalidate azure adapters of %s@%s" % cache_key)
+                self.entries.pop(cache_key)["session"].close()
+
+    def get_api_call_stats(self):
+        """Get count of api calls per subscription
+
+        :rtype: dict
+        :return: subscription_id: {"total": , "errors": , "throttled": , "recent": calls in window}
+        """
+        window = self.util.safe_get_config("azure.api_call_window_seconds", 3600)
+        now = time.time()
+        stats = {}
+        with self.lock:
+            for subscription_id, counter in self.api_calls.iteritems():
+                self.__prune(counter["recent"], now - window)
+                stats[subscription_id] = {
+                    "total": counter["total"],
+                    "errors": counter["errors"],
+                    "throttled": counter["throttled"],
+                    "recent": len(counter["recent"])
+                }
+        return stats
+
+    def __is_replaced(self, entry, source_url):
+        return source_url and entry["source_url"] and entry["source_url"] != source_url
+
+    def __get_or_create(self, entry, adapter_class, cache_key):
+        adapter = entry["adapters"].get(adapter_class)
+        if adapter is None:
+            adapter = adapter_class(cache_key[0],
+                                    entry["pem_url"],
+                                    host=cache_key[1],
+                                    request_session=entry["session"])
+            entry["adapters"][adapter_class] = adapter
+        return adapter
+
+    def __create_session(self, subscription_id, pem_url):
+        pool_size = self.util.safe_get_config("azure.adapter_pool_size", 10)
+        session = requests.Session()
+        session.cert = pem_url
+        session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+
+        def count_call(response, *args, **kwargs):
+            self.__record_call(subscription_id, response.status_code)
+
+        session.hooks["response"].append(count_call)
+        return session
+
+    def __record_call(self, subscription_id, status_code):
+        window = self.util.safe_get_config("azure.api_call_window_seconds", 3600)
+        threshold = self.util.safe_get_config("azure.api_call_warning_threshold", 10000)
+        now = time.time()
+        with self.lock:
+            counter = self.api_calls.setdefault(subscription_id,
+                                                {"total": 0, "errors": 0, "throttled": 0, "recent": deque()})
+            counter["total"] += 1
+            if status_code >= 400:
+                counter["errors"] += 1
+            if status_code in (429, 503):
+                counter["throttled"] += 1
+            counter["recent"].append(now)
+            self.__prune(counter["recent"], now - window)
+            recent = len(counter["recent"])
+
+        if recent == threshold + 1:
+            self.log.warn("subscription %s sent %d api calls in %d seconds, requests may be throttled soon" %
+                          (subscription_id, recent, window))
+
+    def __prune(self, timestamps, since):
+        while timestamps and timestamps[0] < since:
+            timestamps.popleft()
@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) Microsoft Open Technologies (Shanghai) Co. Ltd.  All rights reserved.
+
+The MIT License (MIT)
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+__all__ = ["AzureAsyncOpPoller"]
+
+import time
+from threading import Thread, Condition
+from multiprocessing.pool import ThreadPool
+
+from hackathon import Component, RequiredFeature
+from hackathon.hackathon_scheduler import scheduler_executor
+from virtual_machine_adapter import VirtualMachineAdapter
+from constants import ASYNC_OP_RESULT
+
+
+class AzureAsyncOpPoller(Component):
+    """One polling loop for all outstanding azure async operations of current process
+
+    Waiting for an async operation used to add a persisted schedule job which polls the operation once and adds
+    another job if not finished. The poller keeps waits in memory instead:
+        - 'watch_operation': the poller polls 'get_operation_status' of the request itself. Polls of the same
+          subscription share one cached adapter(and its connection pool), and at most 'max_polls_per_subscription'
+          polls are sent per subscription in one round. Once the operation succeeded or failed, the callback is called
+          with 'async_op_status' and 'async_op_error' set in the context
+        - 'watch_state': for waits that are not an operation such as 'vm ready', the callback is called when due and is
+          expected to check the state and watch again if not ready
+
+    The interval grows from 'initial_interval_seconds' by 'backoff_factor' up to the max interval every time a wait is
+    polled again. Callbacks are executed in a thread pool the same way as schedule jobs, see 'scheduler_executor'.
+
+    Waits are lost if the process restarts. Set 'azure.async_poller.enabled' False to fall back to schedule jobs.
+
+    Settings under 'azure.async_poller' of config.py:
+        enabled: bool, default True
+        tick_seconds: float, default 1
+        initial_interval_seconds: float, default 2
+        backoff_factor: float, default 1.5
+        max_interval_seconds: float, default 30
+        max_polls_per_subscription: int, default 20
+        workers: int, threads to poll subscriptions and to execute callbacks, default 5
+    """
+
+    def __init__(self):
+        self.waits = {}
+        self.condition = Condition()
+        self.thread = None
+        self.poll_pool = None
+        self.callback_pool = None
+
+    def is_enabled(self):
+        return self.__get_config("enabled", True)
+
+    def watch_operation(self, feature, method, context, request_id, max_interval=None):
+        """Wait for an async operation and call 'feature.method(context)' once it succeeded or failed
+
+        :type context: Context
+        :param context: must contain 'subscription_id', 'pem_url' and 'management_host' of the operation
+
+        :type request_id: str|unicode
+        :param request_id: the request id returned by the async api
+        """
+        self.__add_wait(feature, method, context, request_id, max_interval)
+
+    def watch_state(self, feature, method, context, max_interval=None):
+        """Call 'feature.method(context)' after an interval which grows every time the same wait is watched again
+
+        :type max_interval: float
+        :param max_interval: the max interval in seconds, 'max_interval_seconds' if None
+        """
+        self.__add_wait(feature, method, context, None, max_interval)
+
+    def get_waits(self):
+        """Get outstanding waits for diagnosis
+
+        :rtype: list
+        """
+        now = time.time()
+        with self.condition:
+            return [{
+                "key": key,
+                "request_id": wait["request_id"],
+                "attempts": wait["attempts"],
+                "due_in": max(0, wait["due"] - now)
+            } for key, wait in self.waits.iteritems()]
+
+    def __add_wait(self, feature, method, context, request_id, max_interval):
+        key = "%s.%s:%s" % (feature, method, context.get("experiment_id", id(context)))
+        initial = self.__get_config("initial_interval_seconds", 2)
+        factor = self.__get_config("backoff_factor", 1.5)
+        max_interval = max_interval or self.__get_config("max_interval_seconds", 30)
+
+        with self.condition:
+            existing = self.waits.get(key)
+            # a state wait is watched again by its callback, keep backing off
+            attempts = existing["attempts"] + 1 if existing and existing["dispatched"] else 0
+            interval = min(initial * (factor ** attempts), max_interval)
+            self.waits[key] = {
+                "feature": feature,
+                "method": method,
+                "context": context,
+                "request_id": request_id,
+                "attempts": attempts,
+                "max_interval": max_interval,
+                "interval": interval,
+                "due": time.time() + interval,
+                "dispatched": False
+            }
+            self.__ensure_loop()
+            self.condition.notify()
+
+    def __ensure_loop(self):
+        if self.thread and self.thread.is_alive():
+            return
+        workers = self.__get_config("workers", 5)
+        self.poll_pool = ThreadPool(workers)
+        self.callback_pool = ThreadPool(workers)
+        self.thread = Thread(target=self.__loop, name="azure-async-op-poller")
+        self.thread.setDaemon(True)
+        self.thread.start()
+
+    def __loop(self):
+        tick = self.__get_config("tick_seconds", 1)
+        while True:
+            try:
+                with self.condition:
+                    while not self.__has_due_waits():
+                        self.condition.wait(tick)
+                    due = self.__take_due_waits()
+                self.__process(due)
+            except Exception as e:
+                self.log.error(e)
+                time.sleep(tick)
+
+    def __has_due_waits(self):
+        now = time.time()
+        return any(wait["due"] <= now and not wait["dispatched"] for wait in self.waits.itervalues())
+
+    def __take_due_waits(self):
+        now = time.time()
+        return [(key, wait) for key, wait in self.waits.iteritems() if wait["due"] <= now and not wait["dispatched"]]
+
+    def __process(self, due):
+        subscriptions = {}
+        for key, wait in due:
+            if wait["request_id"]:
+                ctx = wait["context"]
+                group = (ctx.subscription_id, ctx.management_host, ctx.pem_url)
+                subscriptions.setdefault(group, []).append((key, wait))
+            else:
+                self.__dispatch(key, wait)
+
+        if subscriptions:
+            self.poll_pool.map(self.__poll_subscription, subscriptions.items())
+
+    def __poll_subscription(self, group_waits):
+        (subscription_id, management_host, pem_url), waits = group_waits
+        max_polls = self.__get_config("max_polls_per_subscription", 20)
+        registry = RequiredFeature("azure_adapter_registry")
+        adapter = registry.get_adapter(VirtualMachineAdapter, subscription_id, pem_url, management_host)
+
+        # the ones waiting longest first, the others are delayed to next round
+        waits.sort(key=lambda item: item[1]["due"])
+        for key, wait in waits[max_polls:]:
+            self.__postpone(key, wait)
+
+        for key, wait in waits[:max_polls]:
+            try:
+                res = adapter.get_operation_status(wait["request_id"])
+            except Exception as e:
+                self.log.error("poll operation %s failed: %r" % (wait["request_id"], e))
+                self.__postpone(key, wait)
+                continue
+
+            if res.status == ASYNC_OP_RESULT.SUCCEEDED or res.error:
+                wait["context"].async_op_status = res.status
+                wait["context"].async_op_error = res.error.message if res.error else None
+                self.__dispatch(key, wait)
+            else:
+                self.__postpone(key, wait)
+
+    def __postpone(self, key, wait):
+        factor = self.__get_config("backoff_factor", 1.5)
+        with self.condition:
+            if self.waits.get(key) is not wait:
+                return
+            wait["attempts"] += 1
+            wait["interval"] = min(wait["interval"] * factor, wait["max_interval"])
+            wait["due"] = time.time() + wait["interval"]
+
+    def __dispatch(self, key, wait):
+        with self.condition:
+            wait["dispatched"] = True
+        self.callback_pool.apply_async(self.__execute, (key, wait))
+
+    def __execute(self, key, wait):
+        try:
+            scheduler_executor(wait["feature"], wait["method"], wait["context"])
+        except Exception as e:
+            self.log.error("azure async wait %s failed: %r" % (key, e))
+        finally:
+            with self.condition:
+                # remove unless the callback watched again
+                if self.waits.get(key) is wait:
+                    self.waits.pop(key)
+
+    def __get_config(self, key, default):
+        return self.util.safe_get_config("azure.async_poller." + key, default)
@@ -26,12 +26,22 @@ import sys
 
 sys.path.append("..")
 
+from hashlib import md5
+from threading import BoundedSemaphore, Lock
+from multiprocessing.pool import ThreadPool
+
 from azure.storage.blob import BlobService
+from azure.common import AzureMissingResourceHttpError
 
 from service_adapter import ServiceAdapter
 
 __all__ = ["BlobServiceAdapter"]
 
+UPLOAD_CHUNK_SIZE = 4 * 1024 * 1024  # 4MB, the max size of a block is 4MB in old api versions
+UPLOAD_MAX_CONNECTIONS = 4
+UPLOAD_BLOCK_RETRY = 3
+DOWNLOAD_CHUNK_SIZE = 4 * 1024 * 1024
+
 
 class BlobServiceAdapter(ServiceAdapter):
     """The :class:`BlobServiceAdapter` class is a thin wrapper over azure.storage.BlobService.
@@ -166,6 +176,132 @@ class BlobServiceAdapter(ServiceAdapter):
             self.log.error(e)
             return None
 
+    def upload_stream_to_azure(self, container_name, blob_name, stream, chunk_size=None, max_connections=None,
+                               resume=True):
+        """
+        Creates a new block blob from a stream that may not be seekable(e.g. the request stream), blocks are put in
+        parallel and the block list is committed at last. At most 'max_connections' chunks are read but not put yet,
+        so the memory is bounded by chunk_size * max_connections.
+
+        Block ids contain the index and md5 of the chunk. If 'resume' is True, chunks that are already uploaded as
+        uncommitted blocks by a previous failed upload of the same blob are not put again.
+
+        :type container_name: str|unicode
+        :param container_name: Name of existing container.
+
+        :type blob_name: str|unicode
+        :param blob_name: Name of blob to create or update.
+
+        :type stream: file
+        :param stream: Opened file/stream to upload as the blob content. Only 'read(size)' is used.
+
+        :type chunk_size: int
+        :param chunk_size: size of each block, 'storage.azure.upload_chunk_size' by default
+
+        :type max_connections: int
+        :param max_connections: blocks put at the same time, 'storage.azure.upload_max_connections' by default
+
+        :rtype: str|None
+        :return: url of the blob, None if failed
+        """
+        chunk_size = chunk_size or self.util.safe_get_config("storage.azure.upload_chunk_size", UPLOAD_CHUNK_SIZE)
+        max_connections = max_connections or self.util.safe_get_config("storage.azure.upload_max_connections",
+                                                                       UPLOAD_MAX_CONNECTIONS)
+        try:
+            if not self.create_container_in_storage(container_name, 'container'):
+                return None
+
+            uploaded = self.__get_uncommitted_block_ids(container_name, blob_name) if resume else set()
+            block_ids = []
+            errors = []
+            error_lock = Lock()
+            slots = BoundedSemaphore(max_connections)
+            pool = ThreadPool(max_connections)
+
+            def put_block(chunk, block_id):
+                try:
+                    for trial in range(UPLOAD_BLOCK_RETRY):
+                        try:
+                            self.service.put_block(container_name, blob_name, chunk, block_id)
+                            return
+                        except Exception as e:
+                            if trial == UPLOAD_BLOCK_RETRY - 1:
+                                with error_lock:
+                                    errors.append(e)
+                finally:
+                    slots.release()
+
+            try:
+                while not errors:
+                    slots.acquire()
+                    chunk = stream.read(chunk_size)
+                    if not chunk:
+                        slots.release()
+                        break
+
+                    block_id = "%08d-%s" % (len(block_ids), md5(chunk).hexdigest())
+                    block_ids.append(block_id)
+                    if block_id in uploaded:
+                        slots.release()
+                        continue
+                    pool.apply_async(put_block, (chunk, block_id))
+            finally:
+                pool.close()
+                pool.join()
+
+            if errors:
+                # uncommitted blocks are kept by azure for a week, so a retry can resume
+                raise errors[0]
+
+            self.service.put_block_list(container_name, blob_name, block_ids)
+            self.log.debug("%d blocks uploaded to %s/%s, %d resumed" %
+                           (len(block_ids), container_name, blob_name, len(uploaded & set(block_ids))))
+            return self.service.make_blob_url(container_name, blob_name)
+        except Exception as e:
+            self.log.error(e)
+            return None
+
+    def download_stream_from_azure(self, container_name, blob_name, start=0, chunk_size=None):
+        """
+        Read a blob chunk by chunk with ranged gets, so that the blob can be sent to client without being loaded into
+        memory at once, e.g. Response(adapter.download_stream_from_azure(...)).
+
+        :type start: int
+        :param start: offset to start from, to resume a download
+
+        :type chunk_size: int
+        :param chunk_size: size of each ranged get, 'storage.azure.download_chunk_size' by default
+
+        :rtype: generator
+        :return: generator of chunks
+        """
+        chunk_size = chunk_size or self.util.safe_get_config("storage.azure.download_chunk_size",
+                                                             DOWNLOAD_CHUNK_SIZE)
+        size = self.get_blob_size(container_name, blob_name)
+        offset = start
+        while offset < size:
+            end = min(offset + chunk_size, size) - 1
+            chunk = self.service.get_blob(container_name, blob_name, x_ms_range="bytes=%d-%d" % (offset, end))
+            if not chunk:
+                break
+            offset += len(chunk)
+            yield chunk
+
+    def get_blob_size(self, container_name, blob_name):
+        """Get the size of a blob in bytes
+
+        :rtype: int
+        """
+        properties = self.service.get_blob_properties(container_name, blob_name)
+        return int(properties["content-length"])
+
+    def __get_uncommitted_block_ids(self, container_name, blob_name):
+        try:
+            block_list = self.service.get_block_list(container_name, blob_name, None, "uncommitted")
+            return set(block.id for block in block_list.uncommitted_blocks)
+        except AzureMissingResourceHttpError:
+            return set()
+
     def delete_file_from_azure(self, container_name, blob_name):
         try:
             if self.create_container_in_storage(container_name, 'container'):
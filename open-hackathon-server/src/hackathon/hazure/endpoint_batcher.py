@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) Microsoft Open Technologies (Shanghai) Co. Ltd.  All rights reserved.
+
+The MIT License (MIT)
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+__all__ = ["AzureEndpointBatcher"]
+
+import time
+from threading import Lock, Event
+
+from hackathon import Component
+from constants import ASYNC_OP_RESULT
+from utils import find_unassigned_endpoints, add_endpoint_to_network_config, delete_endpoint_from_network_config
+
+DEPLOYMENT_SLOT = "Production"
+
+
+class AzureEndpointBatcher(Component):
+    """Assign public endpoints of many container starts on the same VM in one network config update
+
+    Azure serializes updates of a deployment, so updating the network config once per container start makes concurrent
+    starts on the same cloud service queue behind each other or fail. Callers of 'assign' on the same
+    (cloud service, VM) are collected into a batch: the first caller waits for 'window_seconds' and for the previous
+    update of the VM to finish, then reads the assigned endpoints and the network config once, assigns endpoints for
+    the whole batch and updates the network config once. Every caller gets its own public ports and the request id of
+    the shared update. Batches of the same VM are applied one by one, and so are releases by 'release'.
+
+    Settings under 'azure.endpoint_batch' of config.py:
+        window_seconds: float, default 1
+        previous_op_timeout_seconds: int, default 60
+        wait_timeout_seconds: int, how long a caller waits for its batch, default 180
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        # (cloud_service_name, virtual_machine_name): requests not applied yet
+        self.pending = {}
+        # (cloud_service_name, virtual_machine_name): Lock, applying batches of a VM one by one
+        self.vm_locks = {}
+        # (cloud_service_name, virtual_machine_name): request id of the last update
+        self.last_request_ids = {}
+
+    def assign(self, vm_adapter, cloud_service_name, virtual_machine_name, host_ports):
+        """Assign public endpoints for ports on the docker host VM
+
+        :type vm_adapter: VirtualMachineAdapter
+        :param vm_adapter: adapter of the subscription where the VM is
+
+        :type host_ports: list
+        :param host_ports: ports on the docker host VM that need public endpoints
+
+        :rtype: tuple
+        :return: (public ports in the same order of host_ports, request id of the network config update)
+        """
+        key = (cloud_service_name, virtual_machine_name)
+        request = {"host_ports": host_ports, "done": Event(), "public_ports": None, "request_id": None, "error": None}
+        with self.lock:
+            batch = self.pending.setdefault(key, [])
+            batch.append(request)
+            is_leader = len(batch) == 1
+            vm_lock = self.vm_locks.setdefault(key, Lock())
+
+        if is_leader:
+            with vm_lock:
+                self.__apply(vm_adapter, key)
+
+        if not request["done"].wait(self.__get_config("wait_timeout_seconds", 180)):
+            raise Exception("timeout when waiting for endpoints of %s/%s" % key)
+        if request["error"]:
+            raise Exception(request["error"])
+        return request["public_ports"], request["request_id"]
+
+    def release(self, vm_adapter, cloud_service_name, virtual_machine_name, host_ports):
+        """Remove public endpoints of ports on the docker host VM in one network config update
+
+        Applied under the lock of the VM after its previous update finished, never racing with batches of 'assign'.
+
+        :type host_ports: list
+        :param host_ports: ports on the docker host VM whose public endpoints to be removed
+
+        :rtype: str|unicode
+        :return: request id of the network config update
+        """
+        key = (cloud_service_name, virtual_machine_name)
+        with self.lock:
+            vm_lock = self.vm_locks.setdefault(key, Lock())
+
+        with vm_lock:
+            self.__wait_for_previous_update(vm_adapter, key)
+            deployment_name = vm_adapter.get_deployment_name(cloud_service_name, DEPLOYMENT_SLOT)
+            network_config = vm_adapter.get_virtual_machine_network_config(cloud_service_name,
+                                                                           deployment_name,
+                                                                           virtual_machine_name)
+            new_network_config = delete_endpoint_from_network_config(network_config, host_ports)
+            result = vm_adapter.update_virtual_machine_network_config(cloud_service_name,
+                                                                      deployment_name,
+                                                                      virtual_machine_name,
+                                                                      new_network_config)
+            self.last_request_ids[key] = result.request_id
+            return result.request_id
+
+    def __apply(self, vm_adapter, key):
+        time.sleep(self.__get_config("window_seconds", 1))
+        self.__wait_for_previous_update(vm_adapter, key)
+
+        # requests arrive after this point go to the next batch
+        with self.lock:
+            batch = self.pending.pop(key, [])
+
+        cloud_service_name, virtual_machine_name = key
+        try:
+            host_ports = [port for request in batch for port in request["host_ports"]]
+            self.log.debug("assign %d endpoints of %d starts on %s/%s" %
+                           (len(host_ports), len(batch), cloud_service_name, virtual_machine_name))
+
+            assigned_endpoints = vm_adapter.get_assigned_endpoints(cloud_service_name)
+            if not assigned_endpoints:
+                raise Exception("fail to get assigned endpoints: %s" % cloud_service_name)
+
+            public_ports = find_unassigned_endpoints(host_ports, assigned_endpoints)
+            deployment_name = vm_adapter.get_deployment_name(cloud_service_name, DEPLOYMENT_SLOT)
+            network_config = vm_adapter.get_virtual_machine_network_config(cloud_service_name,
+                                                                           deployment_name,
+                                                                           virtual_machine_name)
+            new_network_config = add_endpoint_to_network_config(network_config, public_ports, host_ports)
+            result = vm_adapter.update_virtual_machine_network_config(cloud_service_name,
+                                                                      deployment_name,
+                                                                      virtual_machine_name,
+                                                                      new_network_config)
+            self.last_request_ids[key] = result.request_id
+
+            offset = 0
+            for request in batch:
+                count = len(request["host_ports"])
+                request["public_ports"] = public_ports[offset:offset + count]
+                request["request_id"] = result.request_id
+                offset += count
+        except Exception as e:
+            self.log.error(e)
+            for request in batch:
+                request["error"] = "fail to assign endpoints on %s/%s: %r" % (cloud_service_name,
+                                                                              virtual_machine_name, e)
+        finally:
+            for request in batch:
+                request["done"].set()
+
+    def __wait_for_previous_update(self, vm_adapter, key):
+        request_id = self.last_request_ids.get(key)
+        if not request_id:
+            return
+
+        deadline = time.time() + self.__get_config("previous_op_timeout_seconds", 60)
+        while time.time() < deadline:
+            try:
+                if vm_adapter.get_operation_status(request_id).status != ASYNC_OP_RESULT.IN_PROGRESS:
+                    break
+            except Exception as e:
+                self.log.error(e)
+                break
+            time.sleep(1)
+        self.last_request_ids.pop(key, None)
+
+    def __get_config(self, key, default):
+        return self.util.safe_get_config("azure.endpoint_batch." + key, default)
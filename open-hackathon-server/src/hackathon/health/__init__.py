@@ -47,7 +47,8 @@ all_health_items = {
     "guacamole": RequiredFeature("health_check_guacamole"),
     "azure": RequiredFeature("health_check_azure"),
     "storage": RequiredFeature("storage"),
-    "mongodb": RequiredFeature("health_check_mongodb")
+    "mongodb": RequiredFeature("health_check_mongodb"),
+    "cache": RequiredFeature("cache")
 }
 
 # basic health check items which are fundamental for OHP
@@ -133,11 +133,13 @@ class AzureHealthCheck(HealthCheck):
                 STATUS: HEALTH_STATUS.WARNING,
                 DESCRIPTION: "No Azure key found"
             }
-        service = CloudServiceAdapter(azure_key.id)
+        registry = RequiredFeature("azure_adapter_registry")
+        service = registry.get_adapter_by_key(azure_key, CloudServiceAdapter)
         if service.ping():
             return {
                 STATUS: HEALTH_STATUS.OK,
-                "type": "Azure Storage"
+                "type": "Azure Storage",
+                "api_calls": registry.get_api_call_stats()
             }
         else:
             return {
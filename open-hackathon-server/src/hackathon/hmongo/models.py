@@ -83,6 +83,11 @@ class UserEmail(EmbeddedDocument):
     verified = BooleanField()
 
 
+class ImageDerivative(EmbeddedDocument):
+    url = StringField()  # url of the original image
+    variants = DictField()  # variant name(IMAGE_VARIANT in constants.py) -> url of the resized image
+
+
 class UserProfile(DynamicEmbeddedDocument):
     address = StringField()
     age = IntField(min_value=1)
@@ -98,6 +103,7 @@ class UserProfile(DynamicEmbeddedDocument):
     wechat = StringField()
     weibo = StringField()
     avatar_url = URLField()  # high priority than avatar_url in User
+    avatar_derivative = EmbeddedDocumentField(ImageDerivative)
 
 
 class User(HDocumentBase):
@@ -155,6 +161,7 @@ class Template(HDocumentBase):
     description = StringField()
     virtual_environment_count = IntField(min_value=1, required=True)
     creator = ReferenceField(User)
+    version = IntField(default=1)  # increased on every update, local copies of template are keyed by it
 
     def __init__(self, **kwargs):
         super(Template, self).__init__(**kwargs)
@@ -188,6 +195,7 @@ class AzureKey(HDocumentBase):
     # pem_url is "encrypted" pem file path in azure, so be careful to use this,
     # at the most time you should use get_local_pem_url()
     pem_url = StringField(required=True)
+    pem_hash = StringField()  # sha256 of the plaintext pem file, names the local decrypted copy
     subscription_id = StringField(required=True)
     management_host = StringField(required=True)
     verified = BooleanField()
@@ -204,6 +212,7 @@ class Hackathon(HDocumentBase):
     location = StringField()
     description = StringField()
     banners = ListField()
+    banner_derivatives = EmbeddedDocumentListField(ImageDerivative)
     status = IntField(default=0)  # 0-new 1-online 2-offline
     creator = ReferenceField(User)
     config = DictField()  # max_enrollment, auto_approve, login_provider
@@ -287,8 +296,10 @@ class Team(HDocumentBase):
     name = StringField(required=True)
     description = StringField()
     logo = StringField()
+    logo_derivative = EmbeddedDocumentField(ImageDerivative)
     leader = ReferenceField(User)
     cover = StringField()
+    cover_derivative = EmbeddedDocumentField(ImageDerivative)
     project_name = StringField()
     project_description = StringField()
     dev_plan = StringField()
@@ -323,6 +334,19 @@ class DockerHostServer(HDocumentBase):
         super(DockerHostServer, self).__init__(**kwargs)
 
 
+class DockerHostScaleDecision(HDocumentBase):
+    """Decision log of docker host autoscaler"""
+    hackathon = ReferenceField(Hackathon)
+    action = StringField(required=True)  # provision, decommission, timeout or failed
+    count = IntField(default=0)
+    host_server_name = StringField()
+    reason = StringField()
+    metrics = DictField()
+
+    def __init__(self, **kwargs):
+        super(DockerHostScaleDecision, self).__init__(**kwargs)
+
+
 class PortBinding(DynamicEmbeddedDocument):
     # for simplicity, the port won't be released until the corresponding container removed(not stopped).
     # that means a port occupied by stopped container won't be allocated to new container. So it's possible to start the
@@ -424,3 +448,78 @@ class Experiment(HDocumentBase):
 
     def __init__(self, **kwargs):
         super(Experiment, self).__init__(**kwargs)
+
+
+class ExprAdmissionTicket(HDocumentBase):
+    """A request to start experiment waiting in admission queue"""
+    experiment = ReferenceField(Experiment)
+    hackathon = ReferenceField(Hackathon)
+    template = ReferenceField(Template)
+    user = ReferenceField(User)
+    status = IntField(default=0)  # ADMISSION_STATUS in constants.py
+    admit_time = DateTimeField()
+    host_server = ReferenceField(DockerHostServer)  # the host reserved on admission, None if no host is ready
+
+    def __init__(self, **kwargs):
+        super(ExprAdmissionTicket, self).__init__(**kwargs)
+
+
+class TeardownJob(HDocumentBase):
+    """Progress of the bulk teardown of a hackathon's experiments, see ExprManager.teardown_hackathon"""
+    hackathon = ReferenceField(Hackathon, unique=True)
+    status = StringField()  # running or finished
+    start_time = DateTimeField()
+    end_time = DateTimeField()
+    hosts = IntField(default=0)
+    hosts_done = IntField(default=0)
+    total = IntField(default=0)
+    stopped = IntField(default=0)
+    failed = IntField(default=0)
+
+    def __init__(self, **kwargs):
+        super(TeardownJob, self).__init__(**kwargs)
+
+
+class StorageObject(HDocumentBase):
+    """A physical file in storage shared by all uploads with the same content"""
+    file_type = StringField(required=True)  # FILE_TYPE in constants.py
+    content_hash = StringField(required=True)  # sha256 of the content
+    size = IntField(default=0)
+    url = StringField(required=True)
+    physical_path = StringField()
+    ref_count = IntField(default=1)
+
+    meta = {
+        "indexes": [
+            {
+                "fields": ["file_type", "content_hash"],
+                "unique": True},
+            "url"]}
+
+    def __init__(self, **kwargs):
+        super(StorageObject, self).__init__(**kwargs)
+
+
+class CacheInvalidation(HDocumentBase):
+    """Cache invalidation broadcast to all processes, see CacheInvalidationBus"""
+    origin = StringField()  # the process which invalidated the cache
+    key = StringField()  # invalidate a single key
+    prefix = StringField()  # or all keys start with prefix, "" for all
+
+    meta = {
+        "max_documents": 10000,
+        "max_size": 4 * 1024 * 1024}
+
+    def __init__(self, **kwargs):
+        super(CacheInvalidation, self).__init__(**kwargs)
+
+
+class SchedulerLease(HDocumentBase):
+    """Lease of scheduler leader which runs singleton jobs, see LeaderElection"""
+    name = StringField(unique=True, required=True)
+    holder = StringField()  # the process holding the lease
+    token = IntField(default=0)  # fencing token, increased every time the lease is taken over
+    expire_time = DateTimeField()
+
+    def __init__(self, **kwargs):
+        super(SchedulerLease, self).__init__(**kwargs)
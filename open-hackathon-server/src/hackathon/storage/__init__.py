@@ -25,4 +25,4 @@ THE SOFTWARE.
 
 from azure_storage import AzureStorage
 from local_storage import LocalStorage
-
+from dedup_storage import DedupStorage
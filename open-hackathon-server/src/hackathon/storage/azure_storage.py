@@ -27,7 +27,10 @@ import json
 import os
 from time import strftime
 from uuid import uuid1
+from urlparse import urlparse
 
+import mimetypes
+from flask import Response, stream_with_context
 from werkzeug.datastructures import FileStorage
 
 from hackathon import RequiredFeature
@@ -63,8 +66,11 @@ class AzureStorage(Storage):
 
         if context.get('content'):
             file_content = context.content
-            if isinstance(file_content, file) or isinstance(file_content, FileStorage):
-                result = self.azure_blob_service.upload_file_to_azure(container_name, blob_name, file_content)
+            if isinstance(file_content, FileStorage):
+                # upload chunk by chunk, never read the whole file into memory
+                result = self.azure_blob_service.upload_stream_to_azure(container_name, blob_name, file_content.stream)
+            elif isinstance(file_content, file):
+                result = self.azure_blob_service.upload_stream_to_azure(container_name, blob_name, file_content)
             elif isinstance(file_content, dict):
                 text = json.dumps(file_content)
                 result = self.azure_blob_service.upload_file_to_azure_from_text(container_name, blob_name, text)
@@ -101,6 +107,33 @@ class AzureStorage(Storage):
             self.log.error(e)
             return False
 
+    def open_stream(self, url, start=0):
+        """Read a file from Azure storage chunk by chunk
+
+        :type url: str|unicode
+        :param url: the url of file which are created in 'save'
+
+        :type start: int
+        :param start: offset to start from, to resume a download
+
+        :rtype: generator
+        :return: generator of chunks which can be passed to flask Response directly
+        """
+        # http://<account>.blob.core.chinacloudapi.cn/<container>/<blob_name>, blob_name may contain '/'
+        container_name, blob_name = urlparse(url).path.lstrip('/').split('/', 1)
+        return self.azure_blob_service.download_stream_from_azure(container_name, blob_name, start=start)
+
+    def send_file(self, url):
+        """Make a response which streams the blob chunk by chunk
+
+        :type url: str|unicode
+        :param url: the url of file which are created in 'save'
+
+        :rtype: Response
+        """
+        mimetype = mimetypes.guess_type(url)[0] or "application/octet-stream"
+        return Response(stream_with_context(self.open_stream(url)), mimetype=mimetype)
+
     def report_health(self):
         """Report the status of Azure storage"""
         try:
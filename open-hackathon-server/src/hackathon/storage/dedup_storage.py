@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) Microsoft Open Technologies (Shanghai) Co. Ltd.  All rights reserved.
+ 
+The MIT License (MIT)
+ 
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+ 
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+ 
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import sys
+
+sys.path.append("..")
+
+import json
+import hashlib
+import tempfile
+from mongoengine import NotUniqueError
+from werkzeug.datastructures import FileStorage
+
+from hackathon import RequiredFeature
+from hackathon.hmongo.models import StorageObject
+from storage import Storage
+
+__all__ = ["DedupStorage"]
+
+CHUNK_SIZE = 64 * 1024
+
+
+class DedupStorage(Storage):
+    """Content-addressed storage on top of another Storage
+
+    Content is hashed before saving. Uploads with the same content and file type share one physical file: the url of
+    the existing file is returned and its reference count increased. 'delete' decreases the reference count and the
+    physical file is deleted only if no reference is left. The index is saved in collection 'storage_object'.
+
+    Files saved before the index existed are not in the index and are deleted directly.
+
+    Streams are copied to a temp file while hashing so that the content can be read again by the real storage.
+    """
+
+    def __init__(self):
+        # resolved per instance, 'storage_backend' is provided only if dedup is enabled
+        self.backend = RequiredFeature("storage_backend")
+
+    def save(self, context):
+        """Save a file unless a file of the same content exists
+
+        :type context: Context
+        :param context: the execution context of file saving. Must contain file_name, file_type, content or file_path
+
+        :rtype: Context
+        :return: the updated context which includes url, physical_path(if any), content_hash and size
+        """
+        content_hash, size, spooled = self.__hash_content(context)
+        try:
+            existing = self.__add_reference(context.file_type, content_hash)
+            if existing:
+                self.log.debug("duplicate file, reuse %s" % existing.url)
+                return self.__fill_context(context, existing)
+
+            if spooled:
+                context.content = spooled
+            context = self.backend.save(context)
+        finally:
+            if spooled:
+                spooled.close()
+
+        storage_object = StorageObject(file_type=context.file_type,
+                                       content_hash=content_hash,
+                                       size=size,
+                                       url=context.url,
+                                       physical_path=context.get("physical_path"),
+                                       ref_count=1,
+                                       create_time=self.util.get_now())
+        try:
+            storage_object.save()
+        except NotUniqueError:
+            # the same content was saved by another request at the same time, keep the first one
+            self.backend.delete(context.url)
+            existing = self.__add_reference(context.file_type, content_hash)
+            if existing:
+                return self.__fill_context(context, existing)
+            raise
+
+        context.content_hash = content_hash
+        context.size = size
+        return context
+
+    def delete(self, url):
+        """Release a reference of file, the file is deleted when no reference is left
+
+        :type url: str|unicode
+        :param url: the url of file to be deleted which are created in 'save'
+
+        :rtype: bool
+        :return: True if the reference is released or the file is deleted
+        """
+        storage_object = StorageObject.objects(url=url).modify(dec__ref_count=1, new=True)
+        if storage_object is None:
+            return self.backend.delete(url)
+
+        if storage_object.ref_count > 0:
+            self.log.debug("file %s still referenced %d times" % (url, storage_object.ref_count))
+            return True
+
+        # delete only if no reference is added in between
+        if StorageObject.objects(id=storage_object.id, ref_count__lte=0).delete():
+            return self.backend.delete(url)
+        return True
+
+    def send_file(self, url):
+        return self.backend.send_file(url)
+
+    def open_stream(self, url, start=0):
+        return self.backend.open_stream(url, start)
+
+    def report_health(self):
+        return self.backend.report_health()
+
+    def __add_reference(self, file_type, content_hash):
+        return StorageObject.objects(file_type=file_type, content_hash=content_hash, ref_count__gt=0) \
+            .modify(inc__ref_count=1, new=True)
+
+    def __fill_context(self, context, storage_object):
+        context.url = storage_object.url
+        context.physical_path = storage_object.physical_path
+        context.content_hash = storage_object.content_hash
+        context.size = storage_object.size
+        return context
+
+    def __hash_content(self, context):
+        """Hash the content of context
+
+        :rtype: tuple
+        :return: (sha256 hex digest, size, temp file holding the content if content is a stream otherwise None)
+        """
+        sha = hashlib.sha256()
+        content = context.get("content")
+        if content is None:
+            with open(context.file_path, "rb") as f:
+                size = self.__copy(f, sha, None)
+            return sha.hexdigest(), size, None
+
+        if isinstance(content, FileStorage) or isinstance(content, file):
+            stream = content.stream if isinstance(content, FileStorage) else content
+            spooled = tempfile.TemporaryFile()
+            size = self.__copy(stream, sha, spooled)
+            spooled.seek(0)
+            return sha.hexdigest(), size, spooled
+
+        data = json.dumps(content) if isinstance(content, dict) else str(content)
+        sha.update(data)
+        return sha.hexdigest(), len(data), None
+
+    @staticmethod
+    def __copy(stream, sha, out):
+        size = 0
+        for chunk in iter(lambda: stream.read(CHUNK_SIZE), ""):
+            sha.update(chunk)
+            size += len(chunk)
+            if out:
+                out.write(chunk)
+        return size
@@ -31,18 +31,29 @@ from os.path import realpath, dirname, isfile, abspath
 import json
 import time
 import uuid
+import hashlib
+import mimetypes
+from flask import send_file, Response
 from werkzeug.datastructures import FileStorage
+from werkzeug.exceptions import NotFound
 
 from hackathon.constants import FILE_TYPE, HEALTH_STATUS, HEALTH
 from storage import Storage
 
 __all__ = ["LocalStorage"]
 
+CHUNK_SIZE = 64 * 1024
+
 
 class LocalStorage(Storage):
     """Hackathon file storage that saves all templates on local disk
 
     files will be save at "<src_dir>/open-hackathon-server/src/hackathon/upload/<file_type>"
+
+    Uploads are streamed to a temp file in chunks of 'storage.local.chunk_size' and renamed to the target path once
+    finished, so that memory is bounded and no one reads a partial file. If 'storage.local.accel_redirect_location' is
+    configured(an internal location of nginx which aliases to '<base_dir>/static/upload'), 'send_file' only returns
+    the X-Accel-Redirect header and nginx sends the file.
     """
 
     def save(self, context):
@@ -55,7 +66,7 @@ class LocalStorage(Storage):
         :return the updated context which should including the full path of saved file
         """
         context = self.__generate_paths(context)
-        self.__save_file(context.content, context.physical_path)
+        context.content_hash, context.size = self.__save_file(context.content, context.physical_path)
         self.log.debug("file saved at:" + context.physical_path)
         return context
 
@@ -76,6 +87,45 @@ class LocalStorage(Storage):
             self.log.warn("try to remove dir or non-existed file")
             return False
 
+    def send_file(self, url):
+        """Make a response to download a saved file without reading it in python
+
+        :type url: str|unicode
+        :param url: the url of file which are created in 'save'
+
+        :rtype: Response
+        """
+        path = self.__get_upload_file_path(url)
+        upload_dir = realpath("%s/static/upload" % self.base_dir)
+
+        location = self.util.safe_get_config("storage.local.accel_redirect_location", "")
+        if location:
+            response = Response(mimetype=mimetypes.guess_type(path)[0] or "application/octet-stream")
+            response.headers["X-Accel-Redirect"] = location.rstrip("/") + path[len(upload_dir):]
+            return response
+
+        # served by wsgi.file_wrapper which uses sendfile if available
+        return send_file(path, conditional=True)
+
+    def open_stream(self, url, start=0):
+        """Read a saved file chunk by chunk
+
+        :type url: str|unicode
+        :param url: the url of file which are created in 'save'
+
+        :type start: int
+        :param start: offset to start from
+
+        :rtype: generator
+        :return: generator of chunks
+        """
+        path = self.__get_upload_file_path(url)
+        chunk_size = self.util.safe_get_config("storage.local.chunk_size", CHUNK_SIZE)
+        with open(path, "rb") as f:
+            f.seek(start)
+            for chunk in iter(lambda: f.read(chunk_size), ""):
+                yield chunk
+
     def report_health(self):
         """The status of local storage should be always True"""
         return {
@@ -97,22 +147,45 @@ class LocalStorage(Storage):
     def __save_file(self, content, path):
         """Dump file to disk
 
-        An existing file with the same name will be erased
+        An existing file with the same name will be erased. Content is written to a temp file chunk by chunk and the
+        temp file is renamed to 'path' at last.
 
         :type content: file | dict | FileStorage
         :param content: the content of file to be saved. Can be a file object or a dict
 
         :type path: str | unicode
         :param path: the file path
+
+        :rtype: tuple
+        :return: (sha256 hex digest of content, size in bytes)
         """
         self.__ensure_dir(path)
-        with open(path, 'w') as f:
-            if isinstance(content, dict):
-                json.dump(content, f)
-            elif isinstance(content, file) or isinstance(content, FileStorage):
-                f.write(content.read())
-            else:
-                f.write(str(content))
+        if isinstance(content, FileStorage):
+            stream = content.stream
+        elif isinstance(content, file):
+            stream = content
+        else:
+            stream = None
+            data = json.dumps(content) if isinstance(content, dict) else str(content)
+
+        chunk_size = self.util.safe_get_config("storage.local.chunk_size", CHUNK_SIZE)
+        sha = hashlib.sha256()
+        size = 0
+        tmp_path = "%s.%s.tmp" % (path, uuid.uuid1().hex)
+        try:
+            with open(tmp_path, 'wb') as f:
+                chunks = iter(lambda: stream.read(chunk_size), "") if stream else [data]
+                for chunk in chunks:
+                    sha.update(chunk)
+                    size += len(chunk)
+                    f.write(chunk)
+            os.rename(tmp_path, path)
+        except Exception:
+            if isfile(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        return sha.hexdigest(), size
 
     @staticmethod
     def __get_storage_base_dir():
@@ -135,6 +208,17 @@ class LocalStorage(Storage):
 
         return context
 
+    def __get_upload_file_path(self, url):
+        """Return the physical path of a file saved by 'save', raise NotFound if it is not an uploaded file"""
+        if "static" not in url:
+            raise NotFound("file not found")
+
+        upload_dir = realpath("%s/static/upload" % self.base_dir)
+        path = realpath(self.__convert_url_to_physical_path(url))
+        if not path.startswith(upload_dir + "/") or not isfile(path):
+            raise NotFound("file not found")
+        return path
+
     def __convert_url_to_physical_path(self, url):
         """Return the physical_path according to its url
 
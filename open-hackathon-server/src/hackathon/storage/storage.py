@@ -68,6 +68,32 @@ class Storage(Component):
         """
         return
 
+    @abc.abstractmethod
+    def send_file(self, url):
+        """Make a flask response to download a saved file without loading the whole file into memory
+
+        :type url: str|unicode
+        :param url: the url of file which are created in 'save'
+
+        :rtype Response
+        """
+        return
+
+    @abc.abstractmethod
+    def open_stream(self, url, start=0):
+        """Read a saved file chunk by chunk
+
+        :type url: str|unicode
+        :param url: the url of file which are created in 'save'
+
+        :type start: int
+        :param start: offset to start from
+
+        :rtype: generator
+        :return: generator of chunks
+        """
+        return
+
     @abc.abstractmethod
     def report_health(self):
         """report health status of the storage"""
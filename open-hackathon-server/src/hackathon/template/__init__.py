@@ -24,6 +24,7 @@ THE SOFTWARE.
 """
 
 from template_library import TemplateLibrary
+from template_cache import TemplateFileCache
 from template_constants import *
 from template_content import TemplateContent
 from docker_template_unit import DockerTemplateUnit
@@ -30,7 +30,7 @@ from template_constants import DOCKER_UNIT
 from template_unit import TemplateUnit
 from hackathon.constants import VE_PROVIDER
 
-__all__ = ["DockerTemplateUnit"]
+__all__ = ["DockerTemplateUnit", "DockerUnitPlan", "DockerUnitInstance"]
 
 
 class DockerTemplateUnit(TemplateUnit):
@@ -208,3 +208,123 @@ class DockerTemplateUnit(TemplateUnit):
 
         map(lambda p: convert(p), self.dic[DOCKER_UNIT.PORTS])
         return instance_ports
+
+    def compile(self):
+        return DockerUnitPlan(self)
+
+    def instantiate(self, name):
+        return self.compile().instantiate(name)
+
+
+class DockerUnitPlan(TemplateUnit):
+    """Precomputed docker unit which is shared by all experiments started from the same template version
+
+    Everything that doesn't depend on a single container is computed once: the container config without port bindings,
+    port list, remote config, env vars and instance ports of alauda. A plan must not be modified, call 'instantiate'
+    to get a unit for one container.
+    """
+
+    def __init__(self, unit):
+        super(DockerUnitPlan, self).__init__(VE_PROVIDER.DOCKER)
+        self.name = unit.get_name()
+        self.type = unit.get_type()
+        self.description = unit.get_description()
+        self.image_with_tag = unit.get_image_with_tag()
+        self.run_command = unit.get_run_command()
+        self.remote = unit.get_remote()
+        self.ports = [dict(p) for p in unit.get_ports()]
+        self.instance_env_vars = unit.get_instance_env_vars()
+        self.instance_ports = unit.get_instance_ports()
+        self.container_config = self.__compile_container_config(unit.dic, self.ports)
+
+    def instantiate(self, name):
+        """Return a unit for one container which has its own name and port list"""
+        instance = DockerUnitInstance.__new__(DockerUnitInstance)
+        instance.__dict__.update(self.__dict__)
+        instance.name = name
+        instance.ports = [dict(p) for p in self.ports]
+        return instance
+
+    def get_name(self):
+        return self.name
+
+    def get_type(self):
+        return self.type
+
+    def get_description(self):
+        return self.description
+
+    def get_image_with_tag(self):
+        return self.image_with_tag
+
+    def get_image_without_tag(self):
+        return self.image_with_tag.split(':')[0]
+
+    def get_tag(self):
+        return self.image_with_tag.split(':')[1]
+
+    def get_run_command(self):
+        return self.run_command
+
+    def get_ports(self):
+        return self.ports
+
+    def get_remote(self):
+        return self.remote
+
+    def get_instance_env_vars(self):
+        return self.instance_env_vars
+
+    def get_instance_ports(self):
+        return self.instance_ports
+
+    @staticmethod
+    def get_port_key(port):
+        return '%d/%s' % (port[DOCKER_UNIT.PORTS_PORT], port.get(DOCKER_UNIT.PORTS_PROTOCOL) or 'tcp')
+
+    def __compile_container_config(self, dic, ports):
+        """The same as DockerTemplateUnit.get_container_config except that port bindings are left empty"""
+        config = dict(dic)
+        for key in [DOCKER_UNIT.NAME, DOCKER_UNIT.TYPE, DOCKER_UNIT.PROVIDER, DOCKER_UNIT.DESCRIPTION,
+                    DOCKER_UNIT.PORTS, DOCKER_UNIT.REMOTE]:
+            config.pop(key, None)
+        if not config.get(DOCKER_UNIT.CMD):
+            config.pop(DOCKER_UNIT.CMD, None)
+        if not config.get(DOCKER_UNIT.ENTRY_POINT):
+            config.pop(DOCKER_UNIT.ENTRY_POINT, None)
+
+        exposed_ports = dict(config[DOCKER_UNIT.EXPOSED_PORTS])
+        for p in ports:
+            exposed_ports[self.get_port_key(p)] = {}
+        config[DOCKER_UNIT.EXPOSED_PORTS] = exposed_ports
+
+        host_config = dict(config[DOCKER_UNIT.HOST_CONFIG])
+        host_config[DOCKER_UNIT.HOST_CONFIG_PORT_BINDING] = {}
+        config[DOCKER_UNIT.HOST_CONFIG] = host_config
+        return config
+
+
+class DockerUnitInstance(DockerUnitPlan):
+    """Unit of a single container instantiated from DockerUnitPlan, only name and ports belong to itself"""
+
+    def set_name(self, name):
+        self.name = name
+
+    def set_ports(self, port_cfg):
+        self.ports = port_cfg
+
+    def get_container_config(self):
+        """Compose post data for docker remote api create by filling host ports into the precomputed config
+
+        Dicts of the plan are copied only along the path to PortBindings
+        """
+        bindings = {}
+        for p in self.ports:
+            bindings[self.get_port_key(p)] = [{DOCKER_UNIT.HOST_CONFIG_HOST_IP: '',
+                              DOCKER_UNIT.HOST_CONFIG_HOST_PORT: str(p[DOCKER_UNIT.PORTS_HOST_PORT])}]
+
+        host_config = dict(self.container_config[DOCKER_UNIT.HOST_CONFIG])
+        host_config[DOCKER_UNIT.HOST_CONFIG_PORT_BINDING] = bindings
+        config = dict(self.container_config)
+        config[DOCKER_UNIT.HOST_CONFIG] = host_config
+        return config
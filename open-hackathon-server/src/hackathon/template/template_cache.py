@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) Microsoft Open Technologies (Shanghai) Co. Ltd.  All rights reserved.
+
+The MIT License (MIT)
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import sys
+
+sys.path.append("..")
+import os
+import json
+import glob
+import uuid
+import requests
+from os.path import isfile, dirname, realpath, abspath
+
+from hackathon import Component
+
+__all__ = ["TemplateFileCache"]
+
+
+class TemplateFileCache(Component):
+    """Local copies of template files to survive storage failures
+
+    The content of a template is saved as '<cache_dir>/<template id>-<version>.json' together with the ETag and
+    Last-Modified header of the response in '<template id>-<version>.meta'. A cached copy is revalidated by conditional
+    request and the local copy is used if storage returns 304 or is unavailable. A new version of template replaces
+    all older copies.
+    """
+
+    def load(self, template):
+        """Load the content of template, from local cache if it's still valid
+
+        :type template: Template
+        :param template: the template whose content to be loaded
+
+        :rtype: dict
+        :return: the content of template or None if neither storage nor local cache is available
+        """
+        path = self.__get_cache_path(template)
+        meta = self.__read_meta(path)
+        if meta and meta.get("url") != template.url:
+            meta = None
+
+        headers = {}
+        if meta and meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta and meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+        try:
+            timeout = self.util.safe_get_config("template.cache.request_timeout_seconds", 10)
+            resp = requests.get(template.url, headers=headers, timeout=timeout)
+            if resp.status_code == 304 and meta:
+                return self.__read_content(path)
+
+            resp.raise_for_status()
+            content = json.loads(resp.content)
+            self.__save(template, path, resp.content, {
+                "url": template.url,
+                "etag": resp.headers.get("ETag"),
+                "last_modified": resp.headers.get("Last-Modified")})
+            return content
+        except Exception as e:
+            self.log.warn("Fail to load template from remote file %s: %r" % (template.url, e))
+
+        # storage unavailable, use local copies. 'local_path' exists if template saved in LocalStorage
+        for local_path in [path if meta else None, getattr(template, "local_path", None)]:
+            if local_path and isfile(local_path):
+                self.log.warn("use local copy %s of template %s" % (local_path, template.name))
+                return self.__read_content(local_path)
+        return None
+
+    def invalidate(self, template_id):
+        """Remove all local copies of a template
+
+        :type template_id: str|unicode|ObjectId
+        :param template_id: id of Template
+        """
+        for path in glob.glob("%s/%s-*" % (self.__get_cache_dir(), template_id)):
+            self.__remove(path)
+
+    def __save(self, template, path, content, meta):
+        """Save content and meta of template atomically and remove copies of other versions"""
+        for old in glob.glob("%s/%s-*" % (self.__get_cache_dir(), template.id)):
+            if old not in (path, path + ".meta"):
+                self.__remove(old)
+
+        self.__write(path, content)
+        self.__write(path + ".meta", json.dumps(meta))
+
+    def __write(self, path, content):
+        tmp_path = "%s.%s.tmp" % (path, uuid.uuid1().hex)
+        with open(tmp_path, "wb") as f:
+            f.write(content)
+        os.rename(tmp_path, path)
+
+    def __read_content(self, path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except Exception as e:
+            self.log.error("invalid local copy of template %s: %r" % (path, e))
+            return None
+
+    def __read_meta(self, path):
+        if not isfile(path) or not isfile(path + ".meta"):
+            return None
+        return self.__read_content(path + ".meta")
+
+    def __remove(self, path):
+        try:
+            os.remove(path)
+        except OSError as e:
+            self.log.debug(e)
+
+    def __get_cache_path(self, template):
+        return "%s/%s-%d.json" % (self.__get_cache_dir(), template.id, template.version or 1)
+
+    def __get_cache_dir(self):
+        cache_dir = self.util.safe_get_config("template.cache.dir", "") or \
+            abspath("%s/../template_cache" % dirname(realpath(__file__)))
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        return cache_dir
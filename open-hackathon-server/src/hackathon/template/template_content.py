@@ -63,6 +63,18 @@ class TemplateContent:
         units = map(convert_to_unit, args[TEMPLATE.VIRTUAL_ENVIRONMENTS])
         return TemplateContent(name, description, units)
 
+    def compile(self):
+        """Return a TemplateContent of precomputed units which is safe to share between experiments
+
+        :rtype: TemplateContent
+        :return: the compiled TemplateContent or None if any unit cannot be shared(e.g. azure units are modified while
+            starting VM)
+        """
+        units = [u.compile() for u in self.units]
+        if None in units:
+            return None
+        return TemplateContent(self.name, self.description, units)
+
     def to_dict(self):
         dic = {
             TEMPLATE.TEMPLATE_NAME: self.name,
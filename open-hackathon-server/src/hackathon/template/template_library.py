@@ -27,17 +27,16 @@ import sys
 from werkzeug.exceptions import BadRequest, InternalServerError, Forbidden
 
 sys.path.append("..")
-from os.path import isfile
 import json
-import requests
+from threading import Lock
 
 from flask import g, request
 from mongoengine import Q
 
 from hackathon import Component, RequiredFeature, Context
-from hackathon.hmongo.models import Template, Experiment
+from hackathon.hmongo.models import Template, Experiment, Hackathon
 from hackathon.hackathon_response import ok, internal_server_error, forbidden
-from hackathon.constants import FILE_TYPE, TEMPLATE_STATUS
+from hackathon.constants import FILE_TYPE, TEMPLATE_STATUS, HACK_STATUS
 from template_constants import TEMPLATE
 from template_content import TemplateContent
 
@@ -45,10 +44,19 @@ __all__ = ["TemplateLibrary"]
 
 
 class TemplateLibrary(Component):
-    """Component to manage templates"""
+    """Component to manage templates
+
+    Templates loaded for experiments are compiled(see TemplateContent.compile) and kept in memory by template id and
+    version, so that mass starts of the same template don't parse and rebuild the units again and again.
+    """
+
+    # (template id, version) -> compiled TemplateContent, shared by all instances
+    compiled_templates = {}
+    compiled_templates_lock = Lock()
 
     storage = RequiredFeature("storage")
     user_manager = RequiredFeature("user_manager")
+    template_file_cache = RequiredFeature("template_file_cache")
 
     def get_template_info_by_id(self, template_id):
         """Query template basic info from DB by its id
@@ -73,28 +81,44 @@ class TemplateLibrary(Component):
 
     def load_template(self, template):
         """load template into memory either from a local cache path or an remote uri
-        load template from local file > from from azure
+
+        The file is revalidated against storage and local copy is used if not modified or storage is unavailable. See
+        TemplateFileCache
         :param template:
         :return:
         """
 
         def internal_load_template():
-            # todo local cache not valid, disabled temprary
-            # local_path = template.local_path
-            # if local_path is not None and isfile(local_path):
-            #     with open(local_path) as template_file:
-            #         return TemplateContent.from_dict(json.load(template_file))
-            # else:
             try:
-                req = requests.get(template.url)
-                return TemplateContent.from_dict(json.loads(req.content))
+                content = self.template_file_cache.load(template)
+                return TemplateContent.from_dict(content) if content else None
             except Exception as e:
                 self.log.warn("Fail to load template from remote file %s" % template.url)
                 self.log.error(e)
                 return None
 
+        key = (str(template.id), template.version or 1)
+        compiled = self.compiled_templates.get(key)
+        if compiled:
+            return compiled
+
         cache_key = self.__get_template_cache_key(template.id)
-        return self.cache.get_cache(key=cache_key, createfunc=internal_load_template)
+        template_content = self.cache.get_cache(key=cache_key, createfunc=internal_load_template)
+        compiled = template_content.compile() if template_content else None
+        if not compiled:
+            return template_content
+
+        with self.compiled_templates_lock:
+            self.__evict_compiled_template(key[0])
+            self.compiled_templates[key] = compiled
+        return compiled
+
+    def prewarm_templates(self):
+        """Load templates of all online hackathons into local cache"""
+        for hackathon in Hackathon.objects(status=HACK_STATUS.ONLINE).only("templates"):
+            for template in hackathon.templates:
+                if not self.load_template(template):
+                    self.log.warn("fail to prewarm template %s" % template.name)
 
     def create_template(self, args):
         """ Create template """
@@ -152,6 +176,9 @@ class TemplateLibrary(Component):
 
             # remove template cache and storage
             self.cache.invalidate(self.__get_template_cache_key(template_id))
+            self.template_file_cache.invalidate(template_id)
+            with self.compiled_templates_lock:
+                self.__evict_compiled_template(str(template_id))
             self.storage.delete(template.url)
 
             # remove record in DB
@@ -239,8 +266,12 @@ class TemplateLibrary(Component):
                     update_time=self.util.get_now(),
                     provider=provider,
                     description=template_content.description,
-                    virtual_environment_count=len(template_content.units))
+                    virtual_environment_count=len(template_content.units),
+                    inc__version=1)
                 self.cache.invalidate(self.__get_template_cache_key(template.id))
+                self.template_file_cache.invalidate(template.id)
+                with self.compiled_templates_lock:
+                    self.__evict_compiled_template(str(template.id))
 
             return template.dic()
         except Exception as ex:
@@ -275,6 +306,11 @@ class TemplateLibrary(Component):
 
         return criterion
 
+    def __evict_compiled_template(self, template_id):
+        """Remove compiled template of all versions. Must be called with 'compiled_templates_lock' held"""
+        for key in [k for k in self.compiled_templates if k[0] == template_id]:
+            self.compiled_templates.pop(key, None)
+
     def __get_template_cache_key(self, template_id):
         return "__template__%s__" % str(template_id)
 
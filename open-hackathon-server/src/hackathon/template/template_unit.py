@@ -45,3 +45,7 @@ class TemplateUnit(object):
 
     def get_description(self):
         raise NotImplemented
+
+    def compile(self):
+        """Return a read-only unit that can be shared by all experiments of the template, or None if not supported"""
+        return None
@@ -35,7 +35,7 @@ from flask import request, g
 from mongoengine import Q, NotUniqueError, ValidationError
 
 from hackathon.hackathon_response import bad_request, internal_server_error, not_found, ok
-from hackathon.constants import HTTP_HEADER, HACK_USER_TYPE, FILE_TYPE
+from hackathon.constants import HTTP_HEADER, HACK_USER_TYPE, FILE_TYPE, IMAGE_VARIANT, IMAGE_TARGET
 from hackathon import Component, Context, RequiredFeature
 from hackathon.hmongo.models import UserToken, User, UserEmail, UserProfile, UserHackathon
 
@@ -47,6 +47,7 @@ users_operation_time = {}
 class UserManager(Component):
     """Component for user management"""
     admin_manager = RequiredFeature("admin_manager")
+    image_manager = RequiredFeature("image_manager")
 
     def validate_login(self):
         """Make sure user token is included in http request headers and it must NOT be expired
@@ -166,7 +167,7 @@ class UserManager(Component):
             Q(emails__email__icontains=keyword)).paginate(page, per_page)
 
         def get_user_details(user):
-            user_info = self.user_display_info(user)
+            user_info = self.user_display_info(user, IMAGE_VARIANT.THUMBNAIL)
 
             user_hackathon = UserHackathon.objects(hackathon=hackathon, user=user).first()
             user_info["role"] = user_hackathon.role if user_hackathon else HACK_USER_TYPE.VISITOR
@@ -199,7 +200,7 @@ class UserManager(Component):
 
         return ret
 
-    def user_display_info(self, user):
+    def user_display_info(self, user, avatar_variant=None):
         """Return user detail information
 
         Sensitive information like password is filtered
@@ -208,6 +209,9 @@ class UserManager(Component):
         :type user: User
         :param user: User instance to be returned which shouldn't be None
 
+        :type avatar_variant: str|unicode
+        :param avatar_variant: return a resized avatar(see IMAGE_VARIANT in constants.py) instead of the original one
+
         :rtype dict
         :return user detail info from collection User
         """
@@ -219,6 +223,12 @@ class UserManager(Component):
         # set avatar_url to display
         if "profile" in ret and "avatar_url" in ret["profile"]:
             ret["avatar_url"] = ret["profile"]["avatar_url"]
+            if avatar_variant:
+                ret["avatar_url"] = self.image_manager.get_variant_url(user.profile.avatar_derivative,
+                                                                       ret["avatar_url"],
+                                                                       avatar_variant)
+        if "profile" in ret:
+            ret["profile"].pop("avatar_derivative", None)
 
         return ret
 
@@ -226,13 +236,14 @@ class UserManager(Component):
         # todo real talents list
         users = User.objects(name__ne="admin").order_by("-login_times")[:10]
 
-        return [self.user_display_info(u) for u in users]
+        return [self.user_display_info(u, IMAGE_VARIANT.THUMBNAIL) for u in users]
 
     def update_user_avatar_url(self, user, url):
         if not user.profile:
             user.profile = UserProfile()
         user.profile.avatar_url = url
         user.save()
+        self.image_manager.schedule_derivatives(IMAGE_TARGET.USER_AVATAR, user.id, url)
         return True
 
     def upload_files(self, user_id, file_type):
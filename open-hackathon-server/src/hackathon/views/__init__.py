@@ -38,6 +38,9 @@ def init_routes():
     # health page API
     api.add_resource(HealthResource, "/", "/health")
 
+    # runtime statistics of current process, e.g. cache hit ratio
+    api.add_resource(MetricsResource, "/api/metrics")
+
     # system time API
     api.add_resource(CurrentTimeResource, "/api/currenttime")
 
@@ -70,6 +73,7 @@ def init_routes():
     api.add_resource(UserExperimentResource, "/api/user/experiment")  # start or stop experiment
     api.add_resource(UserNoticeReadResource, "/api/user/notice/read")  # read the notice
     api.add_resource(UserFileResource, "/api/user/file")  # login-in user can upload files about team, hackathon or user
+    api.add_resource(FileDownloadResource, "/api/file/download")  # download an uploaded file
 
     # team APIs
     api.add_resource(TeamResource, "/api/team")  # create, update, dismiss and query team
@@ -101,6 +105,8 @@ def init_routes():
     api.add_resource(AdminHackathonTemplateResource, "/api/admin/hackathon/template")  # select template for hackathon
     api.add_resource(AdminExperimentResource, "/api/admin/experiment")  # start expr by admin
     api.add_resource(AdminExperimentListResource, "/api/admin/experiment/list")  # get expr list of hackathon
+    api.add_resource(AdminExperimentTeardownResource,
+                     "/api/admin/experiment/teardown")  # stop all exprs of hackathon in bulk or get progress
     api.add_resource(HackathonAdminListResource, "/api/admin/hackathon/administrator/list")  # list admin/judges
     api.add_resource(HackathonAdminResource, "/api/admin/hackathon/administrator")  # add or delete admin/judge
     api.add_resource(AdminTeamScoreListResource, "/api/admin/team/score/list")  # select or unselect template for team
@@ -110,5 +116,7 @@ def init_routes():
     api.add_resource(UserListResource, "/api/admin/user/list")  # search and get all related users
     api.add_resource(AdminHostserverListResource, "/api/admin/hostserver/list")  # get the list of host server
     api.add_resource(AdminHostserverResource, "/api/admin/hostserver")  # create/update/delete/get a host server
+    api.add_resource(AdminHostserverAutoscaleResource,
+                     "/api/admin/hostserver/autoscale")  # decision log of docker host autoscaler
     api.add_resource(AdminHackathonNoticeResource,
                      "/api/admin/hackathon/notice")  # create/update/delete/get a hackathon notice
@@ -49,6 +49,9 @@ expr_manager = RequiredFeature("expr_manager")
 admin_manager = RequiredFeature("admin_manager")
 guacamole = RequiredFeature("guacamole")
 docker_host_manager = RequiredFeature("docker_host_manager")
+docker_host_autoscaler = RequiredFeature("docker_host_autoscaler")
+cache = RequiredFeature("cache")
+scheduler = RequiredFeature("scheduler")
 
 util = RequiredFeature("util")
 """Resources for OHP itself"""
@@ -60,6 +63,14 @@ class HealthResource(HackathonResource):
         return report_health(context.get("q"))
 
 
+class MetricsResource(HackathonResource):
+    def get(self):
+        return {
+            "cache": cache.get_stats(),
+            "scheduler": scheduler.get_stats()
+        }
+
+
 class CurrentTimeResource(HackathonResource):
     def get(self):
         return {
@@ -320,6 +331,14 @@ class UserFileResource(HackathonResource):
         return True
 
 
+class FileDownloadResource(HackathonResource):
+    def get(self):
+        parse = reqparse.RequestParser()
+        parse.add_argument('url', type=str, location='args', required=True)
+        args = parse.parse_args()
+        return RequiredFeature("storage").send_file(args["url"])
+
+
 class TeamResource(HackathonResource):
     @hackathon_name_required
     def get(self):
@@ -617,6 +636,18 @@ class AdminExperimentListResource(HackathonResource):
         return expr_manager.get_expr_list_by_hackathon_id(g.hackathon, self.context())
 
 
+class AdminExperimentTeardownResource(HackathonResource):
+    """Resource to stop all experiments of a hackathon in bulk"""
+
+    @admin_privilege_required
+    def get(self):
+        return expr_manager.get_teardown_progress(g.hackathon)
+
+    @admin_privilege_required
+    def post(self):
+        return expr_manager.teardown_hackathon_exprs(g.hackathon)
+
+
 class HackathonAdminListResource(HackathonResource):
     @hackathon_name_required
     def get(self):
@@ -718,6 +749,12 @@ class AdminHostserverResource(HackathonResource):
         return docker_host_manager.delete_host_server(self.context().id)
 
 
+class AdminHostserverAutoscaleResource(HackathonResource):
+    @admin_privilege_required
+    def get(self):
+        return docker_host_autoscaler.get_decision_log(g.hackathon)
+
+
 class AdminHackathonOnLineResource(HackathonResource):
     @admin_privilege_required
     def post(self):
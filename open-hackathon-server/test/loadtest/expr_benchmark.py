@@ -0,0 +1,315 @@
+# -*- coding: utf-8 -*-
+#
+# -----------------------------------------------------------------------------------
+# Copyright (c) Microsoft Open Technologies (Shanghai) Co. Ltd.  All rights reserved.
+#
+# The MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+# -----------------------------------------------------------------------------------
+
+"""Load test of the docker experiment pipeline in local mode against FakeDockerServer
+
+Experiments go through the real pipeline rather than docker calls alone: fixtures(users, an online hackathon, a docker
+template and a DockerHostServer pointing to the fake host) are saved into db, every simulated user requests an
+experiment by ExprManager.start_expr(through the admission queue if enabled) and waits until it's running. Half of the
+running experiments are stopped by ExprManager.stop_expr and the others are recycled by
+ExprManager.scheduler_recycle_expr after their create time is moved back. Latency of every stage is reported:
+    request: start_expr returns
+    queue: the admission ticket is no longer queued(skipped if admission queue disabled)
+    host: a host server and ports are assigned to all virtual environments
+    container: containers created and started, the experiment is running
+    stop: stop_expr returns and the experiment is stopped
+    recycle: the whole recycle sweep
+
+Stages after the request are observed by polling db every '--poll' seconds so they are not more accurate than that.
+Only local mode('environment' of config.py is 'local') is supported since azure endpoints of a docker host can't be
+faked. The recycle sweep covers all hackathons, so run it against a db of its own where the open hackathon server
+itself runs(config.py and mongodb ready):
+    python expr_benchmark.py -n 500 -c 50 --latency 0.02 --jitter 0.05 --failure-rate 0.01
+"""
+
+import json
+import math
+import os
+import sys
+import threading
+import time
+import uuid
+from datetime import timedelta
+from optparse import OptionParser
+from Queue import Queue, Empty
+
+from fake_docker import FakeDockerServer
+
+# setup import path
+try:
+    import hackathon  # noqa
+except ImportError:
+    BASE_DIR = os.path.dirname(__file__)
+    sys.path.append(os.path.realpath(os.path.join(BASE_DIR, "..", "..", "src")))
+    import hackathon  # noqa
+
+from flask import g
+
+from hackathon import RequiredFeature, app
+from hackathon.hmongo.models import User, Hackathon, Template, Experiment, ExprAdmissionTicket, DockerHostServer
+from hackathon.constants import EStatus, ADMISSION_STATUS, HACK_STATUS, HACKATHON_CONFIG, CLOUD_PROVIDER, \
+    DockerHostServerStatus
+
+STAGES = ["request", "queue", "host", "container", "stop", "recycle"]
+SAMPLE_TEMPLATE = os.path.join(os.path.dirname(hackathon.__file__), "resources", "sample-template-for-docker.js")
+
+
+def percentile(values, p):
+    """Nearest-rank percentile, values must be sorted"""
+    if not values:
+        return 0
+    rank = int(math.ceil(p / 100.0 * len(values))) - 1
+    return values[max(0, min(rank, len(values) - 1))]
+
+
+class ExprBenchmark(object):
+    def __init__(self, server, total, concurrency, image="ubuntu:14.04", poll=0.05, timeout=300):
+        self.server = server
+        self.total = total
+        self.concurrency = concurrency
+        self.image = image
+        self.poll = poll
+        self.timeout = timeout
+        self.util = RequiredFeature("util")
+        self.expr_manager = RequiredFeature("expr_manager")
+        self.admission_queue = RequiredFeature("expr_admission_queue")
+        self.template_library = RequiredFeature("template_library")
+        self.storage = RequiredFeature("storage")
+        self.lock = threading.Lock()
+        self.latencies = dict((stage, []) for stage in STAGES)
+        self.failures = {}
+        self.running = []
+        self.tag = uuid.uuid4().hex[:8]
+        self.users = []
+        self.hackathon = None
+        self.template = None
+        self.host_server = None
+
+    def setup(self):
+        """Save the fixtures of a benchmark run into db"""
+        with open(SAMPLE_TEMPLATE) as f:
+            template_args = json.load(f)
+        template_args["name"] = "bench-%s" % self.tag
+        for unit in template_args["virtual_environments"]:
+            unit["Image"] = self.image
+        with app.test_request_context():
+            g.user = None
+            self.template_library.create_template(template_args)
+        self.template = Template.objects(name=template_args["name"]).first()
+
+        now = self.util.get_now()
+        self.hackathon = Hackathon(name="bench-%s" % self.tag,
+                                   display_name="benchmark %s" % self.tag,
+                                   status=HACK_STATUS.ONLINE,
+                                   event_start_time=now - timedelta(days=1),
+                                   event_end_time=now + timedelta(days=1),
+                                   config={HACKATHON_CONFIG.CLOUD_PROVIDER: CLOUD_PROVIDER.AZURE,
+                                           HACKATHON_CONFIG.RECYCLE_ENABLED: True,
+                                           HACKATHON_CONFIG.RECYCLE_MINUTES: 60},
+                                   templates=[self.template])
+        self.hackathon.save()
+
+        self.host_server = DockerHostServer(vm_name="fake-docker-%d" % self.server.port,
+                                            public_dns=self.server.host,
+                                            public_ip=self.server.host,
+                                            public_docker_api_port=self.server.port,
+                                            private_ip=self.server.host,
+                                            private_docker_api_port=self.server.port,
+                                            container_count=0,
+                                            container_max_count=self.total + 10,
+                                            state=DockerHostServerStatus.DOCKER_READY,
+                                            hackathon=self.hackathon)
+        self.host_server.save()
+
+        for i in xrange(self.total):
+            user = User(name="bench-%s-%d" % (self.tag, i), nickname="bench-%d" % i)
+            user.save()
+            self.users.append(user)
+
+    def cleanup(self):
+        """Remove the fixtures and everything the pipeline saved for them"""
+        if self.hackathon:
+            ExprAdmissionTicket.objects(hackathon=self.hackathon).delete()
+            Experiment.objects(hackathon=self.hackathon).delete()
+            DockerHostServer.objects(hackathon=self.hackathon).delete()
+            self.hackathon.delete()
+        if self.template:
+            self.storage.delete(self.template.url)
+            self.template.delete()
+        for user in self.users:
+            user.delete()
+
+    def run(self):
+        """Start all experiments, then stop half of them and recycle the others"""
+        tasks = Queue()
+        for user in self.users:
+            tasks.put(user)
+        begin = time.time()
+        self.__run_workers(self.__start, tasks)
+        start_elapsed = time.time() - begin
+
+        to_stop = Queue()
+        for expr_id in self.running[::2]:
+            to_stop.put(expr_id)
+        self.__run_workers(self.__stop, to_stop)
+        self.__recycle(self.running[1::2])
+        return start_elapsed
+
+    def report(self, elapsed):
+        print "experiments: %d, concurrency: %d, started in %.2fs" % (self.total, self.concurrency, elapsed)
+        throughput = len(self.running) / elapsed if elapsed else 0
+        print "running: %d, throughput: %.1f expr/s" % (len(self.running), throughput)
+        for stage in STAGES:
+            values = sorted(self.latencies[stage])
+            if values:
+                print "%s latency(ms): avg %.1f, p50 %.1f, p90 %.1f, p99 %.1f, max %.1f" % (
+                    stage,
+                    sum(values) * 1000 / len(values),
+                    percentile(values, 50) * 1000,
+                    percentile(values, 90) * 1000,
+                    percentile(values, 99) * 1000,
+                    values[-1] * 1000)
+        for stage, count in sorted(self.failures.items()):
+            print "failed at %s: %d" % (stage, count)
+
+    def __run_workers(self, target, tasks):
+        def work():
+            while True:
+                try:
+                    task = tasks.get_nowait()
+                except Empty:
+                    return
+                target(task)
+
+        workers = [threading.Thread(target=work) for i in xrange(self.concurrency)]
+        for w in workers:
+            w.setDaemon(True)
+            w.start()
+        for w in workers:
+            w.join()
+
+    def __start(self, user):
+        stage = "request"
+        try:
+            begin = time.time()
+            resp = self.expr_manager.start_expr(user, self.template.name, self.hackathon.name)
+            expr_id = resp["expr_id"]
+            last = self.__record(stage, begin)
+
+            if self.admission_queue.is_enabled():
+                stage = "queue"
+                self.__wait(expr_id, lambda expr: not ExprAdmissionTicket.objects(
+                    experiment=expr, status=ADMISSION_STATUS.QUEUED).count())
+                last = self.__record(stage, last)
+
+            stage = "host"
+            self.__wait(expr_id, lambda expr: expr.virtual_environments and all(
+                ve.docker_container and ve.docker_container.port_bindings for ve in expr.virtual_environments))
+            last = self.__record(stage, last)
+
+            stage = "container"
+            self.__wait(expr_id, lambda expr: expr.status == EStatus.RUNNING)
+            self.__record(stage, last)
+            with self.lock:
+                self.running.append(expr_id)
+        except Exception:
+            self.__fail(stage)
+
+    def __stop(self, expr_id):
+        try:
+            begin = time.time()
+            self.expr_manager.stop_expr(expr_id)
+            self.__wait(expr_id, lambda expr: expr.status == EStatus.STOPPED)
+            self.__record("stop", begin)
+        except Exception:
+            self.__fail("stop")
+
+    def __recycle(self, expr_ids):
+        if not expr_ids:
+            return
+        # older than 'recycle_minutes' of the hackathon
+        Experiment.objects(id__in=expr_ids).update(set__create_time=self.util.get_now() - timedelta(minutes=61))
+        begin = time.time()
+        self.expr_manager.scheduler_recycle_expr()
+        self.__record("recycle", begin)
+        stopped = Experiment.objects(id__in=expr_ids, status=EStatus.STOPPED).count()
+        for i in xrange(len(expr_ids) - stopped):
+            self.__fail("recycle")
+
+    def __wait(self, expr_id, done):
+        """Poll the experiment until done(expr) is true, raise if it failed or timed out"""
+        deadline = time.time() + self.timeout
+        while time.time() < deadline:
+            expr = Experiment.objects(id=expr_id).first()
+            if done(expr):
+                return
+            if expr.status not in [EStatus.STARTING, EStatus.RUNNING]:
+                raise AssertionError("experiment %s ended with status %d" % (expr_id, expr.status))
+            time.sleep(self.poll)
+        raise AssertionError("experiment %s timed out" % expr_id)
+
+    def __record(self, stage, since):
+        now = time.time()
+        with self.lock:
+            self.latencies[stage].append(now - since)
+        return now
+
+    def __fail(self, stage):
+        with self.lock:
+            self.failures[stage] = self.failures.get(stage, 0) + 1
+
+
+def main():
+    parser = OptionParser(usage="%prog [options]")
+    parser.add_option("-n", "--number", dest="number", type="int", default=200, help="experiments to start")
+    parser.add_option("-c", "--concurrency", dest="concurrency", type="int", default=20, help="concurrent users")
+    parser.add_option("--latency", dest="latency", type="float", default=0, help="injected latency in seconds")
+    parser.add_option("--jitter", dest="jitter", type="float", default=0, help="random extra latency in seconds")
+    parser.add_option("--failure-rate", dest="failure_rate", type="float", default=0, help="injected failure rate")
+    parser.add_option("--poll", dest="poll", type="float", default=0.05, help="seconds between polls of db")
+    parser.add_option("--timeout", dest="timeout", type="int", default=300, help="seconds to wait for a stage")
+    options, args = parser.parse_args()
+
+    if not RequiredFeature("util").is_local():
+        parser.error("only local mode is supported, set 'environment' of config.py to 'local'")
+
+    server = FakeDockerServer(latency=options.latency, jitter=options.jitter, failure_rate=options.failure_rate)
+    server.start()
+    benchmark = ExprBenchmark(server, options.number, options.concurrency, poll=options.poll,
+                              timeout=options.timeout)
+    try:
+        benchmark.setup()
+        elapsed = benchmark.run()
+        benchmark.report(elapsed)
+        print "requests: %s" % server.request_counts
+        print "injected failures: %s" % server.failure_counts
+    finally:
+        benchmark.cleanup()
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,388 @@
+# -*- coding: utf-8 -*-
+#
+# -----------------------------------------------------------------------------------
+# Copyright (c) Microsoft Open Technologies (Shanghai) Co. Ltd.  All rights reserved.
+#
+# The MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+# -----------------------------------------------------------------------------------
+
+"""A fake docker remote api server for offline testing
+
+Only the apis used by open hackathon platform are implemented, based on docker remote api v1.18:
+    GET    /_ping
+    POST   /containers/create?name=<name>
+    POST   /containers/<id>/start
+    POST   /containers/<id>/stop
+    GET    /containers/json
+    GET    /containers/<id>/json
+    DELETE /containers/<id>
+    POST   /images/create?fromImage=<image>&tag=<tag>
+    GET    /images/json
+    GET    /events?since=<timestamp>&until=<timestamp>
+
+Latency and failures can be injected globally or per api. Containers are addressed by either id or name.
+
+:Example:
+    server = FakeDockerServer(latency=0.05, failure_rate=0.01)
+    server.set_route_behavior("start", latency=0.5)
+    server.start()
+    # docker host: http://127.0.0.1:<server.port>
+    server.stop()
+"""
+
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from Queue import Queue, Empty
+from SocketServer import ThreadingMixIn
+from urlparse import urlparse, parse_qs
+
+__all__ = ["FakeDockerServer"]
+
+ROUTES = [
+    ("GET", re.compile(r"^/_ping$"), "ping"),
+    ("POST", re.compile(r"^/containers/create$"), "create"),
+    ("POST", re.compile(r"^/containers/(?P<cid>[^/]+)/start$"), "start"),
+    ("POST", re.compile(r"^/containers/(?P<cid>[^/]+)/stop$"), "stop"),
+    ("GET", re.compile(r"^/containers/json$"), "list"),
+    ("GET", re.compile(r"^/containers/(?P<cid>[^/]+)/json$"), "inspect"),
+    ("DELETE", re.compile(r"^/containers/(?P<cid>[^/]+)$"), "delete"),
+    ("POST", re.compile(r"^/images/create$"), "pull"),
+    ("GET", re.compile(r"^/images/json$"), "images"),
+    ("GET", re.compile(r"^/events$"), "events"),
+]
+
+
+class RouteBehavior(object):
+    """Injected latency(seconds) and failure probability of one api"""
+
+    def __init__(self, latency=0, jitter=0, failure_rate=0, failure_status=500):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.failure_status = failure_status
+
+    def delay(self):
+        seconds = self.latency + (random.uniform(0, self.jitter) if self.jitter else 0)
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def should_fail(self):
+        return self.failure_rate > 0 and random.random() < self.failure_rate
+
+
+class FakeDockerRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.__dispatch("GET")
+
+    def do_POST(self):
+        self.__dispatch("POST")
+
+    def do_DELETE(self):
+        self.__dispatch("DELETE")
+
+    def log_message(self, format, *args):
+        # keep quiet, thousands of requests are expected
+        pass
+
+    def __dispatch(self, method):
+        docker = self.server.docker
+        url = urlparse(self.path)
+        query = dict((k, v[0]) for k, v in parse_qs(url.query).items())
+        body = self.__read_body()
+
+        for route_method, pattern, name in ROUTES:
+            match = pattern.match(url.path)
+            if route_method == method and match:
+                behavior = docker.get_route_behavior(name)
+                behavior.delay()
+                if behavior.should_fail():
+                    docker.count_request(name, failed=True)
+                    return self.__respond(behavior.failure_status, {"message": "injected failure"})
+                docker.count_request(name)
+
+                if name == "events":
+                    return self.__stream_events(query)
+                status, content = getattr(docker, "handle_" + name)(query=query, body=body, **match.groupdict())
+                return self.__respond(status, content)
+
+        self.__respond(404, {"message": "page not found"})
+
+    def __read_body(self):
+        length = int(self.headers.getheader("content-length") or 0)
+        if not length:
+            return None
+        raw = self.rfile.read(length)
+        try:
+            return json.loads(raw)
+        except ValueError:
+            return None
+
+    def __respond(self, status, content):
+        if content is None:
+            data = ""
+        elif isinstance(content, basestring):
+            data = content
+        else:
+            data = json.dumps(content)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json" if not isinstance(content, basestring) else "text/plain")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def __stream_events(self, query):
+        """Stream events as lines of json until client disconnects, 'until' reached or server stopped"""
+        docker = self.server.docker
+        since = int(query["since"]) if query.get("since") else None
+        until = int(query["until"]) if query.get("until") else None
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = 1
+
+        queue, history = docker.subscribe(since)
+        try:
+            for event in history:
+                self.__write_event(event)
+            while not docker.stopped:
+                if until and time.time() >= until:
+                    return
+                try:
+                    self.__write_event(queue.get(timeout=0.5))
+                except Empty:
+                    pass
+        except Exception:
+            # client gone
+            pass
+        finally:
+            docker.unsubscribe(queue)
+
+    def __write_event(self, event):
+        self.wfile.write(json.dumps(event) + "\n")
+        self.wfile.flush()
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+
+class FakeDockerServer(object):
+    """In-memory docker daemon served over http on localhost
+
+    :type port: int
+    :param port: the port to listen on. A random free port is used if 0
+
+    :type latency: float
+    :param latency: injected latency in seconds for every api
+
+    :type jitter: float
+    :param jitter: random extra latency in seconds between 0 and jitter
+
+    :type failure_rate: float
+    :param failure_rate: probability between 0 and 1 that an api responds with failure_status
+    """
+    MAX_EVENT_HISTORY = 10000
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0, jitter=0, failure_rate=0, failure_status=500):
+        self.host = host
+        self.port = port
+        self.default_behavior = RouteBehavior(latency, jitter, failure_rate, failure_status)
+        self.behaviors = {}
+        self.containers = {}
+        self.images = set()
+        self.events = []
+        self.subscribers = []
+        self.request_counts = {}
+        self.failure_counts = {}
+        self.stopped = True
+        self.lock = threading.Lock()
+        self.httpd = None
+        self.thread = None
+
+    def start(self):
+        self.httpd = ThreadingHTTPServer((self.host, self.port), FakeDockerRequestHandler)
+        self.httpd.docker = self
+        self.port = self.httpd.server_address[1]
+        self.stopped = False
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="fake-docker-%d" % self.port)
+        self.thread.setDaemon(True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped = True
+        if self.httpd:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
+
+    @property
+    def url(self):
+        return "http://%s:%d" % (self.host, self.port)
+
+    def set_route_behavior(self, name, latency=0, jitter=0, failure_rate=0, failure_status=500):
+        """Override latency and failure injection of one api. See ROUTES for the names"""
+        self.behaviors[name] = RouteBehavior(latency, jitter, failure_rate, failure_status)
+
+    def get_route_behavior(self, name):
+        return self.behaviors.get(name, self.default_behavior)
+
+    def count_request(self, name, failed=False):
+        with self.lock:
+            counts = self.failure_counts if failed else self.request_counts
+            counts[name] = counts.get(name, 0) + 1
+
+    # ------------------------------------------ events --------------------------------------------------------#
+
+    def emit(self, status, container):
+        event = {"status": status, "id": container["Id"], "from": container["Config"]["Image"], "time": int(time.time())}
+        with self.lock:
+            self.events.append(event)
+            if len(self.events) > self.MAX_EVENT_HISTORY:
+                del self.events[0]
+            subscribers = list(self.subscribers)
+        for queue in subscribers:
+            queue.put(event)
+
+    def subscribe(self, since=None):
+        queue = Queue()
+        with self.lock:
+            history = [e for e in self.events if since is not None and e["time"] >= since]
+            self.subscribers.append(queue)
+        return queue, history
+
+    def unsubscribe(self, queue):
+        with self.lock:
+            if queue in self.subscribers:
+                self.subscribers.remove(queue)
+
+    # ------------------------------------------ handlers ------------------------------------------------------#
+
+    def handle_ping(self, **kwargs):
+        return 200, "OK"
+
+    def handle_create(self, query, body, **kwargs):
+        body = body or {}
+        name = query.get("name") or uuid.uuid4().hex[:12]
+        with self.lock:
+            if self.__find(name):
+                return 409, {"message": "Conflict. The name \"%s\" is already in use" % name}
+            container = {
+                "Id": uuid.uuid4().hex + uuid.uuid4().hex,
+                "Name": "/" + name,
+                "Created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                "Config": {"Image": body.get("Image", ""), "Env": body.get("Env"), "Cmd": body.get("Cmd")},
+                "HostConfig": body.get("HostConfig", {}),
+                "State": {"Running": False, "Restarting": False, "Paused": False, "ExitCode": 0, "Pid": 0}
+            }
+            self.containers[container["Id"]] = container
+        self.emit("create", container)
+        return 201, {"Id": container["Id"], "Warnings": None}
+
+    def handle_start(self, cid, **kwargs):
+        with self.lock:
+            container = self.__find(cid)
+            if not container:
+                return 404, {"message": "no such container: %s" % cid}
+            if container["State"]["Running"]:
+                return 304, None
+            container["State"].update(Running=True, Pid=random.randint(100, 65535), ExitCode=0)
+        self.emit("start", container)
+        return 204, None
+
+    def handle_stop(self, cid, **kwargs):
+        with self.lock:
+            container = self.__find(cid)
+            if not container:
+                return 404, {"message": "no such container: %s" % cid}
+            if not container["State"]["Running"]:
+                return 304, None
+            container["State"].update(Running=False, Pid=0)
+        self.emit("die", container)
+        self.emit("stop", container)
+        return 204, None
+
+    def handle_list(self, query, **kwargs):
+        show_all = query.get("all") in ("1", "true", "True")
+        with self.lock:
+            containers = [c for c in self.containers.values() if show_all or c["State"]["Running"]]
+            result = [{
+                "Id": c["Id"],
+                "Names": [c["Name"]],
+                "Image": c["Config"]["Image"],
+                "Created": c["Created"],
+                "Status": "Up" if c["State"]["Running"] else "Exited (0)",
+                "Ports": []
+            } for c in containers]
+        return 200, result
+
+    def handle_inspect(self, cid, **kwargs):
+        with self.lock:
+            container = self.__find(cid)
+            if not container:
+                return 404, {"message": "no such container: %s" % cid}
+            return 200, container
+
+    def handle_delete(self, cid, query, **kwargs):
+        force = query.get("force") in ("1", "true", "True")
+        with self.lock:
+            container = self.__find(cid)
+            if not container:
+                return 404, {"message": "no such container: %s" % cid}
+            running = container["State"]["Running"]
+            if running and not force:
+                return 409, {"message": "Conflict, You cannot remove a running container. Stop the container before "
+                                        "attempting removal or use -f"}
+            self.containers.pop(container["Id"])
+        if running:
+            container["State"].update(Running=False, Pid=0)
+            self.emit("die", container)
+        self.emit("destroy", container)
+        return 204, None
+
+    def handle_pull(self, query, **kwargs):
+        image = query.get("fromImage")
+        if not image:
+            return 500, {"message": "image name required"}
+        with self.lock:
+            self.images.add("%s:%s" % (image, query.get("tag") or "latest"))
+        return 200, {"status": "Status: Image is up to date for %s" % image}
+
+    def handle_images(self, **kwargs):
+        with self.lock:
+            return 200, [{"Id": uuid.uuid5(uuid.NAMESPACE_DNS, i).hex, "RepoTags": [i]} for i in self.images]
+
+    def __find(self, id_or_name):
+        if id_or_name in self.containers:
+            return self.containers[id_or_name]
+        name = id_or_name if id_or_name.startswith("/") else "/" + id_or_name
+        return next((c for c in self.containers.values() if c["Name"] == name), None)
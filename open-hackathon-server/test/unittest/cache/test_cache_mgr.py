@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) Microsoft Open Technologies (Shanghai) Co. Ltd.  All rights reserved.
+
+The MIT License (MIT)
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import os
+import time
+import unittest
+from threading import Thread, Event
+from mock import Mock, patch
+
+# setup import path
+try:
+    import hackathon  # noqa
+except ImportError:
+    import sys
+    BASE_DIR = os.path.dirname(__file__)
+    sys.path.append(os.path.realpath(os.path.join(BASE_DIR, "..", "..", "..", "src")))
+
+from hackathon.cache.cache_mgr import CacheManagerExt, LRUCache, SingleFlight, MISSING
+
+CONFIG = {
+    "cache.l1_max_entries": 2,
+    "cache.default": {"ttl": 100, "l1_ttl": 10, "negative_ttl": 5},
+    "cache.namespaces": {
+        "__template__": {"ttl": 1000, "copy": True},
+        "hackathon_stat_": {"ttl": 1, "l1_ttl": 1},
+        "hackathon_swr_": {"ttl": 100, "stale_while_revalidate": 50}
+    }
+}
+
+
+class FakeBeakerCache(object):
+    def __init__(self, expire):
+        self.expire = expire
+        self.values = {}
+        self.gets = 0
+
+    def get(self, key, createfunc):
+        self.gets += 1
+        if key not in self.values:
+            self.values[key] = createfunc()
+        return self.values[key]
+
+    def put(self, key, value):
+        self.values[key] = value
+
+    def remove_value(self, key):
+        self.values.pop(key, None)
+
+    def clear(self):
+        self.values.clear()
+
+
+class FakeBeaker(object):
+    def __init__(self):
+        self.caches = {}
+
+    def get_cache(self, name, expire):
+        return self.caches.setdefault(name, FakeBeakerCache(expire))
+
+
+class LRUCacheTest(unittest.TestCase):
+    def test_evict_least_recently_used(self):
+        lru = LRUCache(2)
+        lru.put("a", 1, 10)
+        lru.put("b", 2, 10)
+        lru.get("a")
+        lru.put("c", 3, 10)
+
+        self.assertEqual(1, lru.get("a"))
+        self.assertIs(MISSING, lru.get("b"))
+        self.assertEqual(3, lru.get("c"))
+
+    def test_expire(self):
+        lru = LRUCache(2)
+        lru.put("a", None, 10)
+        lru.put("b", 2, -1)
+
+        self.assertIsNone(lru.get("a"))
+        self.assertIs(MISSING, lru.get("b"))
+
+
+class SingleFlightTest(unittest.TestCase):
+    def test_concurrent_callers_share_one_call(self):
+        flights = SingleFlight()
+        started = Event()
+        release = Event()
+        calls = []
+
+        def load():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return "v"
+
+        results = []
+        leader = Thread(target=lambda: results.append(flights.do("k", load)))
+        leader.start()
+        started.wait(5)
+        followers = [Thread(target=lambda: results.append(flights.do("k", load))) for _ in range(5)]
+        for t in followers:
+            t.start()
+        release.set()
+        for t in [leader] + followers:
+            t.join(5)
+
+        self.assertEqual(1, len(calls))
+        self.assertEqual(["v"] * 6, results)
+        self.assertEqual({}, flights.flights)
+
+    def test_error_raised(self):
+        flights = SingleFlight()
+        self.assertRaises(ValueError, flights.do, "k", Mock(side_effect=ValueError()))
+        self.assertEqual("v", flights.do("k", lambda: "v"))
+
+
+class CacheManagerExtTest(unittest.TestCase):
+    def setUp(self):
+        util = Mock()
+        util.safe_get_config.side_effect = lambda key, default: CONFIG.get(key, default)
+        patcher = patch.object(CacheManagerExt, "util", util)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch("hackathon.cache.cache_mgr.CacheManager", Mock(return_value=FakeBeaker()))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        CacheManagerExt.l1 = None
+        self.addCleanup(setattr, CacheManagerExt, "l1", None)
+        self.addCleanup(setattr, CacheManagerExt, "bus", None)
+
+        self.cache = CacheManagerExt()
+        self.cache.log = Mock()
+        self.createfunc = Mock(return_value={"k": "v"})
+
+    def l2(self, name):
+        return CacheManagerExt.l2.caches[name]
+
+    def test_hit_l1_without_l2(self):
+        self.assertEqual({"k": "v"}, self.cache.get_cache("hackathon_config_1", self.createfunc))
+        self.assertEqual({"k": "v"}, self.cache.get_cache("hackathon_config_1", self.createfunc))
+
+        self.assertEqual(1, self.createfunc.call_count)
+        self.assertEqual(1, self.l2("cache_default").gets)
+        self.assertEqual(100, self.l2("cache_default").expire)
+
+    def test_namespace_ttl_and_copy(self):
+        first = self.cache.get_cache("__template__1__", self.createfunc)
+        first["k"] = "changed"
+
+        self.assertEqual({"k": "v"}, self.cache.get_cache("__template__1__", self.createfunc))
+        self.assertEqual(1000, self.l2("cache_template").expire)
+
+        self.cache.get_cache("hackathon_stat_1", self.createfunc)
+        self.assertEqual(1, self.l2("cache_hackathon_stat").expire)
+
+    def test_negative_caching(self):
+        self.createfunc.return_value = None
+        self.assertIsNone(self.cache.get_cache("hackathon_config_1", self.createfunc))
+        self.assertIsNone(self.cache.get_cache("hackathon_config_1", self.createfunc))
+        self.assertEqual(1, self.createfunc.call_count)
+
+        # None expires in L2 by negative_ttl instead of ttl
+        expire_at, value = self.l2("cache_default").values["hackathon_config_1"]
+        self.assertTrue(expire_at <= time.time() + 5)
+
+        self.l2("cache_default").values["hackathon_config_1"] = (time.time() - 1, None)
+        CacheManagerExt.l1.clear()
+        self.createfunc.return_value = {"k": "v"}
+        self.assertEqual({"k": "v"}, self.cache.get_cache("hackathon_config_1", self.createfunc))
+
+    def test_invalidate_both_levels(self):
+        self.cache.get_cache("hackathon_config_1", self.createfunc)
+        self.assertTrue(self.cache.invalidate("hackathon_config_1"))
+
+        self.cache.get_cache("hackathon_config_1", self.createfunc)
+        self.assertEqual(2, self.createfunc.call_count)
+
+    def test_l2_unavailable(self):
+        CacheManagerExt.l2.get_cache = Mock(side_effect=Exception("memcached is down"))
+
+        self.assertEqual({"k": "v"}, self.cache.get_cache("hackathon_config_1", self.createfunc))
+        self.assertEqual(1, self.createfunc.call_count)
+
+    def test_serve_stale_while_revalidate(self):
+        self.cache.get_cache("hackathon_swr_1", self.createfunc)
+        self.assertEqual(150, self.l2("cache_hackathon_swr").expire)
+
+        # expired in L2 but still in the stale window
+        self.l2("cache_hackathon_swr").values["hackathon_swr_1"] = (time.time() - 10, {"k": "v"})
+        CacheManagerExt.l1.clear()
+        self.createfunc.return_value = {"k": "new"}
+        with patch.object(SingleFlight, "do_async", lambda flights, key, func: func()):
+            self.assertEqual({"k": "v"}, self.cache.get_cache("hackathon_swr_1", self.createfunc))
+
+        self.assertEqual({"k": "new"}, self.l2("cache_hackathon_swr").values["hackathon_swr_1"][1])
+        self.assertEqual({"k": "new"}, self.cache.get_cache("hackathon_swr_1", self.createfunc))
+
+    def test_reload_after_stale_window(self):
+        self.cache.get_cache("hackathon_swr_1", self.createfunc)
+        self.l2("cache_hackathon_swr").values["hackathon_swr_1"] = (time.time() - 60, {"k": "v"})
+        CacheManagerExt.l1.clear()
+        self.createfunc.return_value = {"k": "new"}
+
+        self.assertEqual({"k": "new"}, self.cache.get_cache("hackathon_swr_1", self.createfunc))
+
+    def test_invalidate_namespace(self):
+        self.cache.get_cache("hackathon_stat_1", self.createfunc)
+        self.cache.get_cache("hackathon_stat_2", self.createfunc)
+        self.cache.get_cache("hackathon_config_1", self.createfunc)
+        self.assertTrue(self.cache.invalidate_namespace("hackathon_stat_"))
+
+        self.assertEqual({}, self.l2("cache_hackathon_stat").values)
+        self.assertIs(MISSING, CacheManagerExt.l1.get("hackathon_stat_2"))
+        self.assertEqual({"k": "v"}, CacheManagerExt.l1.get("hackathon_config_1"))
+
+    def test_broadcast_invalidation(self):
+        CacheManagerExt.l1 = None
+        config = dict(CONFIG, **{"cache.invalidation_bus.enabled": True})
+        CacheManagerExt.util.safe_get_config.side_effect = lambda key, default: config.get(key, default)
+        with patch("hackathon.cache.cache_mgr.CacheInvalidationBus") as bus_class:
+            cache = CacheManagerExt()
+        bus = bus_class.return_value
+        handler = bus_class.call_args[0][0]
+
+        cache.get_cache("hackathon_config_1", self.createfunc)
+        bus.ensure_started.assert_called_once_with()
+        cache.invalidate("hackathon_config_1")
+        bus.publish.assert_called_once_with(key="hackathon_config_1")
+        cache.clear()
+        bus.publish.assert_called_with(prefix="")
+
+        # invalidation from another process
+        cache.get_cache("hackathon_config_1", self.createfunc)
+        handler("hackathon_config_1", None)
+        self.assertIs(MISSING, CacheManagerExt.l1.get("hackathon_config_1"))
+        self.assertNotIn("hackathon_config_1", self.l2("cache_default").values)
+
+    def test_stats(self):
+        self.cache.get_cache("hackathon_stat_1", self.createfunc)
+        self.cache.get_cache("hackathon_stat_1", self.createfunc)
+        CacheManagerExt.l1.clear()
+        self.cache.get_cache("hackathon_stat_1", self.createfunc)
+        self.cache.get_cache("hackathon_config_1", self.createfunc)
+        self.cache.get_cache("hackathon_config_2", self.createfunc)
+        # l1_max_entries is 2
+        self.cache.get_cache("hackathon_config_3", self.createfunc)
+
+        stats = self.cache.get_stats()
+        self.assertEqual(2, stats["l1_entries"])
+        stat = stats["namespaces"]["hackathon_stat_"]
+        self.assertEqual((1, 1, 1, 1), (stat["l1_hits"], stat["l2_hits"], stat["misses"], stat["loads"]))
+        self.assertEqual(round(2.0 / 3, 4), stat["hit_ratio"])
+        self.assertEqual(1, stat["evictions"])
+        self.assertEqual(1, stat["ttl"])
+        self.assertEqual(3, stats["namespaces"]["default"]["misses"])
+        self.assertEqual(2, stats["namespaces"]["default"]["l1_entries"])
+        self.assertIsNone(stats["namespaces"]["__template__"]["hit_ratio"])
+
+    def test_report_l2_error(self):
+        self.assertEqual("ok", self.cache.report_health()["status"])
+        CacheManagerExt.l2.get_cache = Mock(side_effect=Exception("memcached is down"))
+        self.cache.get_cache("hackathon_config_1", self.createfunc)
+
+        self.assertEqual("warning", self.cache.report_health()["status"])
+        self.assertEqual(1, self.cache.get_stats()["namespaces"]["default"]["l2_errors"])
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) Microsoft Open Technologies (Shanghai) Co. Ltd.  All rights reserved.
+
+The MIT License (MIT)
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+import os
+import unittest
+from mock import Mock, patch
+
+# setup import path
+try:
+    import hackathon  # noqa
+except ImportError:
+    import sys
+    BASE_DIR = os.path.dirname(__file__)
+    sys.path.append(os.path.realpath(os.path.join(BASE_DIR, "..", "..", "..", "src")))
+
+from hackathon.cache.invalidation_bus import CacheInvalidationBus
+
+
+class StopTailing(BaseException):
+    """Raised to get out of the endless tailing loop, not caught as Exception"""
+
+
+class FakeCursor(object):
+    """Tailable cursor returning a batch of documents every time it's iterated, dies after the last batch"""
+
+    def __init__(self, *batches):
+        self.batches = list(batches)
+
+    @property
+    def alive(self):
+        return len(self.batches) > 0
+
+    def __iter__(self):
+        return iter(self.batches.pop(0))
+
+
+def doc(_id, origin="other"):
+    return {"_id": _id, "origin": origin, "key": "k%d" % _id, "prefix": None}
+
+
+@patch("hackathon.cache.invalidation_bus.time.sleep", Mock(side_effect=StopTailing))
+@patch("hackathon.cache.invalidation_bus.CacheInvalidation")
+class CacheInvalidationBusTest(unittest.TestCase):
+    def setUp(self):
+        self.handler = Mock()
+        self.bus = CacheInvalidationBus(self.handler)
+        self.bus.origin = "self"
+        self.bus.log = Mock()
+        self.bus.util = Mock()
+
+    def tail(self, model, last_id, *cursors):
+        model._get_collection.return_value.find.side_effect = list(cursors)
+        self.assertRaises(StopTailing, self.bus._CacheInvalidationBus__tail, last_id)
+
+    def test_resume_in_natural_order(self, model):
+        # 3 is published after 9 by a node whose clock is behind
+        self.tail(model, 9, FakeCursor([doc(5), doc(9), doc(3), doc(4, origin="self")]))
+
+        self.assertEqual([("k3", None)], [c[0] for c in self.handler.call_args_list])
+
+    def test_position_lost(self, model):
+        # 9 has been overwritten in the capped collection
+        self.tail(model, 9, FakeCursor([doc(5), doc(3)], [doc(7)]))
+
+        self.assertEqual([(None, ""), ("k7", None)], [c[0] for c in self.handler.call_args_list])
+
+    def test_start_from_latest(self, model):
+        model._get_collection.return_value.find.return_value.sort.return_value.limit.return_value = [doc(9)]
+
+        with patch("hackathon.cache.invalidation_bus.Thread") as thread_class:
+            self.bus.ensure_started()
+            self.bus.ensure_started()
+
+        # the position is taken at once rather than in the thread
+        thread_class.assert_called_once_with(target=self.bus._CacheInvalidationBus__tail, args=(9,),
+                                             name="cache-invalidation-bus")
+        thread_class.return_value.start.assert_called_once_with()
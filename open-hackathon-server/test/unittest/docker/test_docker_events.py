@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) Microsoft Open Technologies (Shanghai) Co. Ltd.  All rights reserved.
+
+The MIT License (MIT)
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import os
+import sys
+import time
+import unittest
+from mock import Mock
+
+# setup import path
+try:
+    import hackathon  # noqa
+except ImportError:
+    BASE_DIR = os.path.dirname(__file__)
+    sys.path.append(os.path.realpath(os.path.join(BASE_DIR, "..", "..", "..", "src")))
+
+from hackathon.docker.docker_events import DockerEventMonitor
+
+sys.path.append(os.path.realpath(os.path.join(os.path.dirname(__file__), "..", "..", "loadtest")))
+from fake_docker import FakeDockerServer
+
+HOST_ID = "host-1"
+CONTAINER_ID = "c0ffee"
+
+
+class DockerEventMonitorTest(unittest.TestCase):
+    def setUp(self):
+        self.monitor = DockerEventMonitor()
+        self.monitor.is_watching = Mock(return_value=True)
+
+    def test_unknown_container(self):
+        self.assertIsNone(self.monitor.get_container_running_state(HOST_ID, CONTAINER_ID))
+
+    def test_start_and_die(self):
+        self.monitor.on_event(HOST_ID, {"status": "start", "id": CONTAINER_ID, "time": 100})
+        self.assertTrue(self.monitor.get_container_running_state(HOST_ID, CONTAINER_ID))
+
+        self.monitor.on_event(HOST_ID, {"status": "die", "id": CONTAINER_ID, "time": 101})
+        self.assertFalse(self.monitor.get_container_running_state(HOST_ID, CONTAINER_ID))
+
+    def test_new_event_format(self):
+        self.monitor.on_event(HOST_ID, {"Type": "container", "Action": "start", "Actor": {"ID": CONTAINER_ID}})
+        self.assertTrue(self.monitor.get_container_running_state(HOST_ID, CONTAINER_ID))
+
+        self.monitor.on_event(HOST_ID, {"Type": "image", "Action": "delete", "Actor": {"ID": CONTAINER_ID}})
+        self.assertTrue(self.monitor.get_container_running_state(HOST_ID, CONTAINER_ID))
+
+    def test_out_of_order_event_ignored(self):
+        self.monitor.on_event(HOST_ID, {"status": "die", "id": CONTAINER_ID, "time": 200})
+        self.monitor.on_event(HOST_ID, {"status": "start", "id": CONTAINER_ID, "time": 199})
+        self.assertFalse(self.monitor.get_container_running_state(HOST_ID, CONTAINER_ID))
+
+    def test_destroy(self):
+        self.monitor.on_event(HOST_ID, {"status": "start", "id": CONTAINER_ID, "time": 100})
+        self.monitor.on_event(HOST_ID, {"status": "destroy", "id": CONTAINER_ID, "time": 101})
+        self.assertIsNone(self.monitor.get_container_running_state(HOST_ID, CONTAINER_ID))
+
+    def test_record_never_overwrites_events(self):
+        self.monitor.on_event(HOST_ID, {"status": "die", "id": CONTAINER_ID, "time": 100})
+        self.monitor.record_container_state(HOST_ID, CONTAINER_ID, True)
+        self.assertFalse(self.monitor.get_container_running_state(HOST_ID, CONTAINER_ID))
+
+        self.monitor.record_container_state(HOST_ID, "other", True)
+        self.assertTrue(self.monitor.get_container_running_state(HOST_ID, "other"))
+
+    def test_not_watching(self):
+        self.monitor.on_event(HOST_ID, {"status": "start", "id": CONTAINER_ID, "time": 100})
+        self.monitor.is_watching.return_value = False
+        self.assertIsNone(self.monitor.get_container_running_state(HOST_ID, CONTAINER_ID))
+
+
+class DockerEventStreamTest(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeDockerServer().start()
+        self.monitor = DockerEventMonitor()
+        self.monitor.log = Mock()
+        self.monitor.watch(HOST_ID, "%s/events" % self.server.url)
+        self.wait_for(lambda: self.monitor.is_watching(HOST_ID))
+
+    def tearDown(self):
+        self.monitor.unwatch(HOST_ID)
+        self.server.stop()
+
+    def wait_for(self, condition, timeout=5):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if condition():
+                return
+            time.sleep(0.05)
+        self.fail("condition not met in %d seconds" % timeout)
+
+    def test_stream(self):
+        status, content = self.server.handle_create(query={"name": "foo"}, body={"Image": "ubuntu"})
+        container_id = content["Id"]
+        self.server.handle_start(cid=container_id)
+        self.wait_for(lambda: self.monitor.get_container_running_state(HOST_ID, container_id) is True)
+
+        self.server.handle_delete(cid="foo", query={"force": "1"})
+        self.wait_for(lambda: self.monitor.get_container_running_state(HOST_ID, container_id) is None)
@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) Microsoft Open Technologies (Shanghai) Co. Ltd.  All rights reserved.
+
+The MIT License (MIT)
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+import os
+import unittest
+from datetime import timedelta
+from mock import Mock, patch
+
+# setup import path
+try:
+    import hackathon  # noqa
+except ImportError:
+    import sys
+    BASE_DIR = os.path.dirname(__file__)
+    sys.path.append(os.path.realpath(os.path.join(BASE_DIR, "..", "..", "..", "src")))
+
+from hackathon.expr.admission_queue import ExprAdmissionQueue
+from hackathon.constants import EStatus, ADMISSION_STATUS
+from hackathon.util import get_now
+from hackathon import Context
+
+
+class FakeQuery(object):
+    """Minimal mongoengine queryset over FakeTicket.store"""
+
+    def __init__(self, tickets):
+        self.tickets = tickets
+
+    def first(self):
+        return self.tickets[0] if self.tickets else None
+
+    def order_by(self, field):
+        return FakeQuery(sorted(self.tickets, key=lambda t: getattr(t, field)))
+
+    def only(self, *fields):
+        return self
+
+    def distinct(self, field):
+        values = []
+        for t in self.tickets:
+            if getattr(t, field) not in values:
+                values.append(getattr(t, field))
+        return values
+
+    def count(self):
+        return len(self.tickets)
+
+    def update_one(self, **kwargs):
+        ticket = self.first()
+        if not ticket or FakeTicket.race(ticket):
+            return 0
+        for key, value in kwargs.items():
+            setattr(ticket, key[len("set__"):], value)
+        return 1
+
+    def __iter__(self):
+        return iter(list(self.tickets))
+
+    def __len__(self):
+        return len(self.tickets)
+
+
+class FakeTicket(object):
+    store = []
+    race = staticmethod(lambda ticket: False)
+
+    def __init__(self, **kwargs):
+        self.id = "t%d" % len(FakeTicket.store)
+        self.admit_time = None
+        self.host_server = None
+        self.__dict__.update(kwargs)
+
+    def save(self):
+        if self not in FakeTicket.store:
+            FakeTicket.store.append(self)
+
+    @staticmethod
+    def objects(**kwargs):
+        def match(ticket):
+            for key, value in kwargs.items():
+                if key.endswith("__in"):
+                    if getattr(ticket, key[:-len("__in")]) not in value:
+                        return False
+                elif key.endswith("__lt"):
+                    if not getattr(ticket, key[:-len("__lt")]) < value:
+                        return False
+                elif getattr(ticket, key) != value:
+                    return False
+            return True
+
+        return FakeQuery([t for t in FakeTicket.store if match(t)])
+
+
+class ExprAdmissionQueueTest(unittest.TestCase):
+    def setUp(self):
+        FakeTicket.store = []
+        FakeTicket.race = staticmethod(lambda ticket: False)
+        self.config = {"max_starts": 20, "max_starts_per_hackathon": 5, "max_starts_per_host": 5}
+        self.hosts = {}
+
+        self.queue = ExprAdmissionQueue.__new__(ExprAdmissionQueue)
+        self.queue.__dict__["scheduler"] = Mock()
+        self.queue.__dict__["expr_manager"] = Mock()
+        self.queue.log = Mock()
+        self.queue.util = Mock()
+        self.queue.util.get_now.side_effect = get_now
+        self.queue.util.safe_get_config.side_effect = \
+            lambda key, default: self.config.get(key[len("expr.admission."):], default)
+
+        patcher = patch("hackathon.expr.admission_queue.ExprAdmissionTicket", FakeTicket)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch("hackathon.expr.admission_queue.Experiment")
+        patcher.start().side_effect = lambda **kwargs: Mock(**kwargs)
+        self.addCleanup(patcher.stop)
+        patcher = patch("hackathon.expr.admission_queue.DockerHostServer")
+        patcher.start().objects.side_effect = lambda hackathon, **kwargs: self.hosts.get(hackathon.id, [])
+        self.addCleanup(patcher.stop)
+
+    def add_ticket(self, hackathon, status=ADMISSION_STATUS.QUEUED, expr_status=EStatus.STARTING, **kwargs):
+        ticket = FakeTicket(hackathon=hackathon,
+                            experiment=Mock(status=expr_status),
+                            template=Mock(),
+                            user=Mock(),
+                            status=status,
+                            create_time=get_now(),
+                            **kwargs)
+        ticket.save()
+        return ticket
+
+    def started_tickets(self):
+        return [c[1]["context"].ticket_id for c in self.queue.scheduler.add_once.call_args_list]
+
+    def test_enqueue_dedup(self):
+        hackathon, template, user = Mock(id="h1"), Mock(), Mock()
+
+        expr = self.queue.enqueue(hackathon, template, user)
+        # the ticket is admitted at once, but it's still the same start request
+        self.assertEqual(ADMISSION_STATUS.ADMITTED, FakeTicket.store[0].status)
+        self.assertIs(expr, self.queue.enqueue(hackathon, template, user))
+        self.assertEqual(1, len(FakeTicket.store))
+
+        self.queue.enqueue(hackathon, Mock(), user)
+        self.assertEqual(2, len(FakeTicket.store))
+
+    def test_dispatch_round_robin_within_budget(self):
+        self.config["max_starts"] = 3
+        h1, h2 = Mock(id="h1"), Mock(id="h2")
+        t1, t2, t3 = [self.add_ticket(h1) for _ in range(3)]
+        t4, t5 = [self.add_ticket(h2) for _ in range(2)]
+
+        self.queue.dispatch()
+        self.assertEqual([t1.id, t4.id, t2.id], self.started_tickets())
+
+        # admitted tickets still starting take the whole budget
+        self.queue.dispatch()
+        self.assertEqual(3, self.queue.scheduler.add_once.call_count)
+        self.assertEqual(ADMISSION_STATUS.QUEUED, t3.status)
+        self.assertEqual(ADMISSION_STATUS.QUEUED, t5.status)
+
+    def test_dispatch_host_capacity(self):
+        self.config["max_starts_per_host"] = 2
+        h1, h2 = Mock(id="h1"), Mock(id="h2")
+        d1, d2 = Mock(id="d1"), Mock(id="d2")
+        self.hosts["h1"] = [d1, d2]
+        self.add_ticket(h1, status=ADMISSION_STATUS.ADMITTED, admit_time=get_now(), host_server=d1)
+        t1, t2, t3, t4 = [self.add_ticket(h1) for _ in range(4)]
+        t5, t6 = [self.add_ticket(h2) for _ in range(2)]
+
+        self.queue.dispatch()
+
+        # 2 per host and one start in flight on d1, max_starts_per_hackathon for h2 without ready host
+        self.assertEqual([t1.id, t5.id, t2.id, t6.id, t3.id], self.started_tickets())
+        self.assertEqual([d2, d1, d2], [t1.host_server, t2.host_server, t3.host_server])
+        self.assertEqual(ADMISSION_STATUS.QUEUED, t4.status)
+        self.assertIsNone(t5.host_server)
+
+        # the slot of a host is free again once its start is done
+        t1.experiment.status = EStatus.RUNNING
+        self.queue.dispatch()
+        self.assertEqual(t4.id, self.started_tickets()[-1])
+        self.assertEqual(d2, t4.host_server)
+
+    def test_release_finished(self):
+        self.config["max_starts"] = 0
+        h1 = Mock(id="h1")
+        timed_out = self.add_ticket(h1, status=ADMISSION_STATUS.ADMITTED, admit_time=get_now() - timedelta(minutes=11))
+        starting = self.add_ticket(h1, status=ADMISSION_STATUS.ADMITTED, admit_time=get_now() - timedelta(minutes=9))
+        running = self.add_ticket(h1, status=ADMISSION_STATUS.ADMITTED, expr_status=EStatus.RUNNING,
+                                  admit_time=get_now())
+
+        self.queue.dispatch()
+
+        self.assertEqual(ADMISSION_STATUS.DONE, timed_out.status)
+        self.assertEqual(ADMISSION_STATUS.ADMITTED, starting.status)
+        self.assertEqual(ADMISSION_STATUS.DONE, running.status)
+
+    def test_dispatch_admits_once(self):
+        h1 = Mock(id="h1")
+        t1, t2 = self.add_ticket(h1), self.add_ticket(h1)
+
+        def admitted_by_other_process(ticket):
+            if ticket is t1:
+                ticket.status = ADMISSION_STATUS.ADMITTED
+                return True
+            return False
+
+        FakeTicket.race = staticmethod(admitted_by_other_process)
+        self.queue.dispatch()
+
+        self.assertEqual([t2.id], self.started_tickets())
+
+    def test_start_admitted_expr_not_starting(self):
+        ticket = self.add_ticket(Mock(id="h1"), status=ADMISSION_STATUS.ADMITTED, expr_status=EStatus.STOPPED)
+
+        self.queue.start_admitted_expr(Context(ticket_id=ticket.id))
+
+        self.assertFalse(self.queue.expr_manager.get_starter.called)
+        self.assertEqual(ADMISSION_STATUS.DONE, ticket.status)
+        self.assertEqual(EStatus.STOPPED, ticket.experiment.status)
+
+    def test_start_admitted_expr(self):
+        ticket = self.add_ticket(Mock(id="h1", event_end_time=None), status=ADMISSION_STATUS.ADMITTED)
+        starter = self.queue.expr_manager.get_starter.return_value
+
+        self.queue.start_admitted_expr(Context(ticket_id=ticket.id))
+
+        context = starter.start_expr.call_args[0][0]
+        self.assertIs(ticket.experiment, context.experiment)
+        self.assertNotIn("reserved_host_server_id", context)
+        self.assertEqual(ADMISSION_STATUS.ADMITTED, ticket.status)
+
+    def test_start_admitted_expr_on_reserved_host(self):
+        ticket = self.add_ticket(Mock(id="h1", event_end_time=None), status=ADMISSION_STATUS.ADMITTED,
+                                 host_server=Mock(id="d1"))
+        starter = self.queue.expr_manager.get_starter.return_value
+
+        self.queue.start_admitted_expr(Context(ticket_id=ticket.id))
+
+        self.assertEqual("d1", starter.start_expr.call_args[0][0].reserved_host_server_id)
+
+    def test_cancel_hackathon(self):
+        h1, h2 = Mock(id="h1"), Mock(id="h2")
+        queued = self.add_ticket(h1)
+        stopped = self.add_ticket(h1, status=ADMISSION_STATUS.ADMITTED, expr_status=EStatus.STOPPED,
+                                  admit_time=get_now())
+        other = self.add_ticket(h2)
+
+        with patch("hackathon.expr.admission_queue.Experiment") as experiment_model:
+            self.queue.cancel_hackathon(h1)
+
+        self.assertEqual(ADMISSION_STATUS.DONE, queued.status)
+        experiment_model.objects.assert_called_once_with(id=queued.experiment.id, status=EStatus.STARTING)
+        self.assertEqual(EStatus.FAILED,
+                         experiment_model.objects.return_value.update_one.call_args[1]["set__status"])
+        self.assertEqual(ADMISSION_STATUS.DONE, stopped.status)
+        self.assertEqual(ADMISSION_STATUS.QUEUED, other.status)
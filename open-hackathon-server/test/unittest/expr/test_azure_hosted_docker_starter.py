@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) Microsoft Open Technologies (Shanghai) Co. Ltd.  All rights reserved.
+
+The MIT License (MIT)
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import os
+import unittest
+from mock import Mock, patch
+
+# setup import path
+try:
+    import hackathon  # noqa
+except ImportError:
+    import sys
+    BASE_DIR = os.path.dirname(__file__)
+    sys.path.append(os.path.realpath(os.path.join(BASE_DIR, "..", "..", "..", "src")))
+
+from hackathon.expr.azure_hosted_docker_starter import AzureHostedDockerStarter, SUCCEEDED, IN_PROGRESS, \
+    MAX_TRIAL
+from hackathon.constants import DHS_QUERY_STATE, EStatus
+from hackathon import Context
+
+
+class AzureHostedDockerStarterTest(unittest.TestCase):
+    def setUp(self):
+        self.starter = AzureHostedDockerStarter()
+        self.batcher = Mock()
+        self.batcher.release.return_value = "r1"
+        self.registry = Mock()
+        self.vm_adapter = self.registry.get_adapter_by_key.return_value
+        self.vm_adapter.get_operation_status.return_value = Mock(status=SUCCEEDED)
+        self.poller = Mock()
+        self.poller.is_enabled.return_value = True
+        self.docker = Mock()
+        self.docker.stop_container.return_value = Mock(status_code=204)
+        self.starter.__dict__.update(azure_endpoint_batcher=self.batcher,
+                                     azure_adapter_registry=self.registry,
+                                     azure_async_op_poller=self.poller,
+                                     scheduler=Mock(),
+                                     docker=self.docker)
+        self.starter.log = Mock()
+        self.starter.util = Mock()
+        self.starter.util.is_local.return_value = False
+
+        for name in ["Experiment", "Hackathon", "AzureKey", "ExprAdmissionTicket"]:
+            patcher = patch("hackathon.expr.azure_hosted_docker_starter.%s" % name)
+            setattr(self, name, patcher.start())
+            self.addCleanup(patcher.stop)
+        self.Experiment.objects.return_value.count.return_value = 0
+        self.ExprAdmissionTicket.objects.return_value.count.return_value = 0
+
+    def test_bulk_stop_with_key_of_hackathon(self):
+        key = Mock()
+        self.Hackathon.objects.return_value.first.return_value = Mock(azure_keys=[key])
+        host_server = Mock(vm_name="vm", public_dns="cs.chinacloudapp.cn")
+        ves = []
+        for name, port in [("c1", 10001), ("c2", 10002)]:
+            container = Mock(host_server=host_server, port_bindings=[Mock(host_port=port)])
+            container.name = name
+            ves.append(Mock(docker_container=container))
+            ves[-1].name = "ve"
+        self.starter._on_virtual_environment_stopped = Mock()
+
+        context = Context(hackathon_id="h1", experiment_ids={"c1": "e1", "c2": "e2"})
+        stopped = self.starter.bulk_stop_virtual_environments(context, host_server, ves)
+
+        self.assertEqual(["c1", "c2"], stopped)
+        self.assertEqual([("e1", "ve"), ("e2", "ve")],
+                         [(c[0][0].experiment_id, c[0][0].virtual_environment_name)
+                          for c in self.starter._on_virtual_environment_stopped.call_args_list])
+        self.assertIs(key, self.registry.get_adapter_by_key.call_args[0][0])
+        # endpoints of all containers are released in one update, in turn with batches of assign
+        self.batcher.release.assert_called_once_with(self.vm_adapter, "cs", "vm", [10001, 10002])
+        # the update is watched by the poller instead of blocking the caller
+        self.assertFalse(self.vm_adapter.get_operation_status.called)
+        feature, method, ctx, request_id = self.poller.watch_operation.call_args[0]
+        self.assertEqual(("azure_docker", "on_bulk_release_done", "r1"), (feature, method, request_id))
+        self.assertEqual(key.subscription_id, ctx.subscription_id)
+        # there is no experiment in context to load key from
+        self.assertFalse([c for c in self.Experiment.objects.call_args_list if "id" in c[1]])
+
+    def test_queued_experiments_not_block_clearing_ports(self):
+        self.starter.host_ports = [10001]
+        # both starting experiments are still waiting in admission queue
+        self.Experiment.objects.return_value.count.return_value = 2
+        self.ExprAdmissionTicket.objects.return_value.count.return_value = 2
+
+        self.starter._AzureHostedDockerStarter__clear_ports_cache()
+        self.assertEqual([], self.starter.host_ports)
+
+        self.starter.host_ports = [10001]
+        self.ExprAdmissionTicket.objects.return_value.count.return_value = 1
+        self.starter._AzureHostedDockerStarter__clear_ports_cache()
+        self.assertEqual([10001], self.starter.host_ports)
+
+    def test_query_bulk_release_status_bounded(self):
+        self.vm_adapter.get_operation_status.return_value = Mock(status=IN_PROGRESS)
+        context = Context(hackathon_id="h1", azure_key_id="k1", request_id="r1", virtual_machine_name="vm", trial=0)
+        self.AzureKey.objects.return_value.first.return_value = Mock()
+
+        for i in range(MAX_TRIAL):
+            self.starter.query_bulk_release_status(context)
+
+        self.assertEqual(MAX_TRIAL - 1, self.starter.scheduler.add_once.call_count)
+        self.assertEqual(IN_PROGRESS, context.async_op_status)
+        self.assertTrue(self.starter.log.error.called)
+
+    def test_bulk_stop_container_failed(self):
+        host_server = Mock(vm_name="vm", public_dns="cs.chinacloudapp.cn")
+        self.starter.util.is_local.return_value = True
+        self.docker.stop_container.side_effect = lambda host, name: Mock(status_code=204 if name == "c1" else 500)
+        ves = []
+        for name in ["c1", "c2"]:
+            container = Mock(host_server=host_server, port_bindings=[])
+            container.name = name
+            ves.append(Mock(docker_container=container))
+        self.starter._on_virtual_environment_stopped = Mock()
+
+        context = Context(hackathon_id="h1", experiment_ids={"c1": "e1", "c2": "e2"})
+        self.assertEqual(["c1"], self.starter.bulk_stop_virtual_environments(context, host_server, ves))
+
+        # the experiment whose container is still there is left running
+        self.assertEqual(1, self.starter._on_virtual_environment_stopped.call_count)
+        self.assertEqual("e1", self.starter._on_virtual_environment_stopped.call_args[0][0].experiment_id)
+
+    @patch("hackathon.expr.expr_starter.Experiment")
+    def test_get_docker_host_server_reserved(self, experiment_model):
+        host_manager = Mock()
+        host_manager.get_available_docker_host.return_value = Mock(state=DHS_QUERY_STATE.ONGOING)
+        self.starter.__dict__.update(docker_host_manager=host_manager)
+
+        self.starter.get_docker_host_server(Context(hackathon_id="h1", experiment_id="e1"))
+        self.assertIsNone(host_manager.get_available_docker_host.call_args[0][1])
+
+        # the host reserved by admission queue is asked for first
+        self.starter.get_docker_host_server(Context(hackathon_id="h1",
+                                                    experiment_id="e1",
+                                                    reserved_host_server_id="d1"))
+        self.assertEqual("d1", host_manager.get_available_docker_host.call_args[0][1])
+
+    @patch("hackathon.expr.expr_starter.Experiment")
+    def test_heartbeat_on_starting_steps(self, experiment_model):
+        host_manager = Mock()
+        host_manager.get_available_docker_host.return_value = Mock(state=DHS_QUERY_STATE.ONGOING)
+        self.starter.__dict__.update(docker_host_manager=host_manager)
+
+        self.starter.get_docker_host_server(Context(hackathon_id="h1", experiment_id="e1"))
+
+        # a slow start is kept alive for reconcile_starting_exprs
+        experiment_model.objects.assert_called_once_with(id="e1", status=EStatus.STARTING)
+        self.assertEqual(self.starter.util.get_now.return_value,
+                         experiment_model.objects.return_value.update_one.call_args[1]["set__update_time"])
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) Microsoft Open Technologies (Shanghai) Co. Ltd.  All rights reserved.
+
+The MIT License (MIT)
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import os
+import unittest
+from mock import Mock, patch
+from mongoengine import NotUniqueError
+
+# setup import path
+try:
+    import hackathon  # noqa
+except ImportError:
+    import sys
+    BASE_DIR = os.path.dirname(__file__)
+    sys.path.append(os.path.realpath(os.path.join(BASE_DIR, "..", "..", "..", "src")))
+
+from hackathon.expr.expr_mgr import ExprManager
+from hackathon.constants import EStatus, VEStatus, ADMISSION_STATUS
+from hackathon.util import get_now
+from hackathon import Context
+
+
+def virtual_environment(container_name, host_server):
+    container = Mock(host_server=host_server)
+    container.name = container_name
+    return Mock(status=VEStatus.RUNNING, docker_container=container)
+
+
+class ExprManagerTest(unittest.TestCase):
+    def setUp(self):
+        self.manager = ExprManager.__new__(ExprManager)
+        self.manager.__dict__["hosted_docker_proxy"] = Mock()
+        self.manager.__dict__["scheduler"] = Mock()
+        self.manager.__dict__["admission_queue"] = Mock()
+        self.manager.log = Mock()
+        self.manager.util = Mock()
+        self.manager.util.safe_get_config.side_effect = lambda key, default: default
+        self.manager.util.get_now.return_value = get_now()
+        self.starter = Mock()
+        self.manager.get_starter = Mock(return_value=self.starter)
+
+        self.hackathon = Mock(id="h1")
+        self.hackathon.name = "hackathon"
+        self.exprs = {EStatus.RUNNING: [], EStatus.STARTING: []}
+        # ids of experiments whose heartbeat came in after they were queried
+        self.alive = []
+        for name in ["Experiment", "Hackathon", "DockerHostServer", "ExprAdmissionTicket", "TeardownJob"]:
+            patcher = patch("hackathon.expr.expr_mgr.%s" % name)
+            setattr(self, name, patcher.start())
+            self.addCleanup(patcher.stop)
+        self.Hackathon.objects.return_value.first.return_value = self.hackathon
+        self.Experiment.objects.side_effect = self.query_experiments
+
+    def query_experiments(self, **kwargs):
+        exprs = self.exprs[kwargs["status"]]
+        query = Mock()
+        query.__iter__ = Mock(return_value=iter(exprs))
+        query.count.return_value = len(exprs)
+        query.update_one.return_value = int(kwargs.get("id") not in self.alive)
+        return query
+
+    def test_teardown_hackathon(self):
+        host = Mock(id="host1")
+        ves = [virtual_environment("c1", host), virtual_environment("c2", host)]
+        self.exprs[EStatus.RUNNING] = [
+            Mock(id="e1", status=EStatus.RUNNING, azure_key=None, virtual_environments=[ves[0]]),
+            Mock(id="e2", status=EStatus.RUNNING, azure_key=Mock(id="k1"), virtual_environments=[ves[1]])]
+        self.starter.bulk_stop_virtual_environments.return_value = ["c1"]
+
+        self.manager.teardown_hackathon(Context(hackathon_id="h1"))
+
+        context, host_server, stopped_ves = self.starter.bulk_stop_virtual_environments.call_args[0]
+        # one call per host with the azure key of experiment, not per experiment
+        self.assertEqual(1, self.starter.bulk_stop_virtual_environments.call_count)
+        self.assertEqual(("h1", "k1"), (context.hackathon_id, context.azure_key_id))
+        # the starter updates experiments of stopped containers
+        self.assertEqual({"c1": "e1", "c2": "e2"}, context.experiment_ids)
+        self.assertIs(host, host_server)
+        self.assertEqual(ves, stopped_ves)
+
+        self.manager.admission_queue.cancel_hackathon.assert_called_with(self.hackathon)
+        # progress is saved in db for polls handled by other processes
+        updates = [c[1] for c in self.TeardownJob.objects.return_value.update_one.call_args_list]
+        self.assertEqual((1, 2), (updates[0]["set__hosts"], updates[0]["set__total"]))
+        self.assertEqual((1, 1, 1), (updates[1]["inc__hosts_done"], updates[1]["inc__stopped"],
+                                     updates[1]["inc__failed"]))
+        self.assertEqual("finished", updates[-1]["set__status"])
+        self.assertFalse(self.manager.scheduler.add_once.called)
+
+    def test_teardown_hackathon_running_elsewhere(self):
+        self.TeardownJob.objects.return_value.modify.side_effect = NotUniqueError()
+
+        self.manager.teardown_hackathon(Context(hackathon_id="h1"))
+
+        self.assertFalse(self.manager.get_starter.called)
+        self.assertFalse(self.TeardownJob.objects.return_value.update_one.called)
+
+    def test_get_teardown_progress(self):
+        self.manager.util.make_serializable.side_effect = lambda d: d
+        self.TeardownJob.objects.return_value.first.return_value = Mock(status="running", total=10, stopped=4,
+                                                                        failed=1)
+
+        progress = self.manager.get_teardown_progress(self.hackathon)
+
+        self.assertEqual("hackathon", progress["hackathon_name"])
+        self.assertEqual(("running", 10, 4, 1), (progress["job"]["status"], progress["job"]["total"],
+                                                 progress["job"]["stopped"], progress["job"]["failed"]))
+        self.TeardownJob.objects.assert_called_with(hackathon=self.hackathon)
+
+    def test_reconcile_skips_queued_experiments(self):
+        queued, lost = Mock(id="e1"), Mock(id="e2")
+        self.exprs[EStatus.STARTING] = [queued, lost]
+        # e1 is still waiting in admission queue
+        self.ExprAdmissionTicket.objects.side_effect = lambda experiment, status__in: \
+            Mock(count=Mock(return_value=int(experiment is queued and ADMISSION_STATUS.QUEUED in status__in)))
+
+        self.manager.reconcile_starting_exprs()
+
+        context = self.starter.stop_expr.call_args[0][0]
+        self.assertEqual("e2", context.experiment_id)
+        self.assertEqual(1, self.starter.stop_expr.call_count)
+        self.assertEqual(["e2"], [c[1]["id"] for c in self.Experiment.objects.call_args_list if "id" in c[1]])
+
+    def test_reconcile_skips_experiments_with_heartbeat(self):
+        self.exprs[EStatus.STARTING] = [Mock(id="e1"), Mock(id="e2")]
+        self.ExprAdmissionTicket.objects.return_value.count.return_value = 0
+        # e1 refreshed update time after the query
+        self.alive = ["e1"]
+
+        self.manager.reconcile_starting_exprs()
+
+        self.assertEqual(["e2"], [c[0][0].experiment_id for c in self.starter.stop_expr.call_args_list])
+        deadline = self.Experiment.objects.call_args_list[0][1]["update_time__lt"]
+        self.Experiment.objects.assert_any_call(id="e1", status=EStatus.STARTING, update_time__lt=deadline)
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) Microsoft Open Technologies (Shanghai) Co. Ltd.  All rights reserved.
+
+The MIT License (MIT)
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import os
+import unittest
+from mock import Mock, patch
+
+# setup import path
+try:
+    import hackathon  # noqa
+except ImportError:
+    import sys
+    BASE_DIR = os.path.dirname(__file__)
+    sys.path.append(os.path.realpath(os.path.join(BASE_DIR, "..", "..", "..", "src")))
+
+from hackathon.hack.admin_manager import AdminManager
+from hackathon.constants import HACK_USER_TYPE
+
+
+class FakeCache(object):
+    def __init__(self):
+        self.values = {}
+
+    def get_cache(self, key, createfunc):
+        if key not in self.values:
+            self.values[key] = createfunc()
+        return self.values[key]
+
+    def invalidate(self, key):
+        self.values.pop(key, None)
+
+
+class AdminRolesTest(unittest.TestCase):
+    def setUp(self):
+        self.manager = AdminManager.__new__(AdminManager)
+        self.manager.__dict__["cache"] = FakeCache()
+        self.manager.util = Mock()
+
+        patcher = patch("hackathon.hack.admin_manager.User")
+        self.user_model = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user_model.objects.return_value.only.return_value.first.return_value = Mock(is_super=False)
+
+        patcher = patch("hackathon.hack.admin_manager.UserHackathon")
+        self.rel_model = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.rels = self.rel_model.objects.return_value.only.return_value.no_dereference
+        self.rels.return_value = [Mock(hackathon=Mock(id="h1"), role=HACK_USER_TYPE.ADMIN),
+                                  Mock(hackathon=Mock(id="h2"), role=HACK_USER_TYPE.JUDGE)]
+
+    def test_roles_loaded_once(self):
+        self.assertTrue(self.manager.is_hackathon_admin("h1", "u1"))
+        self.assertFalse(self.manager.is_hackathon_admin("h2", "u1"))
+        self.assertFalse(self.manager.is_hackathon_admin("h3", "u1"))
+
+        self.assertEqual(1, self.user_model.objects.call_count)
+        self.assertEqual(1, self.rels.call_count)
+
+    def test_super_admin(self):
+        self.user_model.objects.return_value.only.return_value.first.return_value = Mock(is_super=True)
+        self.assertTrue(self.manager.is_hackathon_admin("h3", "u1"))
+
+    def test_update_admin_invalidates(self):
+        self.assertFalse(self.manager.is_hackathon_admin("h2", "u1"))
+        self.rel_model.objects.return_value.first.return_value = Mock(user=Mock(id="u1"))
+        self.rels.return_value = [Mock(hackathon=Mock(id="h2"), role=HACK_USER_TYPE.ADMIN)]
+
+        self.manager.update_admin({"id": "rel1", "role": HACK_USER_TYPE.ADMIN})
+
+        self.assertTrue(self.manager.is_hackathon_admin("h2", "u1"))
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) Microsoft Open Technologies (Shanghai) Co. Ltd.  All rights reserved.
+
+The MIT License (MIT)
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import unittest
+from datetime import datetime, timedelta
+from mock import Mock, patch
+
+# setup import path
+try:
+    import hackathon  # noqa
+except ImportError:
+    import os
+    import sys
+    BASE_DIR = os.path.dirname(__file__)
+    sys.path.append(os.path.realpath(os.path.join(BASE_DIR, "..", "..", "..", "src")))
+
+from hackathon.hack.docker_host_autoscaler import DockerHostAutoscaler
+from hackathon.constants import HACK_STATUS, DockerHostServerStatus
+
+NOW = datetime(2016, 6, 1, 12, 0, 0)
+CONFIG = {
+    "dockerhostserver.vm.container_max_count": 50,
+    "dockerhostserver.autoscale.headroom_ratio": 0.2,
+    "dockerhostserver.autoscale.headroom_slots": 5,
+    "dockerhostserver.autoscale.participation_ratio": 0.5,
+    "dockerhostserver.autoscale.lead_minutes": 60,
+    "dockerhostserver.autoscale.max_hosts": 3,
+    "dockerhostserver.autoscale.max_provisioning": 2,
+}
+
+
+class StubProvisioner(object):
+    """Stands for the azure side of docker host manager"""
+
+    def __init__(self, succeed=True):
+        self.succeed = succeed
+        self.provisioned = []
+        self.decommissioned = []
+
+    def provision_docker_host_vm(self, hackathon):
+        self.provisioned.append(hackathon)
+        return self.succeed
+
+    def decommission_docker_host_vm(self, host_server):
+        self.decommissioned.append(host_server)
+        return self.succeed
+
+
+def metrics(**kwargs):
+    m = {
+        "hosts": 0,
+        "ready_hosts": 0,
+        "booting_hosts": 0,
+        "capacity": 0,
+        "used": 0,
+        "starting": 0,
+        "registered": 0,
+        "containers_per_expr": 1
+    }
+    m.update(kwargs)
+    return m
+
+
+@patch("hackathon.hack.docker_host_autoscaler.DockerHostScaleDecision")
+@patch("hackathon.hack.docker_host_autoscaler.DockerHostServer")
+class DockerHostAutoscalerTest(unittest.TestCase):
+    def setUp(self):
+        self.autoscaler = DockerHostAutoscaler()
+        self.autoscaler.log = Mock()
+        self.autoscaler.util = Mock()
+        self.autoscaler.util.get_now.return_value = NOW
+        self.autoscaler.util.safe_get_config.side_effect = lambda key, default: CONFIG.get(key, default)
+        self.provisioner = StubProvisioner()
+        self.autoscaler.provisioner = self.provisioner
+        self.autoscaler._DockerHostAutoscaler__expire_booting_hosts = Mock()
+
+        self.hackathon = Mock()
+        self.hackathon.name = "test"
+        self.hackathon.status = HACK_STATUS.ONLINE
+        self.hackathon.event_start_time = NOW + timedelta(days=1)
+        self.hackathon.event_end_time = NOW + timedelta(days=2)
+
+    def evaluate(self, m):
+        self.autoscaler.collect_metrics = Mock(return_value=m)
+        return self.autoscaler.evaluate(self.hackathon)
+
+    def test_forecast(self, host_model, decision_model):
+        # far before event: only what's in use
+        self.assertEqual(0, self.autoscaler.forecast(self.hackathon, metrics(registered=100)))
+        self.assertEqual(17, self.autoscaler.forecast(self.hackathon, metrics(used=8, starting=2)))
+
+        # in lead time: registered competitors expected
+        self.hackathon.event_start_time = NOW + timedelta(minutes=30)
+        self.assertEqual(65, self.autoscaler.forecast(self.hackathon, metrics(registered=100)))
+
+        # event ended
+        self.hackathon.event_end_time = NOW - timedelta(minutes=1)
+        self.assertEqual(0, self.autoscaler.forecast(self.hackathon, metrics(used=10)))
+
+    def test_provision_ahead_of_event(self, host_model, decision_model):
+        self.hackathon.event_start_time = NOW + timedelta(minutes=30)
+        self.assertEqual("provision", self.evaluate(metrics(registered=150)))
+        # 95 slots short, 2 VMs of 50 slots
+        self.assertEqual(2, len(self.provisioner.provisioned))
+        self.assertEqual("provision", decision_model.call_args[1]["action"])
+
+    def test_provision_limits(self, host_model, decision_model):
+        self.hackathon.event_start_time = NOW + timedelta(minutes=30)
+        self.assertEqual("hold", self.evaluate(metrics(registered=300, hosts=2, booting_hosts=2, capacity=100)))
+        self.assertEqual("provision", self.evaluate(metrics(registered=500, hosts=2, booting_hosts=0, capacity=100)))
+        self.assertEqual(1, len(self.provisioner.provisioned))
+
+    def test_provision_failed(self, host_model, decision_model):
+        self.provisioner.succeed = False
+        self.assertEqual("hold", self.evaluate(metrics(used=10, capacity=10)))
+        self.assertEqual("failed", decision_model.call_args[1]["action"])
+
+    def test_hold(self, host_model, decision_model):
+        self.assertEqual("hold", self.evaluate(metrics(used=10, capacity=17)))
+        self.assertEqual(0, len(self.provisioner.provisioned))
+
+    def test_decommission_idle_host(self, host_model, decision_model):
+        self.hackathon.event_end_time = NOW - timedelta(hours=1)
+        decision_model.objects.return_value.order_by.return_value.first.return_value = None
+        idle = Mock(container_max_count=50, vm_name="idle")
+        host_model.objects.return_value = [idle]
+
+        self.assertEqual("decommission", self.evaluate(metrics(hosts=1, ready_hosts=1, capacity=50)))
+        self.assertEqual([idle], self.provisioner.decommissioned)
+        self.assertTrue(idle.disabled)
+
+    def test_decommission_in_cooldown(self, host_model, decision_model):
+        self.hackathon.event_end_time = NOW - timedelta(hours=1)
+        decision_model.objects.return_value.order_by.return_value.first.return_value = \
+            Mock(create_time=NOW - timedelta(minutes=5))
+        host_model.objects.return_value = [Mock(container_max_count=50)]
+
+        self.assertEqual("hold", self.evaluate(metrics(hosts=1, ready_hosts=1, capacity=50)))
+        self.assertEqual(0, len(self.provisioner.decommissioned))
+
+    def test_expire_booting_hosts(self, host_model, decision_model):
+        del self.autoscaler._DockerHostAutoscaler__expire_booting_hosts
+        booting = Mock(vm_name="booting", state=DockerHostServerStatus.STARTING, disabled=False)
+        left = Mock(vm_name="left", state=DockerHostServerStatus.UNAVAILABLE, disabled=True)
+        host_model.objects.side_effect = lambda **kwargs: [booting] if "state__in" in kwargs else [booting, left]
+
+        self.autoscaler._DockerHostAutoscaler__expire_booting_hosts(self.hackathon)
+
+        self.assertEqual(DockerHostServerStatus.UNAVAILABLE, booting.state)
+        self.assertTrue(booting.disabled)
+        # the VM failed to delete last time is retried
+        self.assertEqual([booting, left], self.provisioner.decommissioned)
+        host_model.objects.assert_called_with(hackathon=self.hackathon, is_auto=True, disabled=True,
+                                              state=DockerHostServerStatus.UNAVAILABLE)
+        self.assertEqual(["timeout", "decommission", "decommission"],
+                         [c[1]["action"] for c in decision_model.call_args_list])
+
+    def test_expire_booting_hosts_delete_failed(self, host_model, decision_model):
+        del self.autoscaler._DockerHostAutoscaler__expire_booting_hosts
+        self.provisioner.succeed = False
+        left = Mock(vm_name="left", state=DockerHostServerStatus.UNAVAILABLE, disabled=True)
+        host_model.objects.side_effect = lambda **kwargs: [] if "state__in" in kwargs else [left]
+
+        self.autoscaler._DockerHostAutoscaler__expire_booting_hosts(self.hackathon)
+
+        self.assertEqual([left], self.provisioner.decommissioned)
+        self.assertEqual("failed", decision_model.call_args[1]["action"])
+        self.assertFalse(left.delete.called)
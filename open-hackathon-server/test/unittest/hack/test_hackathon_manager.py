@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) Microsoft Open Technologies (Shanghai) Co. Ltd.  All rights reserved.
+
+The MIT License (MIT)
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import os
+import unittest
+from mock import Mock, patch
+
+# setup import path
+try:
+    import hackathon  # noqa
+except ImportError:
+    import sys
+    BASE_DIR = os.path.dirname(__file__)
+    sys.path.append(os.path.realpath(os.path.join(BASE_DIR, "..", "..", "..", "src")))
+
+from hackathon.hack.hackathon_manager import HackathonManager
+
+
+class FakeCache(object):
+    def __init__(self):
+        self.values = {}
+
+    def get_cache(self, key, createfunc):
+        if key not in self.values:
+            self.values[key] = createfunc()
+        return self.values[key]
+
+    def invalidate(self, key):
+        self.values.pop(key, None)
+
+
+class HackathonRegistryTest(unittest.TestCase):
+    def setUp(self):
+        self.manager = HackathonManager.__new__(HackathonManager)
+        self.manager.__dict__["cache"] = FakeCache()
+
+        patcher = patch("hackathon.hack.hackathon_manager.Hackathon")
+        self.model = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.model.objects.return_value.only.return_value.first.return_value = Mock(id="h1")
+        self.data = {"_id": "h1", "name": "hack", "config": {}}
+        self.model.objects.return_value.first.return_value.to_mongo.return_value.to_dict.return_value = self.data
+
+    def test_get_by_name_from_cache(self):
+        for _ in range(3):
+            self.assertEqual(self.model._from_son.return_value, self.manager.get_hackathon_by_name("hack"))
+
+        # one query for id by name and one for the document
+        self.assertEqual(2, self.model.objects.call_count)
+        self.model._from_son.assert_called_with(self.data)
+        self.assertEqual(3, self.model._from_son.call_count)
+
+    def test_invalidate(self):
+        self.manager.get_hackathon_by_id("h1")
+        self.manager.invalidate_hackathon("h1")
+        self.manager.get_hackathon_by_id("h1")
+
+        self.assertEqual(2, self.model.objects.call_count)
+
+    def test_not_found(self):
+        self.model.objects.return_value.only.return_value.first.return_value = None
+
+        self.assertIsNone(self.manager.get_hackathon_by_name("missing"))
+        self.assertIsNone(self.manager.get_hackathon_by_name(None))
+        self.assertFalse(self.model._from_son.called)
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) Microsoft Open Technologies (Shanghai) Co. Ltd.  All rights reserved.
+
+The MIT License (MIT)
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import os
+import unittest
+from cStringIO import StringIO
+from mock import Mock, patch
+from PIL import Image
+from werkzeug.datastructures import FileStorage
+
+# setup import path
+try:
+    import hackathon  # noqa
+except ImportError:
+    import sys
+    BASE_DIR = os.path.dirname(__file__)
+    sys.path.append(os.path.realpath(os.path.join(BASE_DIR, "..", "..", "..", "src")))
+
+from hackathon.hack.image_manager import ImageManager, TARGETS
+from hackathon.hmongo.models import ImageDerivative
+from hackathon.constants import IMAGE_TARGET, IMAGE_VARIANT
+from hackathon import Context
+
+AVATAR_URL = "http://localhost/static/upload/user_file/avatar.jpg"
+
+
+def image_bytes(size, mode="RGB", image_format="JPEG"):
+    out = StringIO()
+    Image.new(mode, size).save(out, image_format)
+    return out.getvalue()
+
+
+class ImageManagerTest(unittest.TestCase):
+    def setUp(self):
+        self.saved = {}
+        self.storage = Mock()
+        self.storage.save.side_effect = self.storage_save
+
+        self.manager = ImageManager.__new__(ImageManager)
+        self.manager.__dict__["storage"] = self.storage
+        self.manager.__dict__["scheduler"] = Mock()
+        self.manager.log = Mock()
+        self.manager.util = Mock()
+        self.manager.util.safe_get_config.side_effect = lambda key, default: default
+
+        self.user_model = Mock()
+        user_target = (self.user_model,) + TARGETS[IMAGE_TARGET.USER_AVATAR][1:]
+        patcher = patch.dict(TARGETS, {IMAGE_TARGET.USER_AVATAR: user_target})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def storage_save(self, context):
+        # storages read streams only if wrapped in FileStorage or a real file
+        self.assertIsInstance(context.content, FileStorage)
+        url = "http://localhost/static/upload/hack_image/%s" % context.file_name
+        self.saved[url] = Image.open(StringIO(context.content.read()))
+        context.url = url
+        return context
+
+    def generate(self, data):
+        self.storage.open_stream.return_value = [data[:100], data[100:]]
+        self.manager.generate_derivatives(Context(target=IMAGE_TARGET.USER_AVATAR, doc_id="u1", url=AVATAR_URL))
+
+    def test_generate_avatar_thumbnail(self):
+        previous = Mock()
+        previous.profile.avatar_derivative = ImageDerivative(url="old", variants={"thumbnail": "old_thumbnail"})
+        self.user_model.objects.return_value.modify.return_value = previous
+
+        self.generate(image_bytes((800, 600)))
+
+        self.assertEqual(1, len(self.saved))
+        url, image = self.saved.items()[0]
+        self.assertEqual((128, 128), image.size)
+        self.assertEqual("JPEG", image.format)
+        self.assertTrue(url.endswith("avatar_thumbnail.jpg"))
+
+        self.user_model.objects.assert_called_once_with(id="u1", profile__avatar_url=AVATAR_URL)
+        derivative = self.user_model.objects.return_value.modify.call_args[1]["set__profile__avatar_derivative"]
+        self.assertEqual(AVATAR_URL, derivative.url)
+        self.assertEqual({IMAGE_VARIANT.THUMBNAIL: url}, derivative.variants)
+        # the replaced derivative is deleted
+        self.storage.delete.assert_called_once_with("old_thumbnail")
+
+    def test_small_image_not_enlarged(self):
+        self.user_model.objects.return_value.modify.return_value = Mock(profile=Mock(avatar_derivative=None))
+
+        self.generate(image_bytes((64, 32), "RGBA", "PNG"))
+
+        image = self.saved.values()[0]
+        self.assertEqual((32, 32), image.size)
+        self.assertEqual("PNG", image.format)
+
+    def test_discard_if_avatar_changed(self):
+        self.user_model.objects.return_value.modify.return_value = None
+
+        self.generate(image_bytes((800, 600)))
+
+        self.storage.delete.assert_called_once_with(self.saved.keys()[0])
+
+    def test_skip_image_not_in_storage(self):
+        self.storage.open_stream.side_effect = Exception("file not found")
+
+        self.manager.generate_derivatives(Context(target=IMAGE_TARGET.USER_AVATAR, doc_id="u1", url=AVATAR_URL))
+
+        self.storage.save.assert_not_called()
+        self.user_model.objects.assert_not_called()
+
+    def test_get_variant_url(self):
+        derivative = ImageDerivative(url=AVATAR_URL, variants={IMAGE_VARIANT.THUMBNAIL: "thumbnail_url"})
+
+        self.assertEqual("thumbnail_url", self.manager.get_variant_url(derivative, AVATAR_URL, IMAGE_VARIANT.THUMBNAIL))
+        self.assertEqual(AVATAR_URL, self.manager.get_variant_url(derivative, AVATAR_URL, IMAGE_VARIANT.CARD))
+        # derivative of an old image
+        self.assertEqual("new_url", self.manager.get_variant_url(derivative, "new_url", IMAGE_VARIANT.THUMBNAIL))
+        self.assertEqual(AVATAR_URL, self.manager.get_variant_url(None, AVATAR_URL, IMAGE_VARIANT.THUMBNAIL))
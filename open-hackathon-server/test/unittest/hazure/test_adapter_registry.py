@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) Microsoft Open Technologies (Shanghai) Co. Ltd.  All rights reserved.
+
+The MIT License (MIT)
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import unittest
+from mock import Mock
+
+# setup import path
+try:
+    import hackathon  # noqa
+except ImportError:
+    import os
+    import sys
+    BASE_DIR = os.path.dirname(__file__)
+    sys.path.append(os.path.realpath(os.path.join(BASE_DIR, "..", "..", "..", "src")))
+
+from hackathon.hazure.adapter_registry import AzureAdapterRegistry
+
+
+class FakeAdapter(object):
+    def __init__(self, subscription_id, cert_url, host=None, request_session=None):
+        self.subscription_id = subscription_id
+        self.cert_url = cert_url
+        self.host = host
+        self.request_session = request_session
+
+
+class OtherFakeAdapter(FakeAdapter):
+    pass
+
+
+def azure_key(subscription_id="sub", pem_url="https://storage/sub.pem"):
+    key = Mock()
+    key.subscription_id = subscription_id
+    key.management_host = "management.core.windows.net"
+    key.pem_url = pem_url
+    key.get_local_pem_url.return_value = "/certs/%s.pem" % subscription_id
+    return key
+
+
+class AzureAdapterRegistryTest(unittest.TestCase):
+    def setUp(self):
+        AzureAdapterRegistry.entries = {}
+        AzureAdapterRegistry.api_calls = {}
+        self.registry = AzureAdapterRegistry()
+        self.registry.log = Mock()
+        self.registry.util = Mock()
+        self.registry.util.safe_get_config.side_effect = lambda key, default: default
+
+    def test_adapter_cached_per_subscription(self):
+        key = azure_key()
+        adapter = self.registry.get_adapter_by_key(key, FakeAdapter)
+        self.assertIs(adapter, self.registry.get_adapter_by_key(key, FakeAdapter))
+        self.assertEqual(1, key.get_local_pem_url.call_count)
+        self.assertEqual("/certs/sub.pem", adapter.cert_url)
+        self.assertEqual("/certs/sub.pem", adapter.request_session.cert)
+
+        # adapters of the same subscription share the connection pool
+        other = self.registry.get_adapter_by_key(key, OtherFakeAdapter)
+        self.assertIs(adapter.request_session, other.request_session)
+
+        # different subscription
+        self.assertIsNot(adapter, self.registry.get_adapter_by_key(azure_key("sub2"), FakeAdapter))
+
+        # the same local pem file reuses cache too
+        self.assertIs(adapter, self.registry.get_adapter(FakeAdapter, "sub", "/certs/sub.pem", key.management_host))
+
+    def test_invalidate(self):
+        key = azure_key()
+        adapter = self.registry.get_adapter_by_key(key, FakeAdapter)
+        self.registry.invalidate("sub")
+        self.assertIsNot(adapter, self.registry.get_adapter_by_key(key, FakeAdapter))
+        self.assertEqual(2, key.get_local_pem_url.call_count)
+
+    def test_rebuild_on_pem_changed(self):
+        adapter = self.registry.get_adapter_by_key(azure_key(), FakeAdapter)
+        replaced = self.registry.get_adapter_by_key(azure_key(pem_url="https://storage/new.pem"), FakeAdapter)
+        self.assertIsNot(adapter, replaced)
+
+    def test_count_api_calls(self):
+        adapter = self.registry.get_adapter_by_key(azure_key(), FakeAdapter)
+        count_call = adapter.request_session.hooks["response"][0]
+        for status_code in [200, 200, 404, 503]:
+            count_call(Mock(status_code=status_code))
+
+        stats = self.registry.get_api_call_stats()["sub"]
+        self.assertEqual(4, stats["total"])
+        self.assertEqual(2, stats["errors"])
+        self.assertEqual(1, stats["throttled"])
+        self.assertEqual(4, stats["recent"])
+
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) Microsoft Open Technologies (Shanghai) Co. Ltd.  All rights reserved.
+
+The MIT License (MIT)
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import time
+import unittest
+from threading import Event
+from mock import Mock, patch
+
+# setup import path
+try:
+    import hackathon  # noqa
+except ImportError:
+    import os
+    import sys
+    BASE_DIR = os.path.dirname(__file__)
+    sys.path.append(os.path.realpath(os.path.join(BASE_DIR, "..", "..", "..", "src")))
+
+from hackathon.hazure.async_op_poller import AzureAsyncOpPoller
+from hackathon.hazure.constants import ASYNC_OP_RESULT
+from hackathon import Context
+
+CONFIG = {
+    "azure.async_poller.tick_seconds": 0.01,
+    "azure.async_poller.initial_interval_seconds": 0.01,
+    "azure.async_poller.max_interval_seconds": 0.05,
+    "azure.async_poller.max_polls_per_subscription": 2,
+}
+
+
+def operation_status(status, error=None):
+    res = Mock()
+    res.status = status
+    res.error = error
+    return res
+
+
+def sctx(experiment_id, subscription_id="sub"):
+    return Context(experiment_id=experiment_id,
+                   subscription_id=subscription_id,
+                   pem_url="/certs/%s.pem" % subscription_id,
+                   management_host="management.core.windows.net")
+
+
+class AzureAsyncOpPollerTest(unittest.TestCase):
+    def setUp(self):
+        self.poller = AzureAsyncOpPoller()
+        self.poller.log = Mock()
+        self.poller.util = Mock()
+        self.poller.util.safe_get_config.side_effect = lambda key, default: CONFIG.get(key, default)
+
+        # request_id: list of statuses returned in turn
+        self.statuses = {}
+        self.adapter = Mock()
+        self.adapter.get_operation_status.side_effect = lambda request_id: self.statuses[request_id].pop(0)
+        registry = Mock()
+        registry.get_adapter.return_value = self.adapter
+        patcher = patch("hackathon.hazure.async_op_poller.RequiredFeature", return_value=registry)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.executed = []
+        self.done = Event()
+        patcher = patch("hackathon.hazure.async_op_poller.scheduler_executor", side_effect=self.execute)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def execute(self, feature, method, context):
+        self.executed.append((method, context.experiment_id, context.get("async_op_status", None)))
+        if len(self.executed) >= self.expected:
+            self.done.set()
+
+    def wait_done(self, expected):
+        self.expected = expected
+        self.assertTrue(self.done.wait(5))
+        time.sleep(0.05)
+
+    def test_operation_succeeded_and_failed(self):
+        self.statuses["r1"] = [operation_status(ASYNC_OP_RESULT.IN_PROGRESS)] * 3 + \
+                              [operation_status(ASYNC_OP_RESULT.SUCCEEDED)]
+        self.statuses["r2"] = [operation_status("Failed", error=Mock(message="quota"))]
+
+        self.poller.watch_operation("azure_vm", "wait_for_add_virtual_machine", sctx("e1"), "r1")
+        self.poller.watch_operation("azure_vm", "wait_for_add_virtual_machine", sctx("e2"), "r2")
+        self.wait_done(2)
+
+        self.assertEqual(sorted([("wait_for_add_virtual_machine", "e1", ASYNC_OP_RESULT.SUCCEEDED),
+                                 ("wait_for_add_virtual_machine", "e2", "Failed")]),
+                         sorted(self.executed))
+        self.assertEqual(5, self.adapter.get_operation_status.call_count)
+        self.assertEqual([], self.poller.get_waits())
+
+    def test_polls_per_subscription_limited(self):
+        for i in range(5):
+            self.statuses["r%d" % i] = [operation_status(ASYNC_OP_RESULT.SUCCEEDED)]
+            self.poller.watch_operation("azure_vm", "wait_for_stop_virtual_machine", sctx("e%d" % i), "r%d" % i)
+        self.wait_done(5)
+
+        # every operation polled only once though at most 2 polls are sent each round
+        self.assertEqual(5, self.adapter.get_operation_status.call_count)
+
+    def test_state_wait_backoff(self):
+        poller = self.poller
+
+        def execute(feature, method, context):
+            self.executed.append(method)
+            if len(self.executed) < 4:
+                # not ready, watch again
+                poller.watch_state("azure_vm", method, context)
+            else:
+                self.done.set()
+
+        self.expected = 4
+        with patch("hackathon.hazure.async_op_poller.scheduler_executor", side_effect=execute):
+            poller.watch_state("azure_vm", "wait_for_virtual_machine_ready", sctx("e1"))
+            self.assertTrue(self.done.wait(5))
+            time.sleep(0.05)
+
+        self.assertEqual(4, len(self.executed))
+        self.adapter.get_operation_status.assert_not_called()
+        self.assertEqual([], poller.get_waits())
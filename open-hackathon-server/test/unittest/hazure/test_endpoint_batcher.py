@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) Microsoft Open Technologies (Shanghai) Co. Ltd.  All rights reserved.
+
+The MIT License (MIT)
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import unittest
+from threading import Thread
+from mock import Mock, patch
+
+# setup import path
+try:
+    import hackathon  # noqa
+except ImportError:
+    import os
+    import sys
+    BASE_DIR = os.path.dirname(__file__)
+    sys.path.append(os.path.realpath(os.path.join(BASE_DIR, "..", "..", "..", "src")))
+
+from hackathon.hazure.endpoint_batcher import AzureEndpointBatcher
+
+CONFIG = {
+    "azure.endpoint_batch.window_seconds": 0.2,
+    "azure.endpoint_batch.wait_timeout_seconds": 5,
+}
+
+
+class AzureEndpointBatcherTest(unittest.TestCase):
+    def setUp(self):
+        self.batcher = AzureEndpointBatcher()
+        self.batcher.log = Mock()
+        self.batcher.util = Mock()
+        self.batcher.util.safe_get_config.side_effect = lambda key, default: CONFIG.get(key, default)
+
+        self.vm_adapter = Mock()
+        self.vm_adapter.get_assigned_endpoints.return_value = [10000, 10001]
+        self.vm_adapter.update_virtual_machine_network_config.return_value = Mock(request_id="r1")
+
+        patcher = patch("hackathon.hazure.endpoint_batcher.add_endpoint_to_network_config")
+        self.add_endpoint = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def assign_concurrently(self, host_ports_list, vm_names=None):
+        results = {}
+        vm_names = vm_names or ["vm"] * len(host_ports_list)
+
+        def assign(index):
+            try:
+                results[index] = self.batcher.assign(self.vm_adapter, "cs", vm_names[index], host_ports_list[index])
+            except Exception as e:
+                results[index] = e
+
+        threads = [Thread(target=assign, args=(i,)) for i in range(len(host_ports_list))]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return results
+
+    def test_one_update_for_concurrent_starts(self):
+        results = self.assign_concurrently([[10000], [10000, 10002], [10003]])
+
+        self.assertEqual(1, self.vm_adapter.update_virtual_machine_network_config.call_count)
+        self.assertEqual(1, self.vm_adapter.get_assigned_endpoints.call_count)
+        public_ports = [port for public, request_id in results.values() for port in public]
+        self.assertEqual(4, len(set(public_ports)))
+        self.assertFalse(set(public_ports) & {10000, 10001})
+        self.assertEqual(1, len(results[0][0]))
+        self.assertEqual(2, len(results[1][0]))
+        self.assertTrue(all(request_id == "r1" for public, request_id in results.values()))
+
+    def test_batches_per_vm(self):
+        self.assign_concurrently([[10000], [10000]], vm_names=["vm1", "vm2"])
+        self.assertEqual(2, self.vm_adapter.update_virtual_machine_network_config.call_count)
+
+    def test_failure_returned_to_every_start(self):
+        self.vm_adapter.update_virtual_machine_network_config.side_effect = Exception("conflict")
+        results = self.assign_concurrently([[10000], [10002]])
+        self.assertTrue(all(isinstance(r, Exception) for r in results.values()))
+
+        # next batch waits for nothing since the failed update has no request id
+        self.vm_adapter.update_virtual_machine_network_config.side_effect = None
+        self.assertEqual(([10002], "r1"), self.batcher.assign(self.vm_adapter, "cs", "vm", [10000]))
+        self.vm_adapter.get_operation_status.assert_not_called()
+
+    @patch("hackathon.hazure.endpoint_batcher.delete_endpoint_from_network_config")
+    def test_release_after_previous_update(self, delete_endpoint):
+        self.batcher.assign(self.vm_adapter, "cs", "vm", [10000])
+        self.vm_adapter.get_operation_status.return_value = Mock(status="Succeeded")
+        self.vm_adapter.update_virtual_machine_network_config.return_value = Mock(request_id="r2")
+
+        self.assertEqual("r2", self.batcher.release(self.vm_adapter, "cs", "vm", [10000]))
+        self.vm_adapter.get_operation_status.assert_called_once_with("r1")
+        self.assertEqual([10000], delete_endpoint.call_args[0][1])
+        self.assertEqual("r2", self.batcher.last_request_ids[("cs", "vm")])
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) Microsoft Open Technologies (Shanghai) Co. Ltd.  All rights reserved.
+
+The MIT License (MIT)
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import os
+import hashlib
+import unittest
+from StringIO import StringIO
+from mock import Mock, patch
+from werkzeug.datastructures import FileStorage
+
+# setup import path
+try:
+    import hackathon  # noqa
+except ImportError:
+    import sys
+    BASE_DIR = os.path.dirname(__file__)
+    sys.path.append(os.path.realpath(os.path.join(BASE_DIR, "..", "..", "..", "src")))
+
+from hackathon.storage import dedup_storage
+from hackathon.storage.dedup_storage import DedupStorage
+from hackathon.hackathon_factory import factory
+from hackathon import Context
+
+
+class DedupStorageTest(unittest.TestCase):
+    def setUp(self):
+        self.backend = Mock()
+        self.backend.save.side_effect = self.backend_save
+        self.saved = []
+
+        self.storage = DedupStorage.__new__(DedupStorage)
+        self.storage.__dict__["backend"] = self.backend
+        self.storage.log = Mock()
+        self.storage.util = Mock()
+
+        patcher = patch("hackathon.storage.dedup_storage.StorageObject")
+        self.model = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def backend_save(self, context):
+        self.saved.append(context.content.read())
+        context.url = "http://localhost/static/upload/%d.zip" % len(self.saved)
+        context.physical_path = "/tmp/%d.zip" % len(self.saved)
+        return context
+
+    def save(self, data):
+        return self.storage.save(Context(file_name="work.zip",
+                                         file_type="team_file",
+                                         content=FileStorage(stream=StringIO(data), filename="work.zip")))
+
+    def test_save_new_content(self):
+        self.model.objects.return_value.modify.return_value = None
+
+        context = self.save("content")
+
+        self.assertEqual(["content"], self.saved)
+        self.assertEqual("http://localhost/static/upload/1.zip", context.url)
+        self.assertEqual(hashlib.sha256("content").hexdigest(), context.content_hash)
+        self.assertEqual(1, self.model.call_count)
+        self.assertEqual(context.content_hash, self.model.call_args[1]["content_hash"])
+        self.model.return_value.save.assert_called_once_with()
+
+    def test_save_duplicate_content(self):
+        existing = Mock(url="http://localhost/static/upload/old.zip", physical_path="/tmp/old.zip",
+                        content_hash=hashlib.sha256("content").hexdigest(), size=7)
+        self.model.objects.return_value.modify.return_value = existing
+
+        context = self.save("content")
+
+        self.assertEqual([], self.saved)
+        self.assertEqual(existing.url, context.url)
+        self.model.objects.assert_called_with(file_type="team_file", content_hash=existing.content_hash,
+                                              ref_count__gt=0)
+        self.model.objects.return_value.modify.assert_called_with(inc__ref_count=1, new=True)
+
+    def test_delete_referenced_file(self):
+        self.model.objects.return_value.modify.return_value = Mock(ref_count=1)
+
+        self.assertTrue(self.storage.delete("http://localhost/static/upload/1.zip"))
+        self.backend.delete.assert_not_called()
+
+    def test_delete_last_reference(self):
+        self.model.objects.return_value.modify.return_value = Mock(ref_count=0)
+        self.model.objects.return_value.delete.return_value = 1
+
+        self.storage.delete("http://localhost/static/upload/1.zip")
+        self.backend.delete.assert_called_once_with("http://localhost/static/upload/1.zip")
+
+    def test_delete_file_not_indexed(self):
+        self.model.objects.return_value.modify.return_value = None
+
+        self.storage.delete("http://localhost/static/upload/legacy.zip")
+        self.backend.delete.assert_called_once_with("http://localhost/static/upload/legacy.zip")
+
+    def test_import_with_dedup_disabled(self):
+        # 'storage_backend' is provided only if dedup enabled, defining the class must not look it up
+        with patch.dict(factory.providers):
+            factory.providers.pop("storage_backend", None)
+            reload(dedup_storage)
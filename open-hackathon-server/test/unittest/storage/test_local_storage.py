@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) Microsoft Open Technologies (Shanghai) Co. Ltd.  All rights reserved.
+
+The MIT License (MIT)
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import unittest
+from StringIO import StringIO
+from mock import Mock
+from werkzeug.datastructures import FileStorage
+from werkzeug.exceptions import NotFound
+
+# setup import path
+try:
+    import hackathon  # noqa
+except ImportError:
+    import sys
+    BASE_DIR = os.path.dirname(__file__)
+    sys.path.append(os.path.realpath(os.path.join(BASE_DIR, "..", "..", "..", "src")))
+
+from hackathon.storage.local_storage import LocalStorage
+from hackathon import Context
+
+CONFIG = {
+    "endpoint": "http://localhost:15000",
+    "storage.local.chunk_size": 10,
+}
+
+
+class LocalStorageTest(unittest.TestCase):
+    def setUp(self):
+        self.base_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.base_dir)
+
+        self.storage = LocalStorage.__new__(LocalStorage)
+        self.storage.base_dir = self.base_dir
+        self.storage.log = Mock()
+        self.storage.util = Mock()
+        self.storage.util.safe_get_config.side_effect = lambda key, default: CONFIG.get(key, default)
+        self.storage.util.get_config.side_effect = lambda key: CONFIG[key]
+
+    def save(self, content, file_name="work.zip"):
+        return self.storage.save(Context(file_name=file_name, file_type="team_file", content=content))
+
+    def test_save_stream(self):
+        data = "0123456789" * 10 + "tail"
+        stream = StringIO(data)
+        stream.read = Mock(side_effect=stream.read)
+        context = self.save(FileStorage(stream=stream, filename="work.zip"))
+
+        self.assertEqual(data, open(context.physical_path, "rb").read())
+        self.assertEqual(hashlib.sha256(data).hexdigest(), context.content_hash)
+        self.assertEqual(len(data), context.size)
+        # read in chunks, never the whole file at once
+        self.assertTrue(all(call[0] == (10,) for call in stream.read.call_args_list))
+        # no temp file left
+        self.assertEqual(["work.zip"], os.listdir(os.path.dirname(context.physical_path)))
+
+    def test_save_dict(self):
+        context = self.save({"name": "test"}, file_name="template.js")
+        self.assertEqual({"name": "test"}, json.load(open(context.physical_path)))
+        self.assertEqual(os.path.getsize(context.physical_path), context.size)
+
+    def test_send_file_outside_upload_dir(self):
+        self.assertRaises(NotFound, self.storage.send_file, "http://localhost:15000/static/upload/../../etc/passwd")
+        self.assertRaises(NotFound, self.storage.send_file, "http://localhost:15000/static/upload/not_exist.zip")
+
+    def test_send_file_by_accel_redirect(self):
+        context = self.save("content", file_name="readme.txt")
+        CONFIG["storage.local.accel_redirect_location"] = "/protected_upload/"
+        self.addCleanup(CONFIG.pop, "storage.local.accel_redirect_location")
+
+        response = self.storage.send_file(context.url)
+        relative = context.physical_path[len(os.path.realpath(self.base_dir + "/static/upload")):]
+        self.assertEqual("/protected_upload" + relative, response.headers["X-Accel-Redirect"])
+        self.assertEqual("text/plain", response.mimetype)
+        self.assertEqual("", response.get_data())
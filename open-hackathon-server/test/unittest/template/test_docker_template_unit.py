@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) Microsoft Open Technologies (Shanghai) Co. Ltd.  All rights reserved.
+
+The MIT License (MIT)
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import os
+import copy
+import unittest
+
+# setup import path
+try:
+    import hackathon  # noqa
+except ImportError:
+    import sys
+    BASE_DIR = os.path.dirname(__file__)
+    sys.path.append(os.path.realpath(os.path.join(BASE_DIR, "..", "..", "..", "src")))
+
+from hackathon.template.docker_template_unit import DockerTemplateUnit
+
+UNIT = {
+    "name": "web",
+    "type": "ubuntu terminal",
+    "provider": 0,
+    "Image": "ubuntu",
+    "Env": ["A=1", "B=2"],
+    "ports": [
+        {"name": "ssh", "port": 22, "public": True, "protocol": "tcp"},
+        {"name": "web", "port": 80, "public": True, "protocol": "tcp"}
+    ],
+    "remote": {"provider": "guacamole", "protocol": "ssh", "username": "root", "password": "root", "port": 22}
+}
+
+
+def assign_host_ports(unit, base):
+    ports = unit.get_ports()
+    for i, p in enumerate(ports):
+        p["host_port"] = base + i
+    unit.set_ports(ports)
+
+
+class DockerUnitPlanTest(unittest.TestCase):
+    def setUp(self):
+        self.plan = DockerTemplateUnit(copy.deepcopy(UNIT)).compile()
+
+    def test_same_container_config_as_template_unit(self):
+        unit = DockerTemplateUnit(copy.deepcopy(UNIT))
+        assign_host_ports(unit, 10000)
+        expected = unit.get_container_config()
+
+        instance = self.plan.instantiate("web-1")
+        assign_host_ports(instance, 10000)
+
+        self.assertEqual(expected, instance.get_container_config())
+        self.assertEqual("web-1", instance.get_name())
+        self.assertEqual("ubuntu:latest", instance.get_image_with_tag())
+        self.assertEqual({"A": "1", "B": "2"}, instance.get_instance_env_vars())
+
+    def test_instances_are_isolated(self):
+        first = self.plan.instantiate("web-1")
+        second = self.plan.instantiate("web-2")
+        assign_host_ports(first, 10000)
+        assign_host_ports(second, 20000)
+
+        first_config = first.get_container_config()
+        second_config = second.get_container_config()
+        self.assertEqual([{"HostIp": "", "HostPort": "10000"}], first_config["HostConfig"]["PortBindings"]["22/tcp"])
+        self.assertEqual([{"HostIp": "", "HostPort": "20000"}], second_config["HostConfig"]["PortBindings"]["22/tcp"])
+
+        # the plan is never changed
+        self.assertEqual("web", self.plan.get_name())
+        self.assertEqual({}, self.plan.container_config["HostConfig"]["PortBindings"])
+        self.assertTrue(all("host_port" not in p for p in self.plan.get_ports()))
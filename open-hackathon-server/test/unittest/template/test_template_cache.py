@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) Microsoft Open Technologies (Shanghai) Co. Ltd.  All rights reserved.
+
+The MIT License (MIT)
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import os
+import json
+import shutil
+import tempfile
+import unittest
+from mock import Mock, patch
+
+# setup import path
+try:
+    import hackathon  # noqa
+except ImportError:
+    import sys
+    BASE_DIR = os.path.dirname(__file__)
+    sys.path.append(os.path.realpath(os.path.join(BASE_DIR, "..", "..", "..", "src")))
+
+from hackathon.template.template_cache import TemplateFileCache
+
+CONTENT = {"name": "t1", "virtual_environments": []}
+
+
+def response(status_code, content=None, headers=None):
+    resp = Mock()
+    resp.status_code = status_code
+    resp.content = json.dumps(content) if content is not None else ""
+    resp.headers = headers or {}
+    if status_code >= 400:
+        resp.raise_for_status.side_effect = Exception("http error %d" % status_code)
+    return resp
+
+
+def template(version=1):
+    t = Mock(spec=["id", "name", "url", "version"])
+    t.id = "t1"
+    t.name = "t1"
+    t.url = "http://storage/templates/t1.js"
+    t.version = version
+    return t
+
+
+class TemplateFileCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir)
+
+        config = {"template.cache.dir": self.cache_dir}
+        self.cache = TemplateFileCache()
+        self.cache.log = Mock()
+        self.cache.util = Mock()
+        self.cache.util.safe_get_config.side_effect = lambda key, default: config.get(key, default)
+
+        patcher = patch("hackathon.template.template_cache.requests")
+        self.requests = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_revalidate_by_etag(self):
+        self.requests.get.return_value = response(200, CONTENT, {"ETag": '"e1"'})
+        self.assertEqual(CONTENT, self.cache.load(template()))
+        self.assertEqual({}, self.requests.get.call_args[1]["headers"])
+
+        self.requests.get.return_value = response(304)
+        self.assertEqual(CONTENT, self.cache.load(template()))
+        self.assertEqual({"If-None-Match": '"e1"'}, self.requests.get.call_args[1]["headers"])
+
+    def test_fall_back_to_local_copy(self):
+        self.requests.get.return_value = response(200, CONTENT, {"Last-Modified": "Mon, 19 Oct 2015 00:00:00 GMT"})
+        self.cache.load(template())
+
+        self.requests.get.side_effect = Exception("storage unavailable")
+        self.assertEqual(CONTENT, self.cache.load(template()))
+
+        self.requests.get.return_value = response(503)
+        self.requests.get.side_effect = None
+        self.assertEqual(CONTENT, self.cache.load(template()))
+
+    def test_new_version_replaces_old_copy(self):
+        self.requests.get.return_value = response(200, CONTENT, {"ETag": '"e1"'})
+        self.cache.load(template(1))
+
+        updated = dict(CONTENT, description="updated")
+        self.requests.get.return_value = response(200, updated, {"ETag": '"e2"'})
+        self.assertEqual(updated, self.cache.load(template(2)))
+        # no conditional request for a new version
+        self.assertEqual({}, self.requests.get.call_args[1]["headers"])
+        self.assertEqual(["t1-2.json", "t1-2.json.meta"], sorted(os.listdir(self.cache_dir)))
+
+    def test_invalidate(self):
+        self.requests.get.return_value = response(200, CONTENT)
+        self.cache.load(template())
+
+        self.cache.invalidate("t1")
+        self.assertEqual([], os.listdir(self.cache_dir))
+
+        self.requests.get.side_effect = Exception("storage unavailable")
+        self.assertIsNone(self.cache.load(template()))
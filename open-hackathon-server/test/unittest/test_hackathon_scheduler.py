@@ -0,0 +1,336 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) Microsoft Open Technologies (Shanghai) Co. Ltd.  All rights reserved.
+
+The MIT License (MIT)
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import os
+import time
+import unittest
+from datetime import datetime, timedelta
+from threading import Event
+from mock import Mock, MagicMock, patch
+from mongoengine import OperationError
+from pytz import utc
+
+# setup import path
+try:
+    import hackathon  # noqa
+except ImportError:
+    import sys
+    BASE_DIR = os.path.dirname(__file__)
+    sys.path.append(os.path.realpath(os.path.join(BASE_DIR, "..", "..", "src")))
+
+from hackathon import hackathon_scheduler
+from hackathon.hackathon_scheduler import DispatchTable, TimerWheel, HackathonScheduler, LeaderElection, \
+    LeaderJobStore, ExecutorPool, ExecutorRouter, RoutingExecutor, scheduler_executor, singleton_executor
+from hackathon.util import get_now
+
+
+class Target(object):
+    def __init__(self):
+        self.calls = []
+
+    def with_context(self, context):
+        self.calls.append(context)
+
+    def without_context(self):
+        self.calls.append(None)
+
+
+class DispatchTableTest(unittest.TestCase):
+    def setUp(self):
+        self.target = Target()
+        self.factory = Mock()
+        self.factory.__getitem__ = Mock(side_effect=lambda feature: {"target": self.target}[feature])
+        patcher = patch.object(hackathon_scheduler, "factory", self.factory)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch.object(hackathon_scheduler, "dispatch_table", DispatchTable())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_resolve_once(self):
+        table = DispatchTable()
+        self.assertEqual((self.target.with_context, True), table.resolve("target", "with_context"))
+        self.assertEqual((self.target.without_context, False), table.resolve("target", "without_context"))
+        table.resolve("target", "with_context")
+
+        self.assertEqual(2, self.factory.__getitem__.call_count)
+
+    def test_reject_unknown_target(self):
+        table = DispatchTable()
+        self.assertRaises(ValueError, table.resolve, "missing", "with_context")
+        self.assertRaises(ValueError, table.resolve, "target", "missing")
+        self.assertRaises(ValueError, table.resolve, "target", "calls")
+
+    def test_executor(self):
+        scheduler_executor("target", "with_context", "ctx")
+        scheduler_executor("target", "without_context", "ctx")
+        scheduler_executor("target", "with_context", "ctx2")
+
+        self.assertEqual(["ctx", None, "ctx2"], self.target.calls)
+        self.assertEqual(2, self.factory.__getitem__.call_count)
+
+
+class TimerWheelTest(unittest.TestCase):
+    def setUp(self):
+        self.executed = []
+        self.done = Event()
+
+        def execute(feature, method, context):
+            self.executed.append((method, time.time()))
+            self.done.set()
+
+        patcher = patch.object(hackathon_scheduler, "scheduler_executor", side_effect=execute)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.wheel = TimerWheel(tick_seconds=0.05, slots=4, workers=1)
+
+    def test_execute_when_due(self):
+        start = time.time()
+        # longer than the wheel, wait for a full round
+        self.wheel.add("j1", 0.3, "target", "with_context", "ctx")
+
+        self.assertTrue(self.done.wait(2))
+        self.assertEqual("with_context", self.executed[0][0])
+        self.assertTrue(self.executed[0][1] - start >= 0.25)
+        self.assertFalse(self.wheel.has("j1"))
+
+    def test_replace_and_remove(self):
+        self.wheel.add("j1", 0.1, "target", "with_context", "ctx")
+        self.wheel.add("j1", 0.1, "target", "without_context", "ctx")
+        self.assertRaises(hackathon_scheduler.ConflictingIdError, self.wheel.add, "j1", 0.1, "target", "x", "ctx",
+                          False)
+        self.wheel.add("j2", 0.1, "target", "with_context", "ctx")
+        self.assertTrue(self.wheel.remove("j2"))
+
+        self.assertTrue(self.done.wait(2))
+        time.sleep(0.2)
+        self.assertEqual(["without_context"], [method for method, t in self.executed])
+
+    def test_take_pending(self):
+        self.wheel.add("j1", 10, "target", "with_context", "ctx")
+
+        pending = self.wheel.take_pending()
+        self.assertEqual(["j1"], [job["id"] for job in pending])
+        self.assertFalse(self.wheel.has("j1"))
+
+
+class HackathonSchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.scheduler = HackathonScheduler.__new__(HackathonScheduler)
+        self.apscheduler = Mock()
+        self.apscheduler.get_job.return_value = None
+        self.wheel = Mock()
+        self.scheduler._HackathonScheduler__apscheduler = self.apscheduler
+        self.scheduler._HackathonScheduler__timer_wheel = self.wheel
+        patcher = patch.object(hackathon_scheduler, "dispatch_table", Mock())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_short_job_in_memory(self):
+        self.scheduler.add_once("target", "with_context", "ctx", id="j1", seconds=10)
+
+        self.assertEqual("j1", self.wheel.add.call_args[0][0])
+        self.assertFalse(self.apscheduler.add_job.called)
+
+    def test_long_or_durable_job_in_job_store(self):
+        self.scheduler.add_once("target", "with_context", "ctx", minutes=10)
+        self.scheduler.add_once("target", "with_context", "ctx", seconds=10, durable=True)
+        self.scheduler.add_once("target", "with_context", "ctx", run_date=get_now() + timedelta(hours=1))
+
+        self.assertEqual(3, self.apscheduler.add_job.call_count)
+        self.assertFalse(self.wheel.add.called)
+
+    def test_singleton_interval_job(self):
+        with patch.object(hackathon_scheduler, "leader_election", Mock()):
+            self.scheduler.add_interval("target", "with_context", "ctx", id="j1", minutes=1)
+            self.scheduler.add_interval("target", "with_context", "ctx", id="j2", singleton=False, minutes=1)
+
+        singleton, everywhere = [c[1] for c in self.apscheduler.add_job.call_args_list]
+        self.assertEqual("singleton", singleton["jobstore"])
+        self.assertIs(singleton_executor, self.apscheduler.add_job.call_args_list[0][0][0])
+        self.assertEqual("ohp", everywhere["jobstore"])
+        self.assertIs(scheduler_executor, self.apscheduler.add_job.call_args_list[1][0][0])
+
+
+class LeaderElectionTest(unittest.TestCase):
+    def setUp(self):
+        patcher = patch("hackathon.hmongo.models.SchedulerLease")
+        self.lease_model = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.modify = self.lease_model.objects.return_value.modify
+        self.election = LeaderElection(lease_seconds=10, heartbeat_seconds=2)
+
+    def test_acquire_and_renew(self):
+        self.election.on_elected = Mock()
+        self.modify.return_value = Mock(token=3)
+        self.election.heartbeat()
+        self.assertEqual(3, self.election.token)
+        self.assertTrue(self.election.is_leader())
+        self.election.on_elected.assert_called_once_with()
+
+        self.election.heartbeat()
+        self.assertEqual(dict(name="scheduler", holder=self.election.holder, token=3),
+                         self.lease_model.objects.call_args[1])
+        self.assertTrue(self.election.is_leader())
+
+    def test_lease_held_by_another(self):
+        self.modify.side_effect = OperationError("duplicate key")
+        self.election.heartbeat()
+        self.assertFalse(self.election.is_leader())
+
+    def test_leadership_lost(self):
+        self.election.token = 3
+        self.election.lease_until = time.time() + 8
+        self.modify.side_effect = [None, OperationError("duplicate key")]
+
+        self.election.heartbeat()
+        self.assertIsNone(self.election.token)
+        self.assertFalse(self.election.is_leader())
+
+    def test_fencing(self):
+        self.modify.return_value = Mock(token=3)
+        self.election.heartbeat()
+
+        # a newer leader has taken over while this one paused
+        self.lease_model.objects.return_value.count.return_value = 0
+        self.assertFalse(self.election.is_leader(verify=True))
+
+    def test_singleton_executor(self):
+        election = Mock()
+        executor = Mock()
+        with patch.object(hackathon_scheduler, "leader_election", election), \
+                patch.object(hackathon_scheduler, "scheduler_executor", executor):
+            election.is_leader.return_value = False
+            singleton_executor("target", "with_context", "ctx")
+            self.assertFalse(executor.called)
+
+            election.is_leader.return_value = True
+            singleton_executor("target", "with_context", "ctx")
+            executor.assert_called_once_with("target", "with_context", "ctx")
+
+
+class LeaderJobStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.store = Mock()
+        self.election = Mock()
+        self.leader_store = LeaderJobStore(self.store, self.election, poll_seconds=10)
+
+    def test_due_jobs_on_leader_only(self):
+        self.store.get_due_jobs.return_value = ["job"]
+        self.election.is_leader.return_value = False
+        self.assertEqual([], self.leader_store.get_due_jobs("now"))
+        self.assertIsNone(self.leader_store.get_next_run_time())
+
+        self.election.is_leader.return_value = True
+        self.assertEqual(["job"], self.leader_store.get_due_jobs("now"))
+
+        # shared with other processes
+        self.leader_store.add_job("job")
+        self.store.add_job.assert_called_once_with("job")
+
+    def test_poll_for_jobs_of_other_processes(self):
+        self.election.is_leader.return_value = True
+        now = datetime.now(utc)
+        self.store.get_next_run_time.return_value = now + timedelta(seconds=1)
+        self.assertEqual(now + timedelta(seconds=1), self.leader_store.get_next_run_time())
+
+        self.store.get_next_run_time.return_value = None
+        self.assertTrue(self.leader_store.get_next_run_time() <= datetime.now(utc) + timedelta(seconds=10))
+
+
+class ExecutorPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.pool = ExecutorPool("test", workers=1)
+        self.executed = []
+        self.release = Event()
+        # keep the only worker busy
+        blocked = Event()
+        self.pool.submit(0, lambda: blocked.set() or self.release.wait())
+        blocked.wait(2)
+
+    def test_priority(self):
+        done = Event()
+        self.pool.submit(0, self.executed.append, "low")
+        self.pool.submit(10, self.executed.append, "high")
+        self.pool.submit(0, self.executed.append, "low2")
+        self.pool.submit(-1, done.set)
+
+        stats = self.pool.get_stats()
+        self.assertEqual(4, stats["depth"])
+        self.assertEqual(1, stats["busy"])
+        self.assertTrue(stats["oldest_wait_ms"] >= 0)
+
+        self.release.set()
+        self.assertTrue(done.wait(2))
+        self.assertEqual(["high", "low", "low2"], self.executed)
+
+        stats = self.pool.get_stats()
+        self.assertEqual(0, stats["depth"])
+        self.assertEqual(5, stats["started"])
+        self.assertTrue(stats["max_lag_ms"] >= stats["avg_lag_ms"] >= 0)
+
+    def test_failed_job(self):
+        done = Event()
+        self.pool.submit(0, int, "not a number")
+        self.pool.submit(0, done.set)
+        self.release.set()
+
+        self.assertTrue(done.wait(2))
+        self.assertEqual(1, self.pool.get_stats()["failed"])
+
+
+class ExecutorRouterTest(unittest.TestCase):
+    def setUp(self):
+        self.router = ExecutorRouter({"provision": {"workers": 2}, "interactive": {"workers": 1}}, {
+            "azure_vm": {"executor": "provision"},
+            "azure_vm.query_vm_status": {"executor": "interactive", "priority": 10}
+        })
+
+    def test_route(self):
+        pool, priority = self.router.route("azure_vm", "setup_virtual_machine")
+        self.assertEqual(("provision", 0), (pool.name, priority))
+        pool, priority = self.router.route("azure_vm", "query_vm_status")
+        self.assertEqual(("interactive", 10), (pool.name, priority))
+        pool, priority = self.router.route("user_manager", "check_user")
+        self.assertEqual(("default", 0), (pool.name, priority))
+        self.assertEqual(["default", "interactive", "provision"], sorted(self.router.get_stats().keys()))
+
+    def test_reject_unknown_executor(self):
+        self.assertRaises(ValueError, ExecutorRouter, {}, {"azure_vm": {"executor": "provision"}})
+
+    def test_routing_executor(self):
+        router = Mock()
+        executor = RoutingExecutor(router)
+        scheduler = MagicMock()
+        executor.start(scheduler, "default")
+        job = Mock(id="j1", args=["azure_vm", "setup_virtual_machine", "ctx"], max_instances=1)
+
+        executor.submit_job(job, ["run_time"])
+        feature, method, fn, submitted_job, run_times = router.submit.call_args[0]
+        self.assertEqual(("azure_vm", "setup_virtual_machine"), (feature, method))
+
+        with patch.object(hackathon_scheduler, "run_job", return_value=["event"]):
+            fn(submitted_job, run_times)
+        scheduler._dispatch_event.assert_called_once_with("event")